@@ -1,20 +1,39 @@
-from datetime import timedelta
+from collections import defaultdict
 
 from django.utils.timezone import now
 
-from nuntius import app_settings
 from nuntius.admin import subscriber_class
-from nuntius.models import CampaignSentStatusType, AbstractSubscriber, CampaignSentEvent
+from nuntius.models import (
+    AbstractSubscriber,
+    BounceState,
+    CampaignSentEvent,
+    CampaignSentStatusType,
+)
 
-successful_sent = (CampaignSentStatusType.UNKNOWN, CampaignSentStatusType.OK)
+successful_sent = BounceState.SUCCESSFUL_RESULTS
 
 
-def update_subscriber(email, campaign_status):
+def update_subscriber(email, campaign_status, sent_event: CampaignSentEvent = None):
+    """Apply the consequences of the result of a sent event to its subscriber
+
+    :param email: the email address of the sent event
+    :type email: class:`str`
+    :param campaign_status: the new result of the sent event
+    :type campaign_status: class:`str`
+    :param sent_event: the sent event, already saved with its new result, defaults to a
+        sent event sent now
+    :type sent_event: class:`nuntius.models.CampaignSentEvent`
+    """
     statuses = {
         CampaignSentStatusType.BOUNCED: None,
         CampaignSentStatusType.UNSUBSCRIBED: AbstractSubscriber.STATUS_UNSUBSCRIBED,
         CampaignSentStatusType.COMPLAINED: AbstractSubscriber.STATUS_COMPLAINED,
     }
+    sent_at = sent_event.datetime if sent_event is not None else now()
+
+    if campaign_status in successful_sent:
+        BounceState.record_successes({email: sent_at})
+        return
 
     if campaign_status not in statuses:
         return
@@ -26,37 +45,63 @@ def update_subscriber(email, campaign_status):
         model_class.objects.set_subscriber_status(email, statuses.get(campaign_status))
         return
 
-    email_events = CampaignSentEvent.objects.filter(email=email)
-
-    # if first email sent is a bounce, we bounce forever
-    if not email_events.filter(result__in=successful_sent).exists():
+    bounce_state = BounceState.record_bounce(
+        email, sent_at, sent_event.pk if sent_event is not None else None
+    )
+    if bounce_state.should_bounce(now()):
         model_class.objects.set_subscriber_status(
             email, AbstractSubscriber.STATUS_BOUNCED
         )
-        return
 
-    max_bounce_duration_ago = now() - timedelta(
-        days=app_settings.BOUNCE_PARAMS["duration"]
-    )
 
-    recent_successful_sent = email_events.filter(
-        result__in=successful_sent, datetime__gt=max_bounce_duration_ago
-    ).exists()
-
-    # if there is at least a successful sending in `duration`, it is allowed up to `limit`
-    if (
-        recent_successful_sent
-        and email_events.filter(
-            result=CampaignSentStatusType.BOUNCED, datetime__gt=max_bounce_duration_ago
-        ).count()
-        <= app_settings.BOUNCE_PARAMS["limit"]
-    ):
-        return
+def set_subscribers_status(email_addresses, status):
+    """Change the status of several subscribers at once
+
+    The `set_subscribers_status` method of the subscriber manager is used if it exists,
+    and `set_subscriber_status` is called for each address otherwise.
+    """
+    manager = subscriber_class().objects
+    if hasattr(manager, "set_subscribers_status"):
+        manager.set_subscribers_status(email_addresses, status)
+    else:
+        for email in email_addresses:
+            manager.set_subscriber_status(email, status)
+
+
+def update_subscribers(results):
+    """Apply the consequences of the results of several sent events to their subscribers
+
+    Successful sendings are taken into account with a single update of the bounce
+    states, and subscriber statuses are changed with one call by status.
+
+    :param results: `(email, campaign_status, sent_event)` tuples, in the order in which
+        the sent events got their results
+    :type results: class:`list`
+    """
+    successes = {}
+    statuses = {}
+    for email, campaign_status, sent_event in results:
+        sent_at = sent_event.datetime if sent_event is not None else now()
+        if campaign_status in successful_sent:
+            successes[email] = max(successes.get(email, sent_at), sent_at)
+        elif campaign_status == CampaignSentStatusType.UNSUBSCRIBED:
+            statuses[email] = AbstractSubscriber.STATUS_UNSUBSCRIBED
+        elif campaign_status == CampaignSentStatusType.COMPLAINED:
+            statuses[email] = AbstractSubscriber.STATUS_COMPLAINED
+        elif campaign_status == CampaignSentStatusType.BOUNCED:
+            # successes of the same batch must be known to decide whether to bounce
+            BounceState.record_successes(successes)
+            successes = {}
+            bounce_state = BounceState.record_bounce(
+                email, sent_at, sent_event.pk if sent_event is not None else None
+            )
+            if bounce_state.should_bounce(now()):
+                statuses[email] = AbstractSubscriber.STATUS_BOUNCED
 
-    # it is also ok if we have at least a successful sending in last `consecutive` + 1
-    for sent_event in email_events[: app_settings.BOUNCE_PARAMS["consecutive"] + 1]:
-        if sent_event.result in successful_sent:
-            return
+    BounceState.record_successes(successes)
 
-    # in all other case, we bounce
-    model_class.objects.set_subscriber_status(email, AbstractSubscriber.STATUS_BOUNCED)
+    emails_by_status = defaultdict(list)
+    for email, status in statuses.items():
+        emails_by_status[status].append(email)
+    for status, emails in emails_by_status.items():
+        set_subscribers_status(emails, status)
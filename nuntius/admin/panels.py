@@ -1,8 +1,8 @@
 import json
 
+from django.apps import apps
 from django.contrib import admin
 
-from django.contrib.contenttypes.models import ContentType
 from django.http import HttpResponseBadRequest, HttpResponse, JsonResponse
 from django.shortcuts import redirect
 from django.template.response import TemplateResponse
@@ -16,14 +16,12 @@ from django.views.generic import CreateView
 from nuntius import app_settings
 from nuntius.models import Campaign, MosaicoImage, CampaignSentEvent
 from nuntius.utils.messages import build_image_absolute_uri
-from nuntius.views import subscriber_count_view, count_view
+from nuntius.utils.wakeup import notify_workers
+from nuntius.views import subscriber_count_view
 
 
 def subscriber_class():
-    model = app_settings.NUNTIUS_SUBSCRIBER_MODEL
-    return ContentType.objects.get(
-        app_label=model.split(".")[0], model=model.split(".")[1].lower()
-    ).model_class()
+    return apps.get_app_config("nuntius").subscriber_model
 
 
 class MosaicoImageUploadView(CreateView):
@@ -96,6 +94,7 @@ class CampaignAdmin(admin.ModelAdmin):
                     "first_sent",
                     "segment",
                     "segment_subscribers",
+                    "priority",
                     "status",
                     "send_button",
                 )
@@ -163,23 +162,19 @@ class CampaignAdmin(admin.ModelAdmin):
             original_campaign = Campaign.objects.get(id=original_pk)
             campaign.message_content_html = original_campaign.message_content_html
             campaign.message_mosaico_data = original_campaign.message_mosaico_data
+        elif change and "segment" in form.changed_data:
+            # subscribers of another segment must all be scanned
+            campaign.shards.all().delete()
 
-        return super().save_model(request, campaign, form, change)
+        super().save_model(request, campaign, form, change)
+        # the priority or the sending dates may have changed
+        notify_workers(app_settings.CAMPAIGN_TYPE_EMAIL)
 
-    def async_count(self, instance, name):
+    def stats_count(self, instance, name):
         if not instance or instance.id is None:
             return "-"
 
-        return mark_safe(
-            f"""
-            <span id="{name}-count-{instance.id}" 
-                  hx-get="{reverse(f"admin:nuntius_campaign_count", args=[instance.id, name])}" 
-                  hx-trigger="load"
-                  hx-swap="innerHTML">
-                  Chargement..
-            </span>
-        """
-        )
+        return instance.get_stats()[name]
 
     def segment_subscribers(self, instance):
         if not instance or instance.id is None:
@@ -199,47 +194,56 @@ class CampaignAdmin(admin.ModelAdmin):
     segment_subscribers.short_description = _("Subscribers")
 
     def sent_to(self, instance):
-        return self.async_count(instance, "sent")
+        if not instance or instance.id is None:
+            return "-"
+
+        return format_html(
+            '<a href="{}?campaign_id__exact={}">{} - ({})</a>',
+            reverse("admin:nuntius_campaignsentevent_changelist"),
+            instance.pk,
+            instance.get_stats()["sent"],
+            _("See the list"),
+        )
 
     sent_to.short_description = _("Sent to")
 
     def sent_ok(self, instance):
-        return self.async_count(instance, "ok")
+        return self.stats_count(instance, "ok")
 
     sent_ok.short_description = _("Ok")
 
     def sent_bounced(self, instance):
-        return self.async_count(instance, "bounced")
+        return self.stats_count(instance, "bounced")
 
     sent_bounced.short_description = _("Bounced")
 
     def sent_complained(self, instance):
-        return self.async_count(instance, "complained")
+        return self.stats_count(instance, "complained")
 
     sent_complained.short_description = _("Complained")
 
     def sent_blocked(self, instance):
-        return self.async_count(instance, "blocked")
+        return self.stats_count(instance, "blocked")
 
     sent_blocked.short_description = _("Blocked")
 
     def open_count(self, instance):
-        return self.async_count(instance, "open")
+        return self.stats_count(instance, "open")
 
     open_count.short_description = _("Open count")
 
     def unique_open_count(self, instance):
-        return self.async_count(instance, "unique_open")
+        return self.stats_count(instance, "unique_open")
 
     unique_open_count.short_description = _("Unique open count")
 
     def click_count(self, instance):
-        return self.async_count(instance, "click")
+        return self.stats_count(instance, "click")
 
     click_count.short_description = _("Click count")
 
     def unique_click_count(self, instance):
-        return self.async_count(instance, "unique_click")
+        return self.stats_count(instance, "unique_click")
 
     unique_click_count.short_description = _("Unique click count")
 
@@ -348,11 +352,6 @@ class CampaignAdmin(admin.ModelAdmin):
                 subscriber_count_view,
                 name="nuntius_campaign_subscribers_count"
             ),
-            path(
-                f"<pk>/nuntius/<name>/count/",
-                count_view,
-                name=f"nuntius_campaign_count"
-            )
         ] + super().get_urls()
 
     def send_view(self, request, pk):
@@ -360,6 +359,7 @@ class CampaignAdmin(admin.ModelAdmin):
 
         campaign.status = Campaign.STATUS_SENDING
         campaign.save(update_fields=["status"])
+        notify_workers(app_settings.CAMPAIGN_TYPE_EMAIL)
 
         return redirect(reverse("admin:nuntius_campaign_change", args=[pk]))
 
@@ -368,6 +368,7 @@ class CampaignAdmin(admin.ModelAdmin):
 
         campaign.status = Campaign.STATUS_WAITING
         campaign.save(update_fields=["status"])
+        notify_workers(app_settings.CAMPAIGN_TYPE_EMAIL)
 
         return redirect(reverse("admin:nuntius_campaign_change", args=[pk]))
 
@@ -9,6 +9,7 @@ from nuntius import app_settings
 from nuntius.admin.panels import subscriber_class
 from nuntius.models import Campaign
 from nuntius.models.push_campaigns import PushCampaign, PushCampaignSentEvent
+from nuntius.utils.wakeup import notify_workers
 
 
 class PushCampaignAdmin(admin.ModelAdmin):
@@ -37,6 +38,7 @@ class PushCampaignAdmin(admin.ModelAdmin):
                     "first_sent",
                     "segment",
                     "segment_subscribers",
+                    "priority",
                     "status",
                     "send_button",
                 )
@@ -83,23 +85,23 @@ class PushCampaignAdmin(admin.ModelAdmin):
             reverse("admin:nuntius_pushcampaignsentevent_changelist")
             + "?campaign_id__exact="
             + str(instance.pk),
-            str(instance.get_sent_count()),
+            str(instance.get_stats()["sent"]),
         )
 
     sent_to.short_description = _("Sent to")
 
     def sent_ok(self, instance):
-        return instance.get_ok_count()
+        return instance.get_stats()["ok"]
 
     sent_ok.short_description = _("OK")
 
     def sent_ko(self, instance):
-        return instance.get_ko_count()
+        return instance.get_stats()["ko"]
 
     sent_ko.short_description = _("KO")
 
     def click_count(self, instance):
-        return instance.get_click_count()
+        return instance.get_stats()["click"]
 
     click_count.short_description = _("Click count")
 
@@ -132,10 +134,16 @@ class PushCampaignAdmin(admin.ModelAdmin):
             ),
         ] + super().get_urls()
 
+    def save_model(self, request, campaign, form, change):
+        super().save_model(request, campaign, form, change)
+        # the priority or the sending dates may have changed
+        notify_workers(app_settings.CAMPAIGN_TYPE_PUSH)
+
     def send_view(self, request, pk):
         campaign = PushCampaign.objects.get(pk=pk)
         campaign.status = PushCampaign.STATUS_SENDING
         campaign.save(update_fields=["status"])
+        notify_workers(app_settings.CAMPAIGN_TYPE_PUSH)
 
         return redirect(reverse("admin:nuntius_pushcampaign_change", args=[pk]))
 
@@ -144,6 +152,7 @@ class PushCampaignAdmin(admin.ModelAdmin):
 
         campaign.status = PushCampaign.STATUS_WAITING
         campaign.save(update_fields=["status"])
+        notify_workers(app_settings.CAMPAIGN_TYPE_PUSH)
 
         return redirect(reverse("admin:nuntius_pushcampaign_change", args=[pk]))
 
@@ -50,17 +50,115 @@ EMAIL_BACKEND = getattr(settings, "NUNTIUS_EMAIL_BACKEND", None)
 # Maximum rate with which emails may be sent, by number of emails per second
 MAX_SENDING_RATE = getattr(settings, "NUNTIUS_MAX_SENDING_RATE", 50)
 
+# Rate limiter used by sending processes to enforce MAX_SENDING_RATE: the default token
+# bucket only limits the processes of a single worker, use
+# "nuntius.utils.processes.DatabaseTokenBucket" to share the rate between several workers,
+# or "nuntius.utils.processes.AdaptiveTokenBucket" to slow down when the mail service
+# throttles sending
+RATE_LIMITER_BACKEND = getattr(
+    settings, "NUNTIUS_RATE_LIMITER_BACKEND", "nuntius.utils.processes.TokenBucket"
+)
+
+# Rate under which "nuntius.utils.processes.AdaptiveTokenBucket" never goes when the mail
+# service asks to slow down, by number of emails per second
+MIN_SENDING_RATE = getattr(settings, "NUNTIUS_MIN_SENDING_RATE", 1)
+
+# Number of tokens each worker takes at once from the database token bucket
+RATE_LIMITER_BLOCK_SIZE = getattr(settings, "NUNTIUS_RATE_LIMITER_BLOCK_SIZE", 20)
+
+# Maximum rates with which emails may be sent to some recipient domains, by number of
+# emails per second, e.g. {"gmail.com": 20, "orange.fr": 5}
+DOMAIN_SENDING_RATES = getattr(settings, "NUNTIUS_DOMAIN_SENDING_RATES", {})
+
 # Number of concurrent sending processes to send emails
 MAX_CONCURRENT_SENDERS = getattr(settings, "NUNTIUS_MAX_CONCURRENT_SENDERS", 4)
 
+# Whether campaigns with a higher priority are sent before campaigns with a lower
+# priority, instead of sharing the sending capacity in proportion to their priorities
+STRICT_CAMPAIGN_PRIORITY = getattr(settings, "NUNTIUS_STRICT_CAMPAIGN_PRIORITY", False)
+
+# Number of campaign managers between which the subscribers of an email campaign are
+# split, each of them with its own process
+CAMPAIGN_MANAGER_SHARDS = getattr(settings, "NUNTIUS_CAMPAIGN_MANAGER_SHARDS", 1)
+
+# Duration, in seconds, of the lease a worker takes on the campaign shards it schedules,
+# after which a shard may be taken over by another worker if the lease was not renewed
+SHARD_LEASE_DURATION = getattr(settings, "NUNTIUS_SHARD_LEASE_DURATION", 60)
+
+# Number of sent events for which campaign managers ask sender processes to render the
+# messages, with a single item of the work queue (0 to render them in campaign managers)
+RENDER_JOB_SIZE = getattr(settings, "NUNTIUS_RENDER_JOB_SIZE", 0)
+
+# Whether campaign managers publish the static parts of the HTML content of messages in
+# shared memory, and only put the parts specific to each subscriber on the work queue (the
+# MIME encoding of messages is then also prepared once for the whole campaign)
+SHARED_RENDER_CACHE = getattr(settings, "NUNTIUS_SHARED_RENDER_CACHE", False)
+
+# Number of concurrent connections of each email sending process (when greater than 1,
+# sending processes run their connections in an asyncio event loop)
+SENDER_CONCURRENCY = getattr(settings, "NUNTIUS_SENDER_CONCURRENCY", 1)
+
+# Maximum number of queued messages that email sending processes send with a single call
+# to the email backend (only used with Anymail backends)
+SENDING_BATCH_SIZE = getattr(settings, "NUNTIUS_SENDING_BATCH_SIZE", 1)
+
+# Number of sending results that email sending processes save to the database at once,
+# and maximum time, in seconds, a sending result may wait before being saved
+RESULTS_BATCH_SIZE = getattr(settings, "NUNTIUS_RESULTS_BATCH_SIZE", 100)
+RESULTS_FLUSH_INTERVAL = getattr(settings, "NUNTIUS_RESULTS_FLUSH_INTERVAL", 1)
+
 # Maximum number of messages that may be sent over a single SMTP connection
 MAX_MESSAGES_PER_CONNECTION = getattr(
     settings, "NUNTIUS_MAX_MESSAGES_PER_SMTP_CONNECTION", 500
 )
 
+# Time, in seconds, after which an idle SMTP connection of sending processes is checked
+# with a NOOP command before being used again
+SMTP_HEALTH_CHECK_INTERVAL = getattr(settings, "NUNTIUS_SMTP_HEALTH_CHECK_INTERVAL", 30)
+
 # Interval of time, in seconds, with which the worker must check for campaign status changes
 POLLING_INTERVAL = getattr(settings, "NUNTIUS_POLLING_INTERVAL", 2)
 
+# Whether workers are notified of campaign status changes with PostgreSQL NOTIFY
+POSTGRES_NOTIFICATIONS = getattr(settings, "NUNTIUS_POSTGRES_NOTIFICATIONS", False)
+
+# Interval of time, in seconds, with which the worker checks for campaign status changes
+# when it is also notified of them, with POSTGRES_NOTIFICATIONS or WORKER_SOCKET
+NOTIFIED_POLLING_INTERVAL = getattr(settings, "NUNTIUS_NOTIFIED_POLLING_INTERVAL", 30)
+
+# Path of the Unix socket on which the worker is notified of campaign status changes, when
+# POSTGRES_NOTIFICATIONS is not used (the admin must run on the same host as the worker)
+WORKER_SOCKET = getattr(settings, "NUNTIUS_WORKER_SOCKET", None)
+
+# Number of subscribers for which campaign managers create sent events in a single query
+# (0 to create them one by one)
+SCHEDULING_BATCH_SIZE = getattr(settings, "NUNTIUS_SCHEDULING_BATCH_SIZE", 1000)
+
+# Backend used by tracking views to increment open and click counters
+TRACKING_COUNTER_BACKEND = getattr(
+    settings,
+    "NUNTIUS_TRACKING_COUNTER_BACKEND",
+    "nuntius.utils.counters.DirectCounterBackend",
+)
+
+# Interval of time, in seconds, between two writes of the buffered counter backend
+TRACKING_COUNTER_FLUSH_INTERVAL = getattr(
+    settings, "NUNTIUS_TRACKING_COUNTER_FLUSH_INTERVAL", 5
+)
+
+# Whether webhooks only store the tracking events they receive, for them to be applied in
+# batches by the `nuntius_apply_tracking_events` management command
+STAGED_TRACKING_EVENTS = getattr(settings, "NUNTIUS_STAGED_TRACKING_EVENTS", False)
+
+# Number of staged tracking events applied at once, and interval of time, in seconds, with
+# which the staged tracking events are checked when there is none left
+TRACKING_EVENTS_BATCH_SIZE = getattr(
+    settings, "NUNTIUS_TRACKING_EVENTS_BATCH_SIZE", 1000
+)
+TRACKING_EVENTS_POLLING_INTERVAL = getattr(
+    settings, "NUNTIUS_TRACKING_EVENTS_POLLING_INTERVAL", 1
+)
+
 if CAMPAIGN_TYPE_PUSH in ENABLED_CAMPAIGN_TYPES:
     try:
         PUSH_NOTIFICATION_SETTINGS = settings.NUNTIUS_PUSH_NOTIFICATION_SETTINGS
@@ -75,5 +173,5 @@ if not hasattr(settings, "NUNTIUS_PERFORMANCE"):
 
 settings.NUNTIUS_PERFORMANCE = {
     "CAMPAIGN_SENT_EVENT_DISABLE_FULL_PAGINATION": False,
-    **settings.NUNTIUS_PERFORMANCE
+    **settings.NUNTIUS_PERFORMANCE,
 }
@@ -7,4 +7,11 @@ class NuntiusConfig(AppConfig):
     default_auto_field = "django.db.models.AutoField"
 
     def ready(self):
+        from . import app_settings
+
+        # resolved once, as it is needed for each tracking event received by webhooks
+        self.subscriber_model = self.apps.get_model(
+            app_settings.NUNTIUS_SUBSCRIBER_MODEL
+        )
+
         from . import signals
@@ -0,0 +1,43 @@
+import signal
+import time
+
+from django.core.management import BaseCommand
+
+from nuntius import app_settings
+from nuntius.utils.processes import GracefulExit, gracefully_exit
+from nuntius.utils.tracking import apply_staged_tracking_events
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply in batches the tracking events stored by webhooks when "
+        "NUNTIUS_STAGED_TRACKING_EVENTS is set"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=app_settings.TRACKING_EVENTS_BATCH_SIZE,
+            help="The maximum number of tracking events applied at once",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once all staged tracking events have been applied",
+        )
+
+    def handle(self, *args, batch_size=None, once=False, verbosity=1, **options):
+        signal.signal(signal.SIGTERM, gracefully_exit)
+
+        try:
+            while True:
+                count = apply_staged_tracking_events(batch_size)
+                if count and verbosity >= 2:
+                    self.stdout.write(f"{count} tracking events applied")
+                if count < batch_size:
+                    if once:
+                        return
+                    time.sleep(app_settings.TRACKING_EVENTS_POLLING_INTERVAL)
+        except (GracefulExit, KeyboardInterrupt):
+            pass
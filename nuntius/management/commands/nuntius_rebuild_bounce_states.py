@@ -0,0 +1,74 @@
+from itertools import islice
+
+from django.core.management import BaseCommand
+from django.db import connection
+
+from nuntius.models import BounceState, CampaignSentEvent, CampaignSentStatusType
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute again the bounce states of email addresses from their sent events, for "
+        "instance after installing this version of Nuntius or changing "
+        "NUNTIUS_BOUNCE_PARAMS"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "emails",
+            nargs="*",
+            metavar="email",
+            help="The email addresses to rebuild (all addresses which have bounced by "
+            "default)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="The number of bounce states saved with a single query",
+        )
+
+    def handle(self, *args, emails=None, batch_size=1000, verbosity=1, **options):
+        if not emails:
+            emails = (
+                CampaignSentEvent.objects.filter(result=CampaignSentStatusType.BOUNCED)
+                .order_by("email")
+                .values_list("email", flat=True)
+                .distinct()
+                .iterator()
+            )
+
+        states = (BounceState.from_history(email) for email in emails)
+        count = 0
+        for batch in iter(lambda: list(islice(states, batch_size)), []):
+            self.save_states(batch)
+            count += len(batch)
+            if verbosity >= 2:
+                self.stdout.write(f"{count} bounce states rebuilt")
+
+    def save_states(self, states):
+        """Save bounce states, replacing those of the same email addresses
+
+        States are upserted with a single query when the database supports it, e.g. with
+        ON CONFLICT on PostgreSQL and SQLite or ON DUPLICATE KEY on MySQL, and one by one
+        otherwise.
+        """
+        fields = ["last_success", "bounces"]
+        if connection.features.supports_update_conflicts_with_target:
+            BounceState.objects.bulk_create(
+                states,
+                update_conflicts=True,
+                unique_fields=["email"],
+                update_fields=fields,
+            )
+        elif connection.features.supports_update_conflicts:
+            # the email address is the primary key, so the only possible conflict
+            BounceState.objects.bulk_create(
+                states, update_conflicts=True, update_fields=fields
+            )
+        else:
+            for state in states:
+                BounceState.objects.update_or_create(
+                    email=state.email,
+                    defaults={field: getattr(state, field) for field in fields},
+                )
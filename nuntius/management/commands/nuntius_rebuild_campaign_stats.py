@@ -0,0 +1,37 @@
+from django.core.management import BaseCommand, CommandError
+
+from nuntius.models import Campaign, CampaignStats
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute again the statistics of email campaigns from their sent events, to fix "
+        "any drift of the incrementally updated counters"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "campaign_ids",
+            nargs="*",
+            type=int,
+            metavar="campaign_id",
+            help="The ids of the campaigns to rebuild (all campaigns by default)",
+        )
+
+    def handle(self, *args, campaign_ids=None, verbosity=1, **options):
+        campaigns = Campaign.objects.all()
+        if campaign_ids:
+            campaigns = campaigns.filter(id__in=campaign_ids)
+            missing = set(campaign_ids) - set(campaigns.values_list("id", flat=True))
+            if missing:
+                raise CommandError(
+                    f"Unknown campaigns: {', '.join(str(id) for id in sorted(missing))}"
+                )
+
+        for campaign in campaigns.iterator():
+            stats = CampaignStats.rebuild(campaign)
+            if verbosity >= 2:
+                self.stdout.write(
+                    f"{campaign!r}: {stats.sent_count} sent, {stats.ok_count} ok, "
+                    f"{stats.unique_open_count} opened, {stats.unique_click_count} clicked"
+                )
@@ -1,18 +1,42 @@
+import asyncio
 import contextlib
 import logging
 import multiprocessing as mp
 import multiprocessing.connection as mpc
+import os
+import pickle
+import random
 import signal
 import smtplib
+import socket
+import sys
+import threading
+import time
 from argparse import ArgumentTypeError
-from typing import Dict, List, Tuple
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from multiprocessing import queues as mp_queues, resource_tracker
+from queue import Empty, Full
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Tuple
 
 from django.core import mail
 from django.core.mail import EmailMessage
 from django.core.management import BaseCommand
-from django.db import connection
-from django.db.models import Exists, OuterRef
+from django.db import (
+    connection,
+    connections,
+    transaction,
+    IntegrityError,
+    OperationalError,
+)
+from django.db.models import Exists, OuterRef, Prefetch
+from django.db.models.functions import Mod
+from django.template import Context
 from django.utils import timezone
+from django.utils.module_loading import import_string
 from django.utils.translation import gettext as _, gettext_lazy
 from tenacity import (
     retry,
@@ -24,11 +48,14 @@ from tenacity import (
 
 from nuntius import app_settings
 from nuntius.app_settings import CAMPAIGN_TYPE_EMAIL, CAMPAIGN_TYPE_PUSH
-from nuntius.messages import message_for_event
+from nuntius.messages import RenderCache, message_for_event
 from nuntius.models import (
+    BounceState,
     Campaign,
     CampaignSentEvent,
     CampaignSentStatusType,
+    CampaignShard,
+    CampaignStats,
     PushCampaign,
     PushCampaignSentEvent,
     PushCampaignSentStatusType,
@@ -44,17 +71,21 @@ from nuntius.utils.processes import (
     print_stack_trace,
     reset_sigmask,
     RateLimiter,
-    TokenBucket,
     RateMeter,
+    LatencyMeter,
+    AdaptiveTokenBucket,
     GracefulExit,
     get_from_queue_or_quit,
     put_in_queue_or_quit,
     unexpected_exc_logger,
 )
+from nuntius.utils.wakeup import get_wakeup_listener
 
 try:
     from anymail import exceptions as anymail_exceptions
 
+    from anymail.backends.base import AnymailBaseBackend
+
     AnymailError = anymail_exceptions.AnymailError
     AnymailAPIError = anymail_exceptions.AnymailAPIError
     AnymailRecipientsRefused = anymail_exceptions.AnymailRecipientsRefused
@@ -63,15 +94,401 @@ except:
     class FakeException(Exception):
         pass
 
+    class AnymailBaseBackend:
+        pass
+
     AnymailError = AnymailRecipientsRefused = AnymailAPIError = FakeException
 
 
 logger = logging.getLogger(__name__)
 
+# number of subscribers read at once by campaign managers when sent events are created
+# one by one
+SUBSCRIBERS_CHUNK_SIZE = 2000
+
+# maximum number of messages a sender process takes from the work queue while the
+# messages it already has are held back by the rate limits of their domains
+MAX_BUFFERED_MESSAGES = 100
+
+# SMTP replies of mail services asking to slow down
+THROTTLING_SMTP_CODES = {421, 454}
+
+
+class RenderJob(NamedTuple):
+    """
+    Work item asking sender processes to render and send the messages of sent events
+    """
+
+    campaign_id: int
+    campaign_updated: datetime
+    sent_event_ids: List[int]
+
+
+class SharedMessage(NamedTuple):
+    """
+    Work item with only the parts of a message specific to its recipient
+
+    The static parts of the message are published by the campaign manager in the shared
+    memory segment of a :class:`nuntius.messages.RenderCache`.
+    """
+
+    campaign_id: int
+    campaign_updated: datetime
+    render_cache: str
+    sent_event_id: int
+    email: str
+    substitutions: List[str]
+    text_body: str
+
+
+def recipient_domain(message: EmailMessage):
+    """Return the domain of the recipient of a message, in lower case"""
+    return message.recipients()[0].rpartition("@")[2].lower()
+
+
+def is_throttling_error(exc: Exception):
+    """Whether an error means that the mail service asks to slow down
+
+    These are SMTP 421 and 454 replies, including when only given for some recipients,
+    and HTTP 429 responses of Anymail backends.
+    """
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return exc.smtp_code in THROTTLING_SMTP_CODES
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return any(
+            code in THROTTLING_SMTP_CODES for code, _msg in exc.recipients.values()
+        )
+    if isinstance(exc, AnymailAPIError):
+        return getattr(exc, "status_code", None) == 429
+    return False
+
+
+class DomainScheduler:
+    """
+    Buffer of the messages waiting to be sent by a sender process, by recipient domain
+
+    Messages to the domains with their own rate limiter (see
+    `nuntius.app_settings.DOMAIN_SENDING_RATES`) are kept in a queue by domain, and
+    messages to all other domains in a common queue. Queues take turns, so that a
+    throttled domain does not hold back the messages to other domains.
+    """
+
+    def __init__(self, rate_limiters: Dict[str, RateLimiter] = None, max_size=None):
+        """Create a new DomainScheduler
+
+        :param rate_limiters: the rate limiters of the throttled domains, by domain
+        :param max_size: the number of buffered messages above which no new message
+            should be added, defaults to `MAX_BUFFERED_MESSAGES`
+        """
+        self.rate_limiters = rate_limiters or {}
+        self.max_size = MAX_BUFFERED_MESSAGES if max_size is None else max_size
+        self._queues: Dict[str, deque] = {}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def full(self):
+        return self._size >= self.max_size
+
+    def extend(self, items):
+        """Add `(message, sent_event_id)` items to the queues of their domains"""
+        for item in items:
+            domain = recipient_domain(item[0])
+            if domain not in self.rate_limiters:
+                domain = None
+            self._queues.setdefault(domain, deque()).append(item)
+            self._size += 1
+
+    def clear(self):
+        """Remove all the buffered items
+
+        :return: the removed `(message, sent_event_id)` items
+        """
+        items = [item for queue in self._queues.values() for item in queue]
+        self._queues.clear()
+        self._size = 0
+        return items
+
+    def pop(self):
+        """Return the next item which may be sent right away
+
+        :return: an `(item, wait)` tuple, where `item` is None when all the buffered
+            messages are held back by the rate limits of their domains, and `wait` is
+            then the time, in seconds, before one of them may be sent (or None if no
+            message is buffered)
+        """
+        wait = None
+        for domain, queue in self._queues.items():
+            rate_limiter = self.rate_limiters.get(domain)
+            delay = rate_limiter.try_take() if rate_limiter else 0
+            if delay > 0:
+                wait = delay if wait is None else min(wait, delay)
+                continue
+
+            item = queue.popleft()
+            self._size -= 1
+            # the domain takes its next turn after all the others
+            del self._queues[domain]
+            if queue:
+                self._queues[domain] = queue
+            return item, None
+
+        return None, wait
+
+
+class MessageRenderer:
+    """
+    Renderer of the messages of render jobs, with a per-process cache of campaigns
+
+    Campaigns are kept with their compiled templates, and loaded again whenever a job
+    refers to a more recent version of the campaign. Render caches published by campaign
+    managers are likewise attached once for all the messages of a campaign.
+    """
+
+    MAX_CACHED_CAMPAIGNS = 16
+
+    def __init__(self):
+        self._campaigns = {}
+        self._render_caches = {}
+
+    def get_campaign(self, campaign_id, campaign_updated):
+        campaign = self._campaigns.get(campaign_id)
+        if campaign is None or campaign.updated != campaign_updated:
+            if len(self._campaigns) >= self.MAX_CACHED_CAMPAIGNS:
+                self._campaigns.clear()
+            campaign = self._campaigns[campaign_id] = Campaign.objects.get(
+                id=campaign_id
+            )
+        return campaign
+
+    def render(self, job: RenderJob):
+        """Render and claim the messages of the sent events of a job still pending
+
+        :return: a list of `(message, sent_event_id)` tuples
+        """
+        campaign = self.get_campaign(job.campaign_id, job.campaign_updated)
+        subscriber_model = CampaignSentEvent.subscriber.field.related_model
+        sent_events = CampaignSentEvent.objects.filter(
+            id__in=job.sent_event_ids, result=CampaignSentStatusType.PENDING
+        ).prefetch_related(
+            Prefetch(
+                "subscriber",
+                queryset=subscriber_model.prepare_subscriber_queryset(
+                    subscriber_model.objects.all()
+                ),
+            )
+        )
+
+        messages = []
+        for sent_event in sent_events:
+            sent_event.campaign = campaign
+            messages.append((message_for_event(sent_event), sent_event.id))
+
+        claimed = set(
+            claim_sent_events([sent_event_id for _, sent_event_id in messages])
+        )
+        return [message for message in messages if message[1] in claimed]
+
+    def get_render_cache(self, item: SharedMessage):
+        key = (item.campaign_id, item.campaign_updated)
+        if key not in self._render_caches:
+            if len(self._render_caches) >= self.MAX_CACHED_CAMPAIGNS:
+                self._render_caches.clear()
+            try:
+                render_cache = attach_render_cache(item.render_cache)
+            except FileNotFoundError:
+                # the campaign manager has already exited
+                render_cache = RenderCache.for_campaign(
+                    self.get_campaign(item.campaign_id, item.campaign_updated)
+                )
+                if (
+                    render_cache is not None
+                    and render_cache.campaign_updated != item.campaign_updated
+                ):
+                    render_cache = None
+            self._render_caches[key] = render_cache
+        return self._render_caches[key]
+
+    def assemble(self, item: SharedMessage):
+        """Assemble the message of a shared message item
+
+        :return: a list with a `(message, sent_event_id)` tuple
+        """
+        render_cache = self.get_render_cache(item)
+        if render_cache is None:
+            # the campaign has been modified since the item was queued
+            return self.render(
+                RenderJob(item.campaign_id, item.campaign_updated, [item.sent_event_id])
+            )
+        message = render_cache.message(item.email, item.substitutions, item.text_body)
+        if not claim_sent_events([item.sent_event_id]):
+            return []
+        return [(message, item.sent_event_id)]
+
+    def messages_for(self, item, error_channel: mpc.Connection):
+        """Return the `(message, sent_event_id)` tuples for an item of the work queue
+
+        Only the messages of the sent events the sender could claim are returned, so
+        that a message put on the work queue by several campaign managers (e.g. after
+        the lease of a shard has been taken over) is only sent once. Errors while
+        rendering a job are reported as errors of its campaign.
+        """
+        item = unpack_work_item(item)
+        if isinstance(item, RenderJob):
+            render = self.render
+        elif isinstance(item, SharedMessage):
+            render = self.assemble
+        else:
+            return [item] if claim_sent_events([item[1]]) else []
+
+        try:
+            return render(item)
+        except Campaign.DoesNotExist:
+            # the campaign has most likely been deleted
+            return []
+        except Exception as e:
+            error_channel.send(item.campaign_id)
+            logger.error(
+                _("Error while rendering messages for campaign %(campaign_id)s")
+                % {"campaign_id": item.campaign_id},
+                exc_info=e,
+            )
+            return []
+
+
+class PooledConnection:
+    """
+    Connection to the mail service kept by a :class:`ConnectionPool`
+    """
+
+    def __init__(self, backend, messages_left=None):
+        """Create a new PooledConnection
+
+        :param backend: the open email backend
+        :param messages_left: the number of messages that may still be sent before the
+            connection is reset, or None if there is no limit
+        :type messages_left: class:`int`
+        """
+        self.backend = backend
+        self.messages_left = messages_left
+        self.last_used = time.monotonic()
+
+    @property
+    def exhausted(self):
+        return self.messages_left is not None and self.messages_left <= 0
+
+
+class ConnectionPool:
+    """
+    Pool of the open connections to the mail service of a sender process
+
+    Connections are kept open between messages and campaigns, and may be shared by the
+    sending sessions of a process. An SMTP connection that was idle for more than
+    `nuntius.app_settings.SMTP_HEALTH_CHECK_INTERVAL` seconds is checked with a NOOP
+    command before it is used again.
+
+    Each connection is reset after a number of messages drawn at random in the last
+    fifth of `nuntius.app_settings.MAX_MESSAGES_PER_CONNECTION`, so that the connections
+    of all sender processes are not reset at the same time.
+    """
+
+    def __init__(self, connection_meter: RateMeter = None):
+        """Create a new ConnectionPool
+
+        :param connection_meter: rate meter counting the opened connections
+        :type connection_meter: class:`nuntius.utils.processes.RateMeter`
+        """
+        self._connection_meter = connection_meter
+        self._idle = deque()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        backend = mail.get_connection(backend=app_settings.EMAIL_BACKEND)
+        try:
+            backend.open()
+        except Exception:
+            backend.close()
+            raise
+
+        if self._connection_meter:
+            self._connection_meter.count_up()
+
+        messages_left = None
+        if app_settings.MAX_MESSAGES_PER_CONNECTION:
+            limit = app_settings.MAX_MESSAGES_PER_CONNECTION
+            messages_left = random.randint(limit - limit // 5, limit)
+        return PooledConnection(backend, messages_left)
+
+    @staticmethod
+    def is_healthy(connection: PooledConnection):
+        """Check an SMTP connection with a NOOP command
+
+        Other connections are deemed healthy, since Mail API backends open a new HTTP
+        connection when needed.
+        """
+        smtp_connection = getattr(connection.backend, "connection", None)
+        if not isinstance(smtp_connection, smtplib.SMTP):
+            return True
+
+        try:
+            code, _ = smtp_connection.noop()
+        except (smtplib.SMTPException, OSError):
+            return False
+        return code == 250
+
+    def acquire(self):
+        """Take a healthy connection from the pool, or open a new one
+
+        :rtype: class:`PooledConnection`
+        """
+        while True:
+            with self._lock:
+                # the last used connection is the less likely to have been closed
+                connection = self._idle.pop() if self._idle else None
+
+            if connection is None:
+                return self._connect()
+
+            if (
+                time.monotonic() - connection.last_used
+                < app_settings.SMTP_HEALTH_CHECK_INTERVAL
+                or self.is_healthy(connection)
+            ):
+                return connection
+
+            logger.debug("Dropping unhealthy connection to the mail service.")
+            self.discard(connection)
+
+    def release(self, connection: PooledConnection):
+        """Give back a connection to the pool, or close it if it was used enough"""
+        if connection.exhausted:
+            self.discard(connection)
+            return
+
+        connection.last_used = time.monotonic()
+        with self._lock:
+            self._idle.append(connection)
+
+    def discard(self, connection: PooledConnection):
+        """Close a connection that must not be used anymore"""
+        try:
+            connection.backend.close()
+        except Exception:
+            logger.debug("Error while closing a connection.", exc_info=True)
+
+    def close(self):
+        """Close all idle connections"""
+        with self._lock:
+            connections, self._idle = self._idle, deque()
+        for connection in connections:
+            self.discard(connection)
+
 
 class ConnectionManager:
     """
-    Manager around the SMTP or Mail API connection that handles reconnection and quitting
+    Manager around the SMTP or Mail API connections that handles reconnection and quitting
     """
 
     CONNECTION_ERRORS = (ConnectionError, smtplib.SMTPException, AnymailError)
@@ -81,32 +498,68 @@ class ConnectionManager:
         AnymailAPIError,
     )
 
-    def __init__(self, quit_event):
-        self._connection = mail.get_connection(backend=app_settings.EMAIL_BACKEND)
-        self._message_counter = 0
+    def __init__(
+        self,
+        quit_event,
+        rate_limiter: RateLimiter = None,
+        domain_rate_limiters: Dict[str, RateLimiter] = None,
+        pool: ConnectionPool = None,
+        latency_meter: LatencyMeter = None,
+    ):
+        """Create a new ConnectionManager
+
+        :param quit_event: event used to tell the sender process it needs to quit
+        :param rate_limiter: the rate limiter to which the back-pressure of the mail
+            service is reported
+        :param domain_rate_limiters: rate limiters of the recipient domains with their
+            own sending rate, to which the back-pressure for these domains is reported
+        :param pool: the pool from which connections are taken, which may be shared with
+            other connection managers (defaults to a pool of the connection manager's own)
+        :param latency_meter: meter measuring the time it takes to send each message
+        """
+        self._owns_pool = pool is None
+        self._pool = pool or ConnectionPool()
         self._quit_event = quit_event
+        self._rate_limiter = rate_limiter or RateLimiter()
+        self._domain_rate_limiters = domain_rate_limiters or {}
+        self._latency_meter = latency_meter
+
+    def rate_limiter_for(self, message: EmailMessage):
+        return self._domain_rate_limiters.get(
+            recipient_domain(message), self._rate_limiter
+        )
 
     @retry(
         wait=wait_random_exponential(max=30),
         retry=retry_if_exception_type(CONNECTION_ERRORS),
     )
-    def open_connection(self):
+    def acquire_connection(self):
         """
-        Connect to the SMTP or API server and retry with exponential backoff.
+        Take a connection from the pool, connecting to the SMTP or API server if needed,
+        and retry with exponential backoff.
 
-        This function will try up to 5 times to connect to the server, allowing for shaky
-        connections.
+        :rtype: class:`PooledConnection`
         """
         if self._quit_event.is_set():
             raise GracefulExit()
 
+        return self._pool.acquire()
+
+    def open_connection(self):
+        """
+        Make sure a connection to the SMTP or API server is ready in the pool.
+        """
+        self._pool.release(self.acquire_connection())
+
+    def _send(self, connection: PooledConnection, messages: List[EmailMessage]):
+        start = time.monotonic()
         try:
-            self._connection.open()
-        except Exception:
-            self._connection.close()
-            raise
-        else:
-            self._message_counter = 0
+            connection.backend.send_messages(messages)
+        finally:
+            if connection.messages_left is not None:
+                connection.messages_left -= len(messages)
+        if self._latency_meter:
+            self._latency_meter.record(time.monotonic() - start, len(messages))
 
     @retry(
         stop=stop_after_attempt(5),
@@ -123,31 +576,80 @@ class ConnectionManager:
         same time.
 
         :param message: the email message to send
-        :param connection: the connection to use to send the message
         """
-        if self._quit_event.is_set():
-            raise GracefulExit()
-
-        if (
-            app_settings.MAX_MESSAGES_PER_CONNECTION
-            and self._message_counter >= app_settings.MAX_MESSAGES_PER_CONNECTION
-        ):
-            self._connection.close()
-            self.open_connection()
+        connection = self.acquire_connection()
         try:
-            self._connection.send_messages([message])
-            self._message_counter += 1
+            self._send(connection, [message])
         except smtplib.SMTPServerDisconnected:
-            self._connection.close()
-            self.open_connection()
+            self._pool.discard(connection)
             raise TryAgain
+        except Exception as e:
+            if isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException):
+                # the connection itself failed
+                self._pool.discard(connection)
+            else:
+                self._pool.release(connection)
+            if is_throttling_error(e):
+                self.rate_limiter_for(message).report_throttling()
+            raise
+        else:
+            self._pool.release(connection)
+            self.rate_limiter_for(message).report_success()
+
+    @property
+    def can_send_batches(self):
+        """
+        Whether several messages may be sent with a single call to the backend.
+
+        This is only the case for Anymail backends, which record the sending status of
+        each message, so that messages that were not sent can be told apart when the
+        batch fails halfway.
+        """
+        return issubclass(
+            type(mail.get_connection(backend=app_settings.EMAIL_BACKEND)),
+            AnymailBaseBackend,
+        )
+
+    def send_messages(self, messages: List[EmailMessage]):
+        """
+        Send several email messages with a single call to the backend, without retrying.
+
+        Errors are not raised: the messages that could not be sent are those without an
+        `anymail_status`, and should be sent again with :meth:`send_message`.
+
+        :param messages: the email messages to send
+        """
+        connection = self.acquire_connection()
+
+        # the backend must not stop at the first failing message
+        connection.backend.fail_silently = True
+        try:
+            self._send(connection, messages)
+        except Exception as e:
+            logger.debug("Error while sending a batch of messages.", exc_info=True)
+            if is_throttling_error(e):
+                self._rate_limiter.report_throttling()
+        finally:
+            connection.backend.fail_silently = False
+            self._pool.release(connection)
+
+        for message in messages:
+            if (
+                getattr(message, "anymail_status", None)
+                and message.anymail_status.status
+            ):
+                self.rate_limiter_for(message).report_success()
+
+    def close(self):
+        if self._owns_pool:
+            self._pool.close()
 
     def __enter__(self):
         self.open_connection()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._connection.close()
+        self.close()
 
 
 class PushManager:
@@ -184,6 +686,248 @@ class PushManager:
         pass
 
 
+@retry(
+    stop=stop_after_attempt(5),
+    wait=wait_random_exponential(max=5),
+    retry=retry_if_exception_type(OperationalError),
+    reraise=True,
+)
+def claim_sent_events(sent_event_ids):
+    """Mark pending sent events as being sent, so that their message is only sent once
+
+    A single sent event is claimed with a conditional UPDATE, and several ones by
+    locking them first, so that a sent event may never be claimed by two senders. The
+    claim time is saved, so that the claims of a worker which stopped without releasing
+    them are given up when its shard leases are taken over.
+
+    :param sent_event_ids: the ids of the sent events whose message is about to be sent
+    :return: the ids of the sent events that were claimed, i.e. that were still pending
+    :rtype: class:`list`
+    """
+    if not sent_event_ids:
+        return []
+
+    if len(sent_event_ids) == 1:
+        claimed = CampaignSentEvent.objects.filter(
+            id=sent_event_ids[0], result=CampaignSentStatusType.PENDING
+        ).update(result=CampaignSentStatusType.IN_FLIGHT, claimed_at=timezone.now())
+        return list(sent_event_ids) if claimed else []
+
+    with transaction.atomic():
+        claimed = list(
+            CampaignSentEvent.objects.select_for_update()
+            .filter(id__in=sent_event_ids, result=CampaignSentStatusType.PENDING)
+            .order_by()
+            .values_list("id", flat=True)
+        )
+        CampaignSentEvent.objects.filter(id__in=claimed).update(
+            result=CampaignSentStatusType.IN_FLIGHT, claimed_at=timezone.now()
+        )
+    return claimed
+
+
+def release_sent_events(sent_event_ids):
+    """Mark claimed sent events whose message has not been sent as pending again"""
+    if sent_event_ids:
+        CampaignSentEvent.objects.filter(
+            id__in=sent_event_ids, result=CampaignSentStatusType.IN_FLIGHT
+        ).update(result=CampaignSentStatusType.PENDING)
+
+
+@retry(
+    stop=stop_after_attempt(5),
+    wait=wait_random_exponential(max=5),
+    retry=retry_if_exception_type(OperationalError),
+    reraise=True,
+)
+def save_sent_event_results(results):
+    """Save the results of the sending of several messages and update campaign statistics
+
+    Sent events are updated with one query by result (or a single `bulk_update` for
+    those with other fields to update), and the statistics with one query by campaign.
+    Only unsent sent events are updated, so that statistics are not counted twice. The
+    successful sendings are also taken into account by the bounce states of their email
+    addresses, with one more query.
+
+    The transaction is retried when it fails because of concurrent transactions, for
+    instance when SQLite is shared by the sender processes of several workers.
+
+    :param results: a list of `(sent_event_id, result, fields)` tuples, where `fields`
+        are other fields to update on the sent event
+    """
+    with transaction.atomic():
+        pending_events = {
+            sent_event_id: (campaign_id, email, sent_at, old_result)
+            for sent_event_id, campaign_id, email, sent_at, old_result in (
+                CampaignSentEvent.objects.select_for_update()
+                .filter(
+                    id__in=[sent_event_id for sent_event_id, _, _ in results],
+                    result__in=CampaignSentStatusType.UNSENT,
+                )
+                .order_by()
+                .values_list("id", "campaign_id", "email", "datetime", "result")
+            )
+        }
+        results = [result for result in results if result[0] in pending_events]
+
+        ids_by_result = defaultdict(list)
+        events_with_fields = []
+        stats_deltas = defaultdict(Counter)
+        successes = {}
+
+        for sent_event_id, result, fields in results:
+            campaign_id, email, sent_at, old_result = pending_events[sent_event_id]
+            if fields:
+                events_with_fields.append(
+                    CampaignSentEvent(id=sent_event_id, result=result, **fields)
+                )
+            else:
+                ids_by_result[result].append(sent_event_id)
+            if result in BounceState.SUCCESSFUL_RESULTS:
+                successes[email] = sent_at
+            stats_deltas[campaign_id].update(
+                CampaignStats.result_change_deltas(old_result, result)
+            )
+
+        for result, ids in ids_by_result.items():
+            CampaignSentEvent.objects.filter(id__in=ids).update(result=result)
+        if events_with_fields:
+            CampaignSentEvent.objects.bulk_update(
+                events_with_fields,
+                {"result", *(field for _, _, fields in results for field in fields)},
+            )
+
+        for campaign_id, deltas in stats_deltas.items():
+            if campaign_id is not None:
+                CampaignStats.objects.filter(campaign_id=campaign_id).increment(
+                    **deltas
+                )
+
+        BounceState.record_successes(successes)
+
+
+class ResultAccumulator:
+    """
+    Accumulator of sending results, to save them to the database by batches
+
+    Results are saved once `max_size` of them have been added, or when the oldest one
+    has been waiting for more than `max_delay` seconds. Senders must also call
+    :meth:`flush` when they are idle and before they exit, so that no result is lost.
+    """
+
+    def __init__(self, max_size: int = None, max_delay: float = None):
+        """Create a new ResultAccumulator
+
+        :param max_size: the number of results that triggers a flush, defaults to
+            `nuntius.app_settings.RESULTS_BATCH_SIZE`
+        :param max_delay: the maximum time a result may wait before being saved, in
+            seconds, defaults to `nuntius.app_settings.RESULTS_FLUSH_INTERVAL`
+        """
+        if max_size is None:
+            max_size = app_settings.RESULTS_BATCH_SIZE
+        if max_delay is None:
+            max_delay = app_settings.RESULTS_FLUSH_INTERVAL
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._results = []
+        self._oldest = None
+
+    def add(self, sent_event_id, result, **fields):
+        if not self._results:
+            self._oldest = time.monotonic()
+        self._results.append((sent_event_id, result, fields))
+
+        if (
+            len(self._results) >= self.max_size
+            or time.monotonic() - self._oldest >= self.max_delay
+        ):
+            self.flush()
+
+    def flush(self):
+        results, self._results = self._results, []
+        if not results:
+            return
+
+        try:
+            save_sent_event_results(results)
+        except IntegrityError:
+            # most likely a webhook created a sent event with the same esp_message_id
+            # in the meantime: save results one by one so that only this one is lost
+            for result in results:
+                try:
+                    save_sent_event_results([result])
+                except IntegrityError:
+                    logger.error(
+                        _("Could not save the result of sent event %(id)s")
+                        % {"id": result[0]},
+                        exc_info=True,
+                    )
+
+
+def send_email_message(connection_manager: ConnectionManager, message: EmailMessage):
+    """Send an email message and return the result to save on its sent event
+
+    Errors linked to the recipient are turned into a `BLOCKED` result, any other error
+    is raised.
+
+    :return: a `(result, fields)` tuple, where `fields` are other fields to update on
+        the sent event
+    """
+    try:
+        connection_manager.send_message(message)
+    except (smtplib.SMTPRecipientsRefused, AnymailRecipientsRefused):
+        # exceptions linked to a specific recipient need not stop the sending
+        return CampaignSentStatusType.BLOCKED, {}
+
+    return sent_message_result(message)
+
+
+def send_email_batch(connection_manager: ConnectionManager, messages):
+    """Send several email messages at once and return the results to save on their sent events
+
+    :return: for each message, a `(result, fields)` tuple like for :func:`send_email_message`,
+        or None if the message could not be sent with the batch
+    """
+    connection_manager.send_messages(messages)
+
+    return [
+        sent_message_result(message)
+        if getattr(message, "anymail_status", None) and message.anymail_status.status
+        else None
+        for message in messages
+    ]
+
+
+def sent_message_result(message: EmailMessage):
+    """Return the `(result, fields)` tuple to save for a message the backend accepted"""
+    if hasattr(message, "anymail_status"):
+        # messages generated by the campaign manager should only have one recipient
+        recipient_status = message.anymail_status.recipients[message.to[0]]
+        if recipient_status.status in ["invalid", "rejected", "failed"]:
+            return CampaignSentStatusType.REJECTED, {}
+        return (
+            CampaignSentStatusType.UNKNOWN,
+            {"esp_message_id": recipient_status.message_id},
+        )
+
+    return CampaignSentStatusType.UNKNOWN, {}
+
+
+def report_sending_error(sent_event_id, error_channel: mpc.Connection, exc):
+    """Signal to the main process that the campaign of a sent event failed
+
+    The sent event is released, so that its message is sent when the campaign resumes.
+    """
+    release_sent_events([sent_event_id])
+    campaign = Campaign.objects.get(campaignsentevent__id=sent_event_id)
+    error_channel.send(campaign.id)
+    logger.error(
+        _("Error while sending email for campaign %(campaign)s")
+        % {"campaign": repr(campaign)},
+        exc_info=exc,
+    )
+
+
 @reset_sigmask
 @unexpected_exc_logger
 def mailer_process(
@@ -193,20 +937,25 @@ def mailer_process(
     quit_event: mp.Event,
     rate_limiter: RateLimiter = None,
     rate_meter: RateMeter = None,
+    batch_size: int = None,
+    domain_rate_limiters: Dict[str, RateLimiter] = None,
+    connection_meter: RateMeter = None,
+    latency_meter: LatencyMeter = None,
 ):
     """
     Main function of the processes responsible for sending email messages.
 
     This process pulls `(message: EmailMessage, event: CampaignSentEvent)`
     tuples from the work queue, tries to send the message and saves the result
-    on the `event`.
+    on the `event`. It may also pull :class:`RenderJob` items, in which case it renders
+    the messages itself.
 
     Whenever an unexpected error happens (i.e. which does not seem to be linked
     to a particular recipient), the process signals the error on the
     `error_channel` by sending the campaign id.
 
-    It monitors its own connection to the mail service, and resets it every
-    `nuntius.app_settings.MAX_MESSAGES_PER_CONNECTION` messages.
+    It keeps its connection to the mail service in a :class:`ConnectionPool`, which
+    resets it about every `nuntius.app_settings.MAX_MESSAGES_PER_CONNECTION` messages.
 
     :param queue: The work queue on which tuples (EmailMessage, CampaignSentEvent) are received.
     :type queue: class:`multiprocessing.Queue`
@@ -222,68 +971,316 @@ def mailer_process(
 
     :param rate_meter: rate meter to allow measuring the sending speed
     :type rate_meter: class:`nuntius.utils.processes.RateMeter`
+
+    :param batch_size: maximum number of queued messages sent with a single call to the
+        backend, when it supports it, defaults to `nuntius.app_settings.SENDING_BATCH_SIZE`
+    :type batch_size: class:`int`
+
+    :param domain_rate_limiters: rate limiters of the recipient domains with their own
+        sending rate, by domain
+    :type domain_rate_limiters: class:`dict`
+
+    :param connection_meter: rate meter to allow measuring how often connections to the
+        mail service are opened
+    :type connection_meter: class:`nuntius.utils.processes.RateMeter`
+
+    :param latency_meter: meter to allow measuring the time it takes to send a message
+    :type latency_meter: class:`nuntius.utils.processes.LatencyMeter`
     """
     message: EmailMessage
     sent_event_id: int
 
-    try:
-        with ConnectionManager(quit_event) as connection_manager:
-            while True:
+    if batch_size is None:
+        batch_size = app_settings.SENDING_BATCH_SIZE
+
+    results = ResultAccumulator()
+    renderer = MessageRenderer()
+    # messages rendered from render jobs or held back by domain rate limits
+    scheduler = DomainScheduler(domain_rate_limiters)
+
+    def next_message(block=True):
+        while True:
+            item, wait = scheduler.pop()
+            if item is not None:
+                return item
+
+            if not block:
+                if scheduler.full:
+                    raise Empty()
+                item = queue.get_nowait()
+            elif wait is None:
                 # the timeout allows the loop to start again every few seconds so that the
                 # quit_event is checked and the process can quit if it has to.
-                message, sent_event_id = get_from_queue_or_quit(
+                item = get_from_queue_or_quit(
                     queue,
                     event=quit_event,
                     polling_period=app_settings.POLLING_INTERVAL,
+                    on_idle=results.flush,
                 )
+            else:
+                # all buffered messages are held back by the rate limits of their domains
+                if quit_event.is_set():
+                    raise GracefulExit()
+                results.flush()
+                if scheduler.full:
+                    time.sleep(wait)
+                    continue
+                try:
+                    item = queue.get(timeout=min(wait, app_settings.POLLING_INTERVAL))
+                except Empty:
+                    continue
 
-                sent_event_qs = CampaignSentEvent.objects.filter(id=sent_event_id)
-                # messages generated by the campaign manager should only have one recipient
-                email = message.to[0]
+            scheduler.extend(renderer.messages_for(item, error_channel))
+
+    batch = []
+    try:
+        with ConnectionManager(
+            quit_event,
+            rate_limiter,
+            domain_rate_limiters,
+            pool=ConnectionPool(connection_meter),
+            latency_meter=latency_meter,
+        ) as connection_manager:
+            if not connection_manager.can_send_batches:
+                batch_size = 1
+
+            while True:
+                batch = [next_message()]
+                # complete the batch with messages that are already waiting
+                while len(batch) < batch_size:
+                    try:
+                        batch.append(next_message(block=False))
+                    except Empty:
+                        break
 
                 # rate limit just before sending
                 if rate_limiter:
-                    rate_limiter.take()
+                    rate_limiter.take(len(batch))
 
-                try:
-                    connection_manager.send_message(message)
-                except (smtplib.SMTPRecipientsRefused, AnymailRecipientsRefused):
-                    # exceptions linked to a specific recipient need not stop the sending
-                    CampaignSentEvent.objects.filter(id=sent_event_id).update(
-                        result=CampaignSentStatusType.BLOCKED
-                    )
-                except GracefulExit:
-                    raise
-                except Exception:
-                    campaign = Campaign.objects.get(campaignsentevent__id=sent_event_id)
-                    error_channel.send(campaign.id)
-                    logger.error(
-                        _("Error while sending email for campaign %(campaign)s")
-                        % repr(campaign),
-                        exc_info=True,
+                if len(batch) > 1:
+                    batch_results = send_email_batch(
+                        connection_manager, [message for message, _ in batch]
                     )
-
                 else:
-                    if rate_meter:
+                    batch_results = [None]
+
+                for (message, sent_event_id), result in zip(batch, batch_results):
+                    # messages not sent with the batch are retried one by one
+                    if result is None:
+                        try:
+                            result = send_email_message(connection_manager, message)
+                        except GracefulExit:
+                            raise
+                        except Exception as e:
+                            report_sending_error(sent_event_id, error_channel, e)
+                            continue
+
+                    result, fields = result
+                    if rate_meter and result != CampaignSentStatusType.BLOCKED:
                         rate_meter.count_up()
-                    if hasattr(message, "anymail_status"):
-                        if message.anymail_status.recipients[email].status in [
-                            "invalid",
-                            "rejected",
-                            "failed",
-                        ]:
-                            sent_event_qs.update(result=CampaignSentStatusType.REJECTED)
-                        else:
-                            sent_event_qs.update(
-                                result=CampaignSentStatusType.UNKNOWN,
-                                esp_message_id=message.anymail_status.recipients[
-                                    email
-                                ].message_id,
-                            )
-                    else:
-                        sent_event_qs.update(result=CampaignSentStatusType.UNKNOWN)
+                    results.add(sent_event_id, result, **fields)
     except GracefulExit:
         return
+    finally:
+        results.flush()
+        # the messages which were not sent are sent when the campaign resumes, including
+        # those of the current batch, whose sent events are still claimed
+        release_sent_events(
+            [sent_event_id for _, sent_event_id in batch + scheduler.clear()]
+        )
+
+
+@reset_sigmask
+@unexpected_exc_logger
+def async_mailer_process(
+    *,
+    queue: mp.Queue,
+    error_channel: mpc.Connection,
+    quit_event: mp.Event,
+    rate_limiter: RateLimiter = None,
+    rate_meter: RateMeter = None,
+    concurrency: int = None,
+    domain_rate_limiters: Dict[str, RateLimiter] = None,
+    connection_meter: RateMeter = None,
+    latency_meter: LatencyMeter = None,
+):
+    """
+    Main function of the processes sending email messages over several concurrent connections.
+
+    This process works like :func:`mailer_process`, but runs `concurrency` sending sessions
+    in an asyncio event loop, which share a pool of connections to the mail service, so
+    that many messages may be in flight at the same time from a single process.
+
+    Since Django email backends are blocking, the network calls of each session are
+    run in a thread pool, while all database queries are made from a single thread, so
+    that the process only holds one database connection.
+
+    The parameters are the same as for :func:`mailer_process`, with one addition:
+
+    :param concurrency: the number of concurrent sending sessions, defaults to
+        `nuntius.app_settings.SENDER_CONCURRENCY`
+    :type concurrency: class:`int`
+    """
+    if concurrency is None:
+        concurrency = app_settings.SENDER_CONCURRENCY
+
+    asyncio.run(
+        _run_sending_sessions(
+            queue=queue,
+            error_channel=error_channel,
+            quit_event=quit_event,
+            rate_limiter=rate_limiter,
+            rate_meter=rate_meter,
+            concurrency=concurrency,
+            domain_rate_limiters=domain_rate_limiters,
+            connection_meter=connection_meter,
+            latency_meter=latency_meter,
+        )
+    )
+
+
+async def _run_sending_sessions(
+    *,
+    queue,
+    error_channel,
+    quit_event,
+    rate_limiter,
+    rate_meter,
+    concurrency,
+    domain_rate_limiters,
+    connection_meter,
+    latency_meter,
+):
+    loop = asyncio.get_running_loop()
+    sending_executor = ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="nuntius-sender"
+    )
+    database_executor = ThreadPoolExecutor(
+        max_workers=1, thread_name_prefix="nuntius-database"
+    )
+    # only used from the database thread
+    results = ResultAccumulator()
+    renderer = MessageRenderer()
+    # shared by all sessions
+    scheduler = DomainScheduler(domain_rate_limiters)
+    pool = ConnectionPool(connection_meter)
+    # sent events of the messages popped from the scheduler whose result is not known yet
+    sending = set()
+
+    def run_in(executor, func, *args, **kwargs):
+        return loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+    async def next_message():
+        while True:
+            item, wait = scheduler.pop()
+            if item is not None:
+                return item
+
+            if quit_event.is_set():
+                raise GracefulExit()
+            if scheduler.full:
+                await asyncio.sleep(wait)
+                continue
+
+            # wake up when a message held back by the rate limit of its domain may be sent
+            timeout = app_settings.POLLING_INTERVAL
+            if wait is not None:
+                timeout = min(wait, timeout)
+            try:
+                item = await run_in(sending_executor, queue.get, timeout=timeout)
+            except Empty:
+                continue
+
+            scheduler.extend(
+                await run_in(
+                    database_executor, renderer.messages_for, item, error_channel
+                )
+            )
+
+    async def send(connection_manager, message, sent_event_id):
+        sending.add(sent_event_id)
+        # rate limit just before sending, without blocking a sending thread
+        if rate_limiter:
+            wait = rate_limiter.try_take()
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = rate_limiter.try_take()
+
+        try:
+            result, fields = await run_in(
+                sending_executor,
+                send_email_message,
+                connection_manager,
+                message,
+            )
+        except GracefulExit:
+            raise
+        except Exception as e:
+            await run_in(
+                database_executor,
+                report_sending_error,
+                sent_event_id,
+                error_channel,
+                e,
+            )
+        else:
+            if rate_meter and result != CampaignSentStatusType.BLOCKED:
+                rate_meter.count_up()
+            await run_in(
+                database_executor,
+                results.add,
+                sent_event_id,
+                result,
+                **fields,
+            )
+        sending.discard(sent_event_id)
+
+    async def sending_session():
+        connection_manager = ConnectionManager(
+            quit_event,
+            rate_limiter,
+            domain_rate_limiters,
+            pool=pool,
+            latency_meter=latency_meter,
+        )
+        await run_in(sending_executor, connection_manager.open_connection)
+
+        while True:
+            message, sent_event_id = await next_message()
+            await send(connection_manager, message, sent_event_id)
+
+    async def run_session():
+        while True:
+            try:
+                return await sending_session()
+            except GracefulExit:
+                return
+            except Exception:
+                # the equivalent of a sender process being restarted by the main process
+                logger.exception("Unexpected error in sending session.")
+                await asyncio.sleep(app_settings.POLLING_INTERVAL)
+
+    async def flush_results():
+        # results are otherwise only flushed when new ones are added
+        while True:
+            await asyncio.sleep(results.max_delay)
+            await run_in(database_executor, results.flush)
+
+    flusher = asyncio.create_task(flush_results())
+    try:
+        await asyncio.gather(*(run_session() for _ in range(concurrency)))
+    finally:
+        flusher.cancel()
+        await run_in(database_executor, results.flush)
+        await run_in(
+            database_executor,
+            release_sent_events,
+            [*sending, *(sent_event_id for _, sent_event_id in scheduler.clear())],
+        )
+        await run_in(database_executor, connections.close_all)
+        await run_in(sending_executor, pool.close)
+        sending_executor.shutdown()
+        database_executor.shutdown()
 
 
 @reset_sigmask
@@ -333,10 +1330,12 @@ def pusher_process(
             while True:
                 # the timeout allows the loop to start again every few seconds so that the
                 # quit_event is checked and the process can quit if it has to.
-                notification, push_sent_event_id = get_from_queue_or_quit(
-                    queue,
-                    event=quit_event,
-                    polling_period=app_settings.POLLING_INTERVAL,
+                notification, push_sent_event_id = unpack_work_item(
+                    get_from_queue_or_quit(
+                        queue,
+                        event=quit_event,
+                        polling_period=app_settings.POLLING_INTERVAL,
+                    )
                 )
 
                 # rate limit just before sending
@@ -376,10 +1375,169 @@ def pusher_process(
         return
 
 
+def pending_events_for_subscribers(campaign: Campaign, subscribers, batch_size: int):
+    """
+    Generator of the sent events still pending for the subscribed subscribers
+
+    Sent events are created on the fly for subscribers who do not have one yet. When
+    `batch_size` is not 0, subscribers are handled by batches of that size, and all the
+    missing sent events of a batch are created at once.
+
+    :param campaign: the campaign for which sent events are generated
+    :param subscribers: an iterable of subscribers
+    :param batch_size: the number of subscribers handled at once, or 0 to handle them one by one
+    """
+    subscribers = (
+        subscriber
+        for subscriber in subscribers
+        if subscriber.get_subscriber_status() == AbstractSubscriber.STATUS_SUBSCRIBED
+    )
+
+    if batch_size:
+        batches = iter(lambda: list(islice(subscribers, batch_size)), [])
+        sent_events = (
+            sent_event
+            for batch in batches
+            for sent_event in campaign.get_events_for_subscribers(batch)
+        )
+    else:
+        sent_events = (
+            campaign.get_event_for_subscriber(subscriber) for subscriber in subscribers
+        )
+
+    for sent_event in sent_events:
+        # the message may have been sent since the subscribers were read, by the worker
+        # which held the shard before
+        if sent_event.result == CampaignSentStatusType.PENDING:
+            yield sent_event
+
+
+def keyset_pages(queryset, page_size: int):
+    """Generator of the pages of a queryset, read by increasing pk with keyset pagination"""
+    queryset = queryset.order_by("pk")
+    page = list(queryset[:page_size])
+    while page:
+        yield page
+        page = list(queryset.filter(pk__gt=page[-1].pk)[:page_size])
+
+
+def subscriber_pages(shard: CampaignShard, queryset, page_size: int):
+    """
+    Generator of the pages of subscribers for which messages may still have to be scheduled
+
+    Subscribers are read by increasing pk. When the shard is resumed, the scan starts
+    right after the checkpoint saved on the shard, instead of looking for the subscribers
+    who did not receive the message in the whole segment. Before that, the subscribers
+    before the checkpoint whose sent events are still pending (i.e. the messages that
+    were in flight when the campaign was stopped) are read again.
+
+    :return: an iterator of `(subscribers, checkpoint)` tuples, where `checkpoint` is the
+        pk to save on the shard once the page has been scheduled, or None
+    """
+    checkpoint = shard.last_scheduled_pk
+
+    if shard.count > 1:
+        queryset = queryset.annotate(shard_index=Mod("pk", shard.count)).filter(
+            shard_index=shard.index
+        )
+
+    if checkpoint is None:
+        # eliminate people who already received the message
+        queryset = queryset.annotate(
+            already_sent=Exists(
+                CampaignSentEvent.objects.filter(
+                    subscriber_id=OuterRef("pk"), campaign_id=shard.campaign_id
+                ).exclude(result=CampaignSentStatusType.PENDING)
+            )
+        ).filter(already_sent=False)
+    else:
+        checkpoint = queryset.model._meta.pk.to_python(checkpoint)
+        in_flight = queryset.filter(
+            pk__lte=checkpoint,
+            pk__in=CampaignSentEvent.objects.filter(
+                campaign_id=shard.campaign_id, result=CampaignSentStatusType.PENDING
+            ).values("subscriber_id"),
+        )
+        for page in keyset_pages(in_flight, page_size):
+            yield page, None
+
+        queryset = queryset.filter(pk__gt=checkpoint)
+
+    for page in keyset_pages(queryset, page_size):
+        yield page, page[-1].pk
+
+
+def attach_render_cache(name):
+    """Load the render cache published in a shared memory segment by a campaign manager
+
+    :raises FileNotFoundError: if the segment has already been unlinked
+    :rtype: class:`nuntius.messages.RenderCache`
+    """
+    render_cache = RenderCache.attach(name)
+    if sys.version_info < (3, 13):
+        # attached segments are registered with the resource tracker, which would unlink
+        # them again when the sender exits
+        resource_tracker.unregister(f"/{name}", "shared_memory")
+    return render_cache
+
+
+def shared_message_for_event(campaign: Campaign, sent_event, render_cache: str):
+    """Return the shared message item for a sent event
+
+    :param render_cache: the name of the shared memory segment of the render cache
+    :return: the item, or None if the message must be rendered completely
+    :rtype: class:`SharedMessage`
+    """
+    subscriber_data = Context(sent_event.subscriber.get_subscriber_data())
+    substitutions = campaign.html_render_plan.substitutions(
+        subscriber_data, sent_event.tracking_id
+    )
+    if substitutions is None:
+        return None
+    return SharedMessage(
+        campaign.id,
+        campaign.updated,
+        render_cache,
+        sent_event.id,
+        sent_event.email,
+        substitutions,
+        campaign.text_template.render(context=subscriber_data),
+    )
+
+
+def work_items(
+    campaign: Campaign, sent_events, render_job_size: int, render_cache: str = None
+):
+    """Generator of the items to put on the work queue for the given sent events
+
+    :param render_job_size: the number of sent events by :class:`RenderJob`, or 0 to
+        render the messages right away
+    :param render_cache: the name of the shared memory segment in which the render cache
+        of the campaign is published, if any
+    """
+    if render_job_size:
+        jobs = iter(lambda: list(islice(sent_events, render_job_size)), [])
+        for job in jobs:
+            yield RenderJob(campaign.id, campaign.updated, [e.id for e in job])
+    else:
+        for sent_event in sent_events:
+            item = None
+            if render_cache is not None:
+                item = shared_message_for_event(campaign, sent_event, render_cache)
+            yield item or (message_for_event(sent_event), sent_event.id)
+
+
 @reset_sigmask
 @unexpected_exc_logger
 def email_campaign_manager_process(
-    *, campaign: Campaign, queue: mp.Queue, quit_event: mp.Event
+    *,
+    campaign: Campaign,
+    queue: mp.Queue,
+    quit_event: mp.Event,
+    shard: CampaignShard = None,
+    batch_size: int = None,
+    render_job_size: int = None,
+    shared_render_cache: bool = None,
 ):
     """
     Main function of the process responsible for scheduling the sending of campaigns
@@ -387,57 +1545,99 @@ def email_campaign_manager_process(
     :param campaign: the campaign for which messages must be sent
     :type campaign: :class:`nuntius.models.Campaign`
 
+    :param shard: the shard of the campaign to schedule, defaults to all the unfinished
+        shards of the campaign, one after the other (a campaign which is not split yet
+        gets a single shard)
+    :type shard: :class:`nuntius.models.CampaignShard`
+
     :param queue: the work queue on which email messages are put
     :type queue: : class:`multiprocessing.Queue`
 
     :param quit_event: an event that may be used by the main process to tell the manager it needs to quit
     :type quit_event: class:`multiprocessing.Event`
-    """
-    queryset = campaign.get_subscribers_queryset()
-    # eliminate people who already received the message
-    queryset = queryset.annotate(
-        already_sent=Exists(
-            CampaignSentEvent.objects.filter(
-                subscriber_id=OuterRef("pk"), campaign_id=campaign.id
-            ).exclude(result=CampaignSentStatusType.PENDING)
-        )
-    ).filter(already_sent=False)
 
-    campaign_finished = False
+    :param batch_size: number of subscribers for which sent events are created at once, defaults to
+        `nuntius.app_settings.SCHEDULING_BATCH_SIZE` (0 to create them one by one)
+    :type batch_size: class:`int`
 
-    for subscriber in queryset.iterator():
-        if quit_event.is_set():
-            break
+    :param render_job_size: number of sent events of the :class:`RenderJob` items put on
+        the work queue for sender processes to render, defaults to
+        `nuntius.app_settings.RENDER_JOB_SIZE` (0 to render messages in the campaign manager)
+    :type render_job_size: class:`int`
 
-        if subscriber.get_subscriber_status() != AbstractSubscriber.STATUS_SUBSCRIBED:
-            continue
+    :param shared_render_cache: whether the static parts of the messages are published in
+        shared memory, so that only the parts specific to each subscriber are put on the
+        work queue, defaults to `nuntius.app_settings.SHARED_RENDER_CACHE`
+    :type shared_render_cache: class:`bool`
+    """
+    if batch_size is None:
+        batch_size = app_settings.SCHEDULING_BATCH_SIZE
+    if render_job_size is None:
+        render_job_size = app_settings.RENDER_JOB_SIZE
+    if shared_render_cache is None:
+        shared_render_cache = app_settings.SHARED_RENDER_CACHE
+    if shard is not None:
+        shards = [shard]
+    else:
+        # a campaign which has already been split is scheduled one shard after the other
+        shards = [shard for shard in campaign.get_shards(count=1) if not shard.finished]
 
-        sent_event = campaign.get_event_for_subscriber(subscriber)
+    # make sure statistics exist before sending, so that senders may update them
+    campaign.get_campaign_stats()
 
-        # just in case there is another nuntius_worker started, but this should not happen
-        if sent_event.result != CampaignSentStatusType.PENDING:
-            continue
+    queryset = campaign.get_subscribers_queryset()
+    queryset = queryset.model.prepare_subscriber_queryset(queryset)
 
-        message = message_for_event(sent_event)
+    segment = None
+    if shared_render_cache and not render_job_size:
+        render_cache = RenderCache.for_campaign(campaign)
+        if render_cache is not None:
+            segment = render_cache.publish()
 
-        try:
-            put_in_queue_or_quit(
-                queue,
-                (message, sent_event.id),
-                event=quit_event,
-                polling_period=app_settings.POLLING_INTERVAL,
-            )
-        except GracefulExit:
-            break
-    else:
-        campaign_finished = True
+    finished_shards = []
+
+    try:
+        for shard in shards:
+            for subscribers, checkpoint in subscriber_pages(
+                shard, queryset, batch_size or SUBSCRIBERS_CHUNK_SIZE
+            ):
+                sent_events = pending_events_for_subscribers(
+                    campaign, subscribers, batch_size
+                )
+                for item in work_items(
+                    campaign,
+                    sent_events,
+                    render_job_size,
+                    segment.name if segment is not None else None,
+                ):
+                    put_in_queue_or_quit(
+                        queue,
+                        item,
+                        event=quit_event,
+                        polling_period=app_settings.POLLING_INTERVAL,
+                    )
+
+                if checkpoint is not None and not (
+                    CampaignShard.objects.filter(
+                        id=shard.id, lease_owner=shard.lease_owner
+                    ).update(last_scheduled_pk=str(checkpoint))
+                ):
+                    # the shard has been taken over by another worker
+                    raise GracefulExit()
+            finished_shards.append(shard)
+    except GracefulExit:
+        pass
 
     queue.close()
     queue.join_thread()
-    # everything has been scheduled for sending:
-    if campaign_finished:
-        campaign.status = Campaign.STATUS_SENT
-        campaign.save()
+    if segment is not None:
+        # senders which have not attached the segment yet load the campaign instead
+        segment.close()
+        segment.unlink()
+    # everything has been scheduled for sending: the campaign is sent once all its
+    # shards are
+    for shard in finished_shards:
+        shard.finish()
 
 
 @reset_sigmask
@@ -509,16 +1709,266 @@ def push_campaign_manager_process(
         campaign.save()
 
 
+class CampaignQueue:
+    """
+    Queue of the work items of a campaign, waiting to be dispatched to sender processes
+    """
+
+    def __init__(self, queue, priority: int):
+        self.queue = queue
+        self.priority = priority
+        # virtual time at which the campaign was last served, in units of work items
+        # divided by priority
+        self.virtual_time = 0.0
+        # next work item of the campaign, taken from its queue but not dispatched yet
+        self.head = None
+        # whether no campaign manager puts work items in the queue anymore
+        self.closing = False
+
+    def peek(self):
+        """Return the next work item of the campaign, or None if its queue is empty"""
+        if self.head is None:
+            try:
+                with dispatch_lock:
+                    self.head = self.queue.get_nowait()
+            except Empty:
+                pass
+        return self.head
+
+
+def work_item_cost(item):
+    """Return the number of messages sent for a work item"""
+    if isinstance(item, PackedWorkItem):
+        return item.cost
+    if isinstance(item, RenderJob):
+        return len(item.sent_event_ids)
+    return 1
+
+
+class PackedWorkItem(NamedTuple):
+    """
+    Work item pickled by the campaign manager which queued it
+
+    The main process relays packed work items from campaign queues to the work queue of
+    sender processes without unpickling them.
+    """
+
+    cost: int
+    data: bytes
+
+
+def unpack_work_item(item):
+    """Return the work item packed in a :class:`PackedWorkItem`, or the item itself"""
+    if isinstance(item, PackedWorkItem):
+        return pickle.loads(item.data)
+    return item
+
+
+class CampaignWorkQueue(mp_queues.Queue):
+    """
+    Queue on which campaign managers put the work items of a campaign, packed
+    """
+
+    def __init__(self, maxsize=0):
+        super().__init__(maxsize, ctx=mp.get_context())
+
+    def put(self, obj, block=True, timeout=None):
+        item = PackedWorkItem(
+            work_item_cost(obj), pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+        )
+        super().put(item, block, timeout)
+
+
+# held by the threads of dispatchers while they use queues, and by the main process while
+# it forks, so that a child process never inherits a queue lock held by a dispatcher
+dispatch_lock = threading.Lock()
+os.register_at_fork(
+    before=dispatch_lock.acquire,
+    after_in_parent=dispatch_lock.release,
+    after_in_child=dispatch_lock.release,
+)
+
+
+class CampaignDispatcher:
+    """
+    Dispatcher of the work items of concurrent campaigns to the work queue of sender processes
+
+    The campaign managers of each campaign put work items on a queue of the campaign,
+    and a thread of the main process moves them to the work queue, which is kept short.
+    Work items are pickled by campaign managers and only unpickled by sender processes,
+    so that the thread does not deserialize and serialize again whole messages.
+    Campaigns are served with weighted fair queuing: each campaign gets a share of the
+    messages sent in proportion to its priority, so that a small urgent campaign is not
+    held back by a big one started earlier. With `strict_priority`, campaigns are
+    instead served in decreasing order of priority, and campaigns with the same priority
+    share the messages sent equally.
+    """
+
+    # time to wait, in seconds, before looking again for work items when all campaign
+    # queues are empty
+    IDLE_DELAY = 0.01
+
+    def __init__(self, queue: mp.Queue, queue_size: int, strict_priority=None):
+        """Create a new CampaignDispatcher
+
+        :param queue: the work queue of sender processes
+        :type queue: class:`multiprocessing.Queue`
+        :param queue_size: the maximum number of work items of each campaign queue
+        :type queue_size: class:`int`
+        :param strict_priority: whether campaigns with a higher priority are sent before
+            the others, defaults to `nuntius.app_settings.STRICT_CAMPAIGN_PRIORITY`
+        :type strict_priority: class:`bool`
+        """
+        if strict_priority is None:
+            strict_priority = app_settings.STRICT_CAMPAIGN_PRIORITY
+        self.queue = queue
+        self.queue_size = queue_size
+        self.strict_priority = strict_priority
+        self._campaigns: Dict[int, CampaignQueue] = {}
+        self._lock = threading.Lock()
+        self._virtual_time = 0.0
+        self._stop_event = threading.Event()
+        self._drain_event = threading.Event()
+        self._thread = None
+
+    def create_queue(self):
+        return CampaignWorkQueue(maxsize=self.queue_size)
+
+    def add_campaign(self, campaign_id, priority: int):
+        """Return the queue on which the campaign managers of a campaign put work items
+
+        :param campaign_id: the id of the campaign
+        :param priority: the priority of the campaign
+        :type priority: class:`int`
+        :rtype: class:`multiprocessing.Queue`
+        """
+        with self._lock:
+            campaign_queue = self._campaigns.get(campaign_id)
+            if campaign_queue is None:
+                campaign_queue = self._campaigns[campaign_id] = CampaignQueue(
+                    self.create_queue(), priority
+                )
+                # the campaign only gets its share from now on
+                campaign_queue.virtual_time = self._virtual_time
+            campaign_queue.closing = False
+            campaign_queue.priority = max(priority, 1)
+            return campaign_queue.queue
+
+    def set_priority(self, campaign_id, priority: int):
+        """Change the priority of a campaign which is being dispatched"""
+        with self._lock:
+            if campaign_id in self._campaigns:
+                self._campaigns[campaign_id].priority = max(priority, 1)
+
+    def remove_campaign(self, campaign_id):
+        """Forget a campaign once the work items left in its queue have been dispatched"""
+        with self._lock:
+            if campaign_id in self._campaigns:
+                self._campaigns[campaign_id].closing = True
+
+    def queue_sizes(self):
+        """Return the number of work items waiting in the queue of each campaign"""
+        with self._lock:
+            return {
+                campaign_id: campaign_queue.queue.qsize()
+                + (campaign_queue.head is not None)
+                for campaign_id, campaign_queue in self._campaigns.items()
+            }
+
+    def select(self):
+        """Take the next work item to dispatch from the queues of campaigns
+
+        :return: the work item, or None if all campaign queues are empty
+        """
+        with self._lock:
+            ready = []
+            for campaign_id, campaign_queue in list(self._campaigns.items()):
+                if campaign_queue.peek() is not None:
+                    ready.append(campaign_queue)
+                elif campaign_queue.closing:
+                    with dispatch_lock:
+                        campaign_queue.queue.close()
+                    del self._campaigns[campaign_id]
+                else:
+                    # a campaign must not catch up for the time its queue was empty
+                    campaign_queue.virtual_time = max(
+                        campaign_queue.virtual_time, self._virtual_time
+                    )
+
+            if not ready:
+                return None
+
+            if self.strict_priority:
+                highest_priority = max(c.priority for c in ready)
+                ready = [c for c in ready if c.priority == highest_priority]
+
+            campaign_queue = min(ready, key=lambda c: c.virtual_time)
+            item, campaign_queue.head = campaign_queue.head, None
+            self._virtual_time = campaign_queue.virtual_time
+            campaign_queue.virtual_time += (
+                work_item_cost(item) / campaign_queue.priority
+            )
+            return item
+
+    def _run(self):
+        item = None
+        while not self._stop_event.is_set():
+            if item is None:
+                item = self.select()
+            if item is None:
+                time.sleep(self.IDLE_DELAY)
+                continue
+
+            if self._drain_event.is_set():
+                item = None
+                continue
+
+            try:
+                # the lock must not be held while waiting, as it holds back forks
+                with dispatch_lock:
+                    self.queue.put_nowait(item)
+            except Full:
+                time.sleep(self.IDLE_DELAY)
+                continue
+            item = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="nuntius-dispatcher", daemon=True
+        )
+        self._thread.start()
+
+    def drain(self):
+        """Stop dispatching work items, and discard those that campaign managers put
+
+        Campaign managers may then exit even if sender processes have stopped. The sent
+        events of discarded work items are scheduled again on next start.
+        """
+        self._drain_event.set()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        # work items that were not sent yet are scheduled again on next start, so that
+        # the main process must not wait for them to be taken by sender processes
+        self.queue.cancel_join_thread()
+
+
 CAMPAIGN_TYPE = {
     CAMPAIGN_TYPE_EMAIL: {
         "CampaignModel": Campaign,
         "sender_process": mailer_process,
+        "async_sender_process": async_mailer_process,
         "manager_process": email_campaign_manager_process,
+        "sharded": True,
     },
     CAMPAIGN_TYPE_PUSH: {
         "CampaignModel": PushCampaign,
         "sender_process": pusher_process,
+        "async_sender_process": None,
         "manager_process": push_campaign_manager_process,
+        "sharded": False,
     },
 }
 
@@ -543,10 +1993,14 @@ class Command(BaseCommand):
         """
 %(campaign_type)s STATISTICS
 Message queue size: %(queue_size)s
+Campaign queue sizes: %(campaign_queues)s
 Sender processes: %(sender_processes)s
 Campaign managers: %(campaign_managers)s
 Token bucket current capacity: %(bucket_capacity)s
-Current sending rate: %(sending_rate)s"""
+Effective rate limit: %(effective_rate)s
+Current sending rate: %(sending_rate)s
+Connections opened per minute: %(connection_rate)s
+Average sending latency: %(sending_latency)s ms"""
     )
 
     def add_arguments(self, parser):
@@ -562,9 +2016,19 @@ Current sending rate: %(sending_rate)s"""
         )
 
     def handle(self, *args, campaign_types=None, **options):
-        # used by campaign managers processes to queue messages to send
-        self.queue = {
-            key: mp.Queue(maxsize=app_settings.MAX_CONCURRENT_SENDERS)
+        # used to take leases on campaign shards shared with other workers
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        # used by sender processes to get the messages to send
+        queue_size = (
+            app_settings.MAX_CONCURRENT_SENDERS * app_settings.SENDER_CONCURRENCY
+        )
+        self.queue = {key: mp.Queue(maxsize=queue_size) for key in CAMPAIGN_TYPE.keys()}
+
+        # used by campaign managers processes to queue messages to send, which are moved
+        # to the queue of sender processes according to the priorities of campaigns
+        self.dispatchers = {
+            key: CampaignDispatcher(self.queue[key], queue_size=queue_size)
             for key in CAMPAIGN_TYPE.keys()
         }
 
@@ -572,14 +2036,27 @@ Current sending rate: %(sending_rate)s"""
         self.senders_quit_event = mp.Event()
 
         # used by email senders to make sure they're not going over the max rate
-        self.rate_limiter = TokenBucket(
-            max=app_settings.MAX_CONCURRENT_SENDERS * 2,
+        self.rate_limiter = import_string(app_settings.RATE_LIMITER_BACKEND)(
+            max=app_settings.MAX_CONCURRENT_SENDERS
+            * app_settings.SENDER_CONCURRENCY
+            * 2,
             rate=app_settings.MAX_SENDING_RATE,
         )
 
+        # used by email senders to enforce the sending rates of some recipient domains
+        self.domain_rate_limiters = {
+            domain: AdaptiveTokenBucket(max=max(rate, 1), rate=rate)
+            for domain, rate in app_settings.DOMAIN_SENDING_RATES.items()
+        }
+
         # allow us to measure the sending speed
         self.rate_meter = RateMeter(0.3, 0.5)
 
+        # allow us to measure how often email senders connect to the mail service, and
+        # how long it takes them to send a message
+        self.connection_meter = RateMeter(0.3, 60)
+        self.latency_meter = LatencyMeter(0.05)
+
         # used by the main process to monitor the sender processes
         self.sender_processes: Dict[str, List[mp.Process]] = {
             key: [] for key in CAMPAIGN_TYPE.keys()
@@ -590,11 +2067,18 @@ Current sending rate: %(sending_rate)s"""
             key: [] for key in CAMPAIGN_TYPE.keys()
         }
 
-        # used by the main process to monitor campaign managers and tell them to quit
+        # used by the main process to monitor campaign managers and tell them to quit,
+        # by campaign id and shard index
         self.campaign_manager_processes: Dict[
-            str, Dict[int, Tuple[mp.Process, mp.Event]]
+            str, Dict[int, Dict[int, Tuple[mp.Process, mp.Event]]]
         ] = {key: {} for key in CAMPAIGN_TYPE.keys()}
 
+        # used to wake up the main process when campaigns change
+        self.wakeup_listener = None
+        # earliest start date of the campaigns being sent which have not started yet,
+        # by campaign type, so that notified workers do not start them late
+        self.next_start_dates = {key: None for key in CAMPAIGN_TYPE.keys()}
+
         self._setup_signals()
         self.run_loop(campaign_types)
 
@@ -622,38 +2106,62 @@ Current sending rate: %(sending_rate)s"""
             values = {
                 "campaign_type": campaign_type.upper(),
                 "queue_size": self.queue[campaign_type].qsize(),
+                "campaign_queues": self.dispatchers[campaign_type].queue_sizes(),
                 "sender_processes": [
                     process.pid for process in self.sender_processes[campaign_type]
                 ],
                 "campaign_managers": [
                     process.pid
-                    for process, _ in self.campaign_manager_processes[
+                    for shards in self.campaign_manager_processes[
                         campaign_type
                     ].values()
+                    for process, _ in shards.values()
                 ],
                 "bucket_capacity": self.rate_limiter.peek(),
+                "effective_rate": self.rate_limiter.current_rate(),
                 "sending_rate": self.rate_meter.current_rate(),
+                "connection_rate": round(self.connection_meter.current_rate() * 60, 2),
+                "sending_latency": round(
+                    self.latency_meter.current_latency() * 1000, 1
+                ),
             }
-            self.stderr.write(self.STATS_MESSAGE % values, ending="\n\n")
+            message = self.STATS_MESSAGE % values
+            if campaign_type == CAMPAIGN_TYPE_EMAIL and self.domain_rate_limiters:
+                message += "\n" + _("Domain rate limits: %(domain_rates)s") % {
+                    "domain_rates": {
+                        domain: round(rate_limiter.current_rate(), 2)
+                        for domain, rate_limiter in self.domain_rate_limiters.items()
+                    }
+                }
+            self.stderr.write(message, ending="\n\n")
 
     def start_sender_processes(self, campaign_type):
         sender_processes = self.sender_processes[campaign_type]
         queue = self.queue[campaign_type]
 
+        sender_process = CAMPAIGN_TYPE[campaign_type]["sender_process"]
+        if (
+            app_settings.SENDER_CONCURRENCY > 1
+            and CAMPAIGN_TYPE[campaign_type]["async_sender_process"]
+        ):
+            sender_process = CAMPAIGN_TYPE[campaign_type]["async_sender_process"]
+
         for i in range(app_settings.MAX_CONCURRENT_SENDERS - len(sender_processes)):
             if i == 0:
                 logger.info(f"\n{campaign_type.upper()}:")
             recv_conn, send_conn = mp.Pipe(duplex=False)
-            process = mp.Process(
-                target=CAMPAIGN_TYPE[campaign_type]["sender_process"],
-                kwargs={
-                    "queue": queue,
-                    "error_channel": send_conn,
-                    "rate_limiter": self.rate_limiter,
-                    "rate_meter": self.rate_meter,
-                    "quit_event": self.senders_quit_event,
-                },
-            )
+            kwargs = {
+                "queue": queue,
+                "error_channel": send_conn,
+                "rate_limiter": self.rate_limiter,
+                "rate_meter": self.rate_meter,
+                "quit_event": self.senders_quit_event,
+            }
+            if campaign_type == CAMPAIGN_TYPE_EMAIL:
+                kwargs["domain_rate_limiters"] = self.domain_rate_limiters
+                kwargs["connection_meter"] = self.connection_meter
+                kwargs["latency_meter"] = self.latency_meter
+            process = mp.Process(target=sender_process, kwargs=kwargs)
             process.daemon = True
 
             sender_processes.append(process)
@@ -669,17 +2177,42 @@ Current sending rate: %(sending_rate)s"""
                 % {"process_pid": process.pid, "campaign_type": campaign_type}
             )
 
+    def renew_leases(self, campaign_type):
+        if not CAMPAIGN_TYPE[campaign_type]["sharded"]:
+            return
+
+        campaign_manager_process = self.campaign_manager_processes[campaign_type]
+        CampaignShard.objects.renew(self.worker_id, app_settings.SHARD_LEASE_DURATION)
+
+        # leases which expired before being renewed may have been taken by other workers
+        lost_shards = CampaignShard.objects.filter(
+            campaign_id__in=campaign_manager_process
+        ).exclude(lease_owner=self.worker_id)
+        for shard in lost_shards:
+            process_and_event = campaign_manager_process[shard.campaign_id].get(
+                shard.index
+            )
+            if process_and_event and not process_and_event[1].is_set():
+                logger.warning(
+                    _("Lease lost on %(shard)s, stopping its campaign manager...")
+                    % {"shard": repr(shard)}
+                )
+                process_and_event[1].set()
+
     def check_campaigns(self, campaign_type):
         CampaignModel = CAMPAIGN_TYPE[campaign_type]["CampaignModel"]
         campaigns = CampaignModel.objects.outbox()
+        if self.wakeup_listener is not None:
+            self.next_start_dates[
+                campaign_type
+            ] = CampaignModel.objects.next_start_date()
         campaign_manager_process = self.campaign_manager_processes[campaign_type]
-        queue = self.queue[campaign_type]
+        dispatcher = self.dispatchers[campaign_type]
 
         for campaign in campaigns:
-            if (
-                campaign.status == CampaignModel.STATUS_WAITING
-                and campaign.id in campaign_manager_process
-            ):
+            shard_processes = campaign_manager_process.get(campaign.id, {})
+
+            if campaign.status == CampaignModel.STATUS_WAITING and shard_processes:
                 # we need to cancel that task
                 logger.info(
                     _(
@@ -687,24 +2220,45 @@ Current sending rate: %(sending_rate)s"""
                     )
                     % {"campaign_id": campaign.id, "campaign_name": campaign.name[20:]}
                 )
-                _process, quit_event = campaign_manager_process[campaign.id]
-                quit_event.set()
-
-            if (
-                campaign.status == CampaignModel.STATUS_SENDING
-                and campaign.id not in campaign_manager_process
-            ):
-                quit_event = mp.Event()
+                for _process, quit_event in shard_processes.values():
+                    quit_event.set()
+
+            if campaign.status != CampaignModel.STATUS_SENDING:
+                continue
+
+            dispatcher.set_priority(campaign.id, campaign.priority)
+
+            if CAMPAIGN_TYPE[campaign_type]["sharded"]:
+                # other workers may already be taking care of some of the shards
+                shards = CampaignShard.objects.filter(
+                    id__in=[
+                        shard.id
+                        for shard in campaign.get_shards()
+                        if shard.index not in shard_processes
+                    ]
+                ).claim(self.worker_id, app_settings.SHARD_LEASE_DURATION)
+            else:
+                shards = [None]
+
+            for shard in shards:
+                shard_index = shard.index if shard else 0
+                if shard_index in shard_processes:
+                    continue
+
+                kwargs = {
+                    "campaign": campaign,
+                    "queue": dispatcher.add_campaign(campaign.id, campaign.priority),
+                }
+                if shard:
+                    kwargs["shard"] = shard
+                quit_event = kwargs["quit_event"] = mp.Event()
                 process = mp.Process(
                     target=CAMPAIGN_TYPE[campaign_type]["manager_process"],
-                    kwargs={
-                        "campaign": campaign,
-                        "queue": queue,
-                        "quit_event": quit_event,
-                    },
+                    kwargs=kwargs,
                 )
                 process.daemon = True
-                campaign_manager_process[campaign.id] = (process, quit_event)
+                shard_processes[shard_index] = (process, quit_event)
+                campaign_manager_process[campaign.id] = shard_processes
                 # let's close SQL connection to make sure it is not shared with children
                 connection.close()
                 with self._setup_signal_handlers_for_children():
@@ -716,10 +2270,56 @@ Current sending rate: %(sending_rate)s"""
                     % {
                         "campaign_type": campaign_type,
                         "process_pid": process.pid,
-                        "campaign": repr(campaign),
+                        "campaign": repr(shard or campaign),
                     }
                 )
 
+    @property
+    def polling_interval(self):
+        if self.wakeup_listener is None:
+            return app_settings.POLLING_INTERVAL
+        # leases must still be renewed well before they expire
+        interval = min(
+            app_settings.NOTIFIED_POLLING_INTERVAL,
+            app_settings.SHARD_LEASE_DURATION / 3,
+        )
+        # no notification is sent when a scheduled campaign reaches its start date
+        next_start_date = min(
+            (date for date in self.next_start_dates.values() if date is not None),
+            default=None,
+        )
+        if next_start_date is not None:
+            interval = min(
+                interval, max((next_start_date - timezone.now()).total_seconds(), 0)
+            )
+        return interval
+
+    def listen_to_wakeups(self):
+        """Open the wakeup listener if needed, and consume received notifications
+
+        Notifications are only consumed before checking the campaigns of all types, so
+        that the main process does not wait again while some campaign types have not
+        been checked since the last notification.
+        """
+        try:
+            if self.wakeup_listener is None:
+                self.wakeup_listener = get_wakeup_listener()
+            else:
+                self.wakeup_listener.drain()
+        except Exception:
+            logger.exception(
+                _("Error with the wakeup listener, falling back to polling...")
+            )
+            self.close_wakeup_listener()
+
+    def close_wakeup_listener(self):
+        if self.wakeup_listener is not None:
+            try:
+                self.wakeup_listener.close()
+            except Exception:
+                pass
+            self.wakeup_listener = None
+
     def monitor_processes(self, campaign_type):
         CampaignModel = CAMPAIGN_TYPE[campaign_type]["CampaignModel"]
         sender_processes = self.sender_processes[campaign_type]
@@ -728,12 +2328,17 @@ Current sending rate: %(sending_rate)s"""
 
         sender_sentinels = [p.sentinel for p in sender_processes]
         campaign_manager_sentinels = {
-            p.sentinel: c_id for c_id, (p, _e) in campaign_manager_process.items()
+            p.sentinel: (c_id, shard_index)
+            for c_id, shards in campaign_manager_process.items()
+            for shard_index, (p, _e) in shards.items()
         }
 
+        # a notification wakes the main process up so that campaigns are checked again
+        wakeup = [self.wakeup_listener] if self.wakeup_listener else []
+
         events = mpc.wait(
-            sender_sentinels + list(campaign_manager_sentinels) + sender_pipes,
-            timeout=app_settings.POLLING_INTERVAL,
+            sender_sentinels + list(campaign_manager_sentinels) + sender_pipes + wakeup,
+            timeout=self.polling_interval,
         )
 
         stopped_senders = []
@@ -765,8 +2370,8 @@ Current sending rate: %(sending_rate)s"""
             del sender_processes[i]
             del sender_pipes[i]
 
-        for campaign_id in sorted(stopped_campaign_managers):
-            process, _quit_event = campaign_manager_process[campaign_id]
+        for campaign_id, shard_index in sorted(stopped_campaign_managers):
+            process, _quit_event = campaign_manager_process[campaign_id][shard_index]
             pid = process.pid
             # let's reap process to avoid zombies
             process.join()
@@ -777,7 +2382,10 @@ Current sending rate: %(sending_rate)s"""
                 # the campaign has most likely be deleted
                 campaign = None
 
-            if campaign and campaign.status != CampaignModel.STATUS_SENDING:
+            # the campaign is still sending when other shards have not finished yet
+            if campaign and (
+                campaign.status != CampaignModel.STATUS_SENDING or process.exitcode == 0
+            ):
                 # process was asked to stop and did so correctly
                 logger.info(
                     _(
@@ -795,7 +2403,15 @@ Current sending rate: %(sending_rate)s"""
                     exc_info=True,
                 )
 
-            del campaign_manager_process[campaign_id]
+            if CAMPAIGN_TYPE[campaign_type]["sharded"]:
+                CampaignShard.objects.filter(
+                    campaign_id=campaign_id, index=shard_index
+                ).release(self.worker_id)
+
+            del campaign_manager_process[campaign_id][shard_index]
+            if not campaign_manager_process[campaign_id]:
+                del campaign_manager_process[campaign_id]
+                self.dispatchers[campaign_type].remove_campaign(campaign_id)
 
         for campaign_id in campaign_errors:
             CampaignModel.objects.filter(id=campaign_id).update(
@@ -808,13 +2424,21 @@ Current sending rate: %(sending_rate)s"""
                     )
                     % {"campaign_id": campaign_id}
                 )
-                campaign_manager_process[campaign_id][1].set()
+                for _process, quit_event in campaign_manager_process[
+                    campaign_id
+                ].values():
+                    quit_event.set()
 
     def run_loop(self, campaign_types):
+        for campaign_type in campaign_types:
+            self.dispatchers[campaign_type].start()
+
         try:
             while True:
+                self.listen_to_wakeups()
                 for campaign_type in campaign_types:
                     self.start_sender_processes(campaign_type)
+                    self.renew_leases(campaign_type)
                     self.check_campaigns(campaign_type)
                     self.monitor_processes(campaign_type)
 
@@ -823,10 +2447,10 @@ Current sending rate: %(sending_rate)s"""
             self.senders_quit_event.set()
 
             for campaign_type in campaign_types:
-                for _proces, event in self.campaign_manager_processes[
-                    campaign_type
-                ].values():
-                    event.set()
+                self.dispatchers[campaign_type].drain()
+                for shards in self.campaign_manager_processes[campaign_type].values():
+                    for _process, event in shards.values():
+                        event.set()
 
             logger.info(_("Waiting for all subprocesses to gracefully exit..."))
             # active_children joins children so removes zombies
@@ -837,10 +2461,18 @@ Current sending rate: %(sending_rate)s"""
                         [p.sentinel for p in sender_processes]
                         + [
                             p.sentinel
-                            for p, _e in self.campaign_manager_processes[
+                            for shards in self.campaign_manager_processes[
                                 campaign_type
                             ].values()
+                            for p, _e in shards.values()
                         ]
                     )
 
+            for campaign_type in campaign_types:
+                self.dispatchers[campaign_type].stop()
+
+            self.close_wakeup_listener()
+
+            # other workers may take over the shards right away
+            CampaignShard.objects.release(self.worker_id)
             logger.info(_("All subprocesses have exited!"))
@@ -1,20 +1,33 @@
+import pickle
 import re
+import struct
+from functools import partial
 from itertools import count
+from multiprocessing.shared_memory import SharedMemory
+from secrets import token_hex
 from urllib.parse import quote as url_quote
 
 from django.core.mail import EmailMultiAlternatives, EmailMessage
-from django.template import Context
+from django.template import Context, Template
+from django.template.base import TextNode, VariableNode
 from django.urls import reverse
 from html import unescape, escape
 
 from nuntius import app_settings
 from nuntius.utils.messages import sign_url, extend_query
+from nuntius.utils.mime import MessageSkeleton, PreEncodedMessage
 
 RE_URL = re.compile(
     r"(?P<prefix><a[^>]* href\s*=[\s\"']*)(?P<url>http[^\"'>\s]+)",
     flags=re.MULTILINE | re.IGNORECASE,
 )
 
+# links whose URL is (partly) generated by the template cannot be tracked before rendering
+RE_TEMPLATED_URL = re.compile(
+    r"<a[^>]* href\s*=[\s\"']*[^\"'>\s]*{[{%]",
+    flags=re.MULTILINE | re.IGNORECASE,
+)
+
 
 def insert_tracking_image_template(html_message, tracking_id):
     # use old style formatting to avoid ugly escaping of template variable
@@ -39,6 +52,7 @@ def make_tracking_url(url, campaign, tracking_id, link_index):
     relative_url = reverse(
         "nuntius_track_click",
         kwargs={
+            "campaign_id": campaign.id,
             "tracking_id": tracking_id,
             "signature": sign_url(campaign, url),
             "link": url_quote(url, safe=""),
@@ -69,6 +83,258 @@ def add_tracking_information(html_body: str, campaign, tracking_id):
     )
 
 
+class RenderPlan:
+    """
+    Precompiled HTML body of a campaign, with tracking information already inserted
+
+    The HTML content is parsed and the tracking links are generated once for the whole
+    campaign. The body is then a sequence of static chunks, template variable slots and
+    tracking id slots, and rendering the message of a specific subscriber only requires
+    rendering the variables and inserting the tracking id.
+    """
+
+    TRACKING_ID = object()
+
+    def __init__(self, template, parts):
+        self.template = template
+        self.parts = parts
+
+        # static chunks around the variable and tracking id slots
+        self.fragments = [""]
+        for part in parts:
+            if isinstance(part, str):
+                self.fragments[-1] += part
+            else:
+                self.fragments.append("")
+
+    @classmethod
+    def for_campaign(cls, campaign):
+        """Compile the render plan of a campaign HTML content
+
+        :param campaign: the campaign for which the plan must be compiled
+        :type campaign: class:`nuntius.models.Campaign`
+        :return: the render plan, or None if the HTML content uses template features (tags, comments, links
+            depending on variables...) that make it impossible to insert tracking information before rendering.
+        :rtype: class:`nuntius.messages.RenderPlan`
+        """
+        html = campaign.message_content_html
+
+        if "{#" in html or RE_TEMPLATED_URL.search(html):
+            return None
+
+        placeholder = f"trackingid{token_hex(8)}"
+        template = Template(add_tracking_information(html, campaign, placeholder))
+
+        parts = []
+        for node in template.nodelist:
+            if isinstance(node, TextNode):
+                chunks = node.s.split(placeholder)
+                parts.append(chunks[0])
+                for chunk in chunks[1:]:
+                    parts.extend([cls.TRACKING_ID, chunk])
+            elif isinstance(node, VariableNode) and not any(
+                func.__name__ in ("safe", "safeseq")
+                for func, _args in node.filter_expression.filters
+            ):
+                parts.append(node)
+            else:
+                return None
+
+        return cls(template, [part for part in parts if part != ""])
+
+    def _substitutions(self, context, tracking_id):
+        substitutions = []
+
+        for part in self.parts:
+            if part is self.TRACKING_ID:
+                substitutions.append(tracking_id)
+            elif not isinstance(part, str):
+                value = part.render(context)
+                # the variable value has not been escaped and may contain links or tags
+                if "<" in value:
+                    return None
+                substitutions.append(value)
+
+        return substitutions
+
+    def substitutions(self, context, tracking_id):
+        """Render the values of the slots of the HTML body for a specific subscriber
+
+        :param context: the template context with the subscriber data
+        :type context: class:`django.template.Context`
+        :param tracking_id: the tracking id of the sent event
+        :type tracking_id: class:`str`
+        :return: the values to insert between the fragments of the plan, or None if the
+            plan could not be used with this context
+        :rtype: class:`list`
+        """
+        with context.render_context.push_state(self.template):
+            if context.template is None:
+                with context.bind_template(self.template):
+                    context.template_name = self.template.name
+                    return self._substitutions(context, tracking_id)
+            else:
+                return self._substitutions(context, tracking_id)
+
+    def render(self, context, tracking_id):
+        """Render the HTML body with tracking information for a specific subscriber
+
+        :param context: the template context with the subscriber data
+        :type context: class:`django.template.Context`
+        :param tracking_id: the tracking id of the sent event
+        :type tracking_id: class:`str`
+        :return: the HTML body, or None if the plan could not be used with this context
+        :rtype: class:`str`
+        """
+        substitutions = self.substitutions(context, tracking_id)
+        if substitutions is None:
+            return None
+        return assemble_fragments(self.fragments, substitutions)
+
+
+def assemble_fragments(fragments, substitutions):
+    """Insert the substitutions between the static fragments of a render plan"""
+    rendered = [fragments[0]]
+    for substitution, fragment in zip(substitutions, fragments[1:]):
+        rendered.append(substitution)
+        rendered.append(fragment)
+    return "".join(rendered)
+
+
+class RenderCache:
+    """
+    Static parts of the messages of a campaign, shared between processes
+
+    The campaign manager publishes the cache in a shared memory segment, and only puts
+    the substitutions of each subscriber on the work queue: sender processes attach the
+    segment once and assemble the messages themselves, instead of unpickling a complete
+    copy of the HTML body with every message.
+    """
+
+    # the segment starts with the length of the pickled cache
+    HEADER = struct.Struct("<Q")
+
+    def __init__(
+        self, campaign_id, campaign_updated, subject, from_email, reply_to, fragments
+    ):
+        self.campaign_id = campaign_id
+        self.campaign_updated = campaign_updated
+        self.subject = subject
+        self.from_email = from_email
+        self.reply_to = reply_to
+        self.fragments = fragments
+        self.skeleton = MessageSkeleton(subject, from_email, reply_to, fragments)
+
+    @classmethod
+    def for_campaign(cls, campaign):
+        """Create the render cache of a campaign
+
+        :param campaign: the campaign for which the cache must be created
+        :type campaign: class:`nuntius.models.Campaign`
+        :return: the render cache, or None if the campaign has no render plan
+        :rtype: class:`nuntius.messages.RenderCache`
+        """
+        if campaign.html_render_plan is None:
+            return None
+        return cls(
+            campaign.id,
+            campaign.updated,
+            campaign.message_subject,
+            campaign.from_header,
+            campaign.reply_to_header,
+            campaign.html_render_plan.fragments,
+        )
+
+    def publish(self):
+        """Copy the cache to a new shared memory segment
+
+        The caller is responsible for closing and unlinking the segment once the
+        messages of the campaign have been sent.
+
+        :rtype: class:`multiprocessing.shared_memory.SharedMemory`
+        """
+        data = pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+        segment = SharedMemory(create=True, size=self.HEADER.size + len(data))
+        self.HEADER.pack_into(segment.buf, 0, len(data))
+        segment.buf[self.HEADER.size : self.HEADER.size + len(data)] = data
+        return segment
+
+    @classmethod
+    def attach(cls, name):
+        """Load the cache published in a shared memory segment
+
+        :param name: the name of the segment
+        :type name: class:`str`
+        :raises FileNotFoundError: if the segment has already been unlinked
+        :rtype: class:`nuntius.messages.RenderCache`
+        """
+        try:
+            # the segment belongs to the campaign manager which created it
+            segment = SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13
+            segment = SharedMemory(name=name)
+        try:
+            (size,) = cls.HEADER.unpack_from(segment.buf, 0)
+            with segment.buf[cls.HEADER.size : cls.HEADER.size + size] as data:
+                return pickle.loads(data)
+        finally:
+            segment.close()
+
+    def message(self, email, substitutions, text_body):
+        """Assemble the message of a subscriber
+
+        :param email: the email address of the subscriber
+        :type email: class:`str`
+        :param substitutions: the values returned by :meth:`RenderPlan.substitutions`
+        :type substitutions: class:`list`
+        :param text_body: the rendered text body
+        :type text_body: class:`str`
+        :rtype: class:`django.core.mail.message.EmailMessage`
+        """
+        return build_message(
+            subject=self.subject,
+            from_email=self.from_email,
+            reply_to=self.reply_to,
+            email=email,
+            text_body=text_body,
+            html_body=assemble_fragments(self.fragments, substitutions),
+            message_class=partial(
+                PreEncodedMessage, skeleton=self.skeleton, substitutions=substitutions
+            ),
+        )
+
+
+def build_message(
+    *, subject, from_email, reply_to, email, text_body, html_body, message_class=None
+):
+    """Create the email message with the given headers and rendered bodies
+
+    :param message_class: the class of the message, defaults to
+        :class:`django.core.mail.EmailMultiAlternatives` if there is both a text and an
+        HTML body, or :class:`django.core.mail.EmailMessage` otherwise
+    """
+    if message_class is None:
+        message_class = (
+            EmailMultiAlternatives if (text_body and html_body) else EmailMessage
+        )
+
+    message = message_class(
+        subject=subject,
+        body=text_body or html_body,
+        from_email=from_email,
+        to=[email],
+        reply_to=[reply_to] if reply_to is not None else None,
+    )
+
+    if text_body and html_body:
+        message.attach_alternative(html_body, "text/html")
+    elif html_body:
+        message.content_subtype = "html"
+
+    return message
+
+
 def message_for_event(sent_event):
     """Generate an email message corresponding to a CampaignSentEvent instance
 
@@ -84,30 +350,24 @@ def message_for_event(sent_event):
 
     subscriber_data = Context(subscriber.get_subscriber_data())
 
-    html_body = add_tracking_information(
-        campaign.html_template.render(context=subscriber_data),
-        campaign,
-        sent_event.tracking_id,
-    )
+    html_body = None
+    if campaign.html_render_plan is not None:
+        html_body = campaign.html_render_plan.render(
+            subscriber_data, sent_event.tracking_id
+        )
+    if html_body is None:
+        html_body = add_tracking_information(
+            campaign.html_template.render(context=subscriber_data),
+            campaign,
+            sent_event.tracking_id,
+        )
     text_body = campaign.text_template.render(context=subscriber_data)
 
-    message_class = (
-        EmailMultiAlternatives if (text_body and html_body) else EmailMessage
-    )
-
-    message = message_class(
+    return build_message(
         subject=campaign.message_subject,
-        body=text_body or html_body,
         from_email=campaign.from_header,
-        to=[email],
-        reply_to=[campaign.reply_to_header]
-        if campaign.reply_to_header is not None
-        else None,
+        reply_to=campaign.reply_to_header,
+        email=email,
+        text_body=text_body,
+        html_body=html_body,
     )
-
-    if text_body and html_body:
-        message.attach_alternative(html_body, "text/html")
-    elif html_body:
-        message.content_subtype = "html"
-
-    return message
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("nuntius", "0024_alter_mosaicoimage_file"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CampaignStats",
+            fields=[
+                (
+                    "campaign",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to="nuntius.campaign",
+                        verbose_name="Campaign",
+                    ),
+                ),
+                (
+                    "sent_count",
+                    models.IntegerField(default=0, verbose_name="Sent count"),
+                ),
+                ("ok_count", models.IntegerField(default=0, verbose_name="Ok count")),
+                (
+                    "bounced_count",
+                    models.IntegerField(default=0, verbose_name="Bounced count"),
+                ),
+                (
+                    "complained_count",
+                    models.IntegerField(default=0, verbose_name="Complained count"),
+                ),
+                (
+                    "blocked_count",
+                    models.IntegerField(default=0, verbose_name="Blocked count"),
+                ),
+                (
+                    "open_count",
+                    models.IntegerField(default=0, verbose_name="Open count"),
+                ),
+                (
+                    "unique_open_count",
+                    models.IntegerField(default=0, verbose_name="Unique open count"),
+                ),
+                (
+                    "click_count",
+                    models.IntegerField(default=0, verbose_name="Click count"),
+                ),
+                (
+                    "unique_click_count",
+                    models.IntegerField(default=0, verbose_name="Unique click count"),
+                ),
+            ],
+            options={
+                "verbose_name": "campaign statistics",
+                "verbose_name_plural": "campaign statistics",
+            },
+        ),
+    ]
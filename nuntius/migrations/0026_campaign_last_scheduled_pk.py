@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("nuntius", "0025_campaignstats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="campaign",
+            name="last_scheduled_pk",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=255,
+                null=True,
+                verbose_name="Last scheduled subscriber",
+            ),
+        ),
+    ]
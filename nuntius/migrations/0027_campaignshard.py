@@ -0,0 +1,77 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def move_checkpoints_to_shards(apps, schema_editor):
+    Campaign = apps.get_model("nuntius", "Campaign")
+    CampaignShard = apps.get_model("nuntius", "CampaignShard")
+    db_alias = schema_editor.connection.alias
+    CampaignShard.objects.using(db_alias).bulk_create(
+        [
+            CampaignShard(
+                campaign_id=campaign_id, index=0, count=1, last_scheduled_pk=checkpoint
+            )
+            for campaign_id, checkpoint in Campaign.objects.using(db_alias)
+            .filter(last_scheduled_pk__isnull=False)
+            .values_list("id", "last_scheduled_pk")
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("nuntius", "0026_campaign_last_scheduled_pk"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CampaignShard",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("index", models.PositiveIntegerField(verbose_name="Index")),
+                ("count", models.PositiveIntegerField(verbose_name="Number of shards")),
+                (
+                    "last_scheduled_pk",
+                    models.CharField(
+                        blank=True,
+                        max_length=255,
+                        null=True,
+                        verbose_name="Last scheduled subscriber",
+                    ),
+                ),
+                (
+                    "finished",
+                    models.BooleanField(default=False, verbose_name="Finished"),
+                ),
+                (
+                    "campaign",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shards",
+                        to="nuntius.campaign",
+                        verbose_name="Campaign",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "campaign shard",
+                "verbose_name_plural": "campaign shards",
+                "unique_together": {("campaign", "index")},
+            },
+        ),
+        migrations.RunPython(move_checkpoints_to_shards, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="campaign",
+            name="last_scheduled_pk",
+        ),
+    ]
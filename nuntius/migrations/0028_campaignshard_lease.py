@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("nuntius", "0027_campaignshard"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="campaignshard",
+            name="lease_expires",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Lease expiration"
+            ),
+        ),
+        migrations.AddField(
+            model_name="campaignshard",
+            name="lease_owner",
+            field=models.CharField(
+                blank=True, max_length=255, null=True, verbose_name="Lease owner"
+            ),
+        ),
+    ]
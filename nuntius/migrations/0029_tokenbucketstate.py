@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("nuntius", "0028_campaignshard_lease"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TokenBucketState",
+            fields=[
+                (
+                    "name",
+                    models.CharField(
+                        max_length=255,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Name",
+                    ),
+                ),
+                ("tokens", models.FloatField(verbose_name="Tokens")),
+                ("updated", models.FloatField(verbose_name="Last update")),
+            ],
+            options={
+                "verbose_name": "token bucket",
+                "verbose_name_plural": "token buckets",
+            },
+        ),
+    ]
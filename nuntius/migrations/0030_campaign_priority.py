@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:07
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("nuntius", "0029_tokenbucketstate"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="campaign",
+            name="priority",
+            field=models.PositiveSmallIntegerField(
+                default=1,
+                help_text="Campaigns sent at the same time share the sending capacity in proportion to their priority, unless the worker is configured to send campaigns with a higher priority first.",
+                validators=[django.core.validators.MinValueValidator(1)],
+                verbose_name="Priority",
+            ),
+        ),
+        migrations.AddField(
+            model_name="pushcampaign",
+            name="priority",
+            field=models.PositiveSmallIntegerField(
+                default=1,
+                help_text="Campaigns sent at the same time share the sending capacity in proportion to their priority, unless the worker is configured to send campaigns with a higher priority first.",
+                validators=[django.core.validators.MinValueValidator(1)],
+                verbose_name="Priority",
+            ),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("nuntius", "0030_campaign_priority"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BounceState",
+            fields=[
+                (
+                    "email",
+                    models.EmailField(
+                        max_length=254,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Email address",
+                    ),
+                ),
+                (
+                    "last_success",
+                    models.DateTimeField(
+                        null=True, verbose_name="Last successful sending"
+                    ),
+                ),
+                ("bounces", models.JSONField(default=list, verbose_name="Bounces")),
+            ],
+            options={
+                "verbose_name": "bounce state",
+                "verbose_name_plural": "bounce states",
+            },
+        ),
+    ]
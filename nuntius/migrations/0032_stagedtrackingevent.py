@@ -0,0 +1,63 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("nuntius", "0031_bouncestate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StagedTrackingEvent",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "esp_message_id",
+                    models.CharField(
+                        max_length=255, verbose_name="ID given by the sending server"
+                    ),
+                ),
+                (
+                    "email",
+                    models.EmailField(max_length=254, verbose_name="Email address"),
+                ),
+                (
+                    "event_type",
+                    models.CharField(max_length=20, verbose_name="Event type"),
+                ),
+                (
+                    "result",
+                    models.CharField(
+                        choices=[
+                            ("P", "Sending"),
+                            ("?", "Unknown"),
+                            ("RE", "Rejected by server"),
+                            ("OK", "Sent"),
+                            ("BC", "Bounced"),
+                            ("C", "Complained"),
+                            ("U", "Unsubscribed"),
+                            ("BL", "Blocked temporarily"),
+                            ("E", "Error"),
+                        ],
+                        max_length=2,
+                        null=True,
+                        verbose_name="Operation result",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "staged tracking event",
+                "verbose_name_plural": "staged tracking events",
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("nuntius", "0032_stagedtrackingevent"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="campaignsentevent",
+            name="result",
+            field=models.CharField(
+                choices=[
+                    ("P", "Sending"),
+                    ("IF", "Handed to a sender"),
+                    ("?", "Unknown"),
+                    ("RE", "Rejected by server"),
+                    ("OK", "Sent"),
+                    ("BC", "Bounced"),
+                    ("C", "Complained"),
+                    ("U", "Unsubscribed"),
+                    ("BL", "Blocked temporarily"),
+                    ("E", "Error"),
+                ],
+                default="P",
+                max_length=2,
+                verbose_name="Operation result",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="stagedtrackingevent",
+            name="result",
+            field=models.CharField(
+                choices=[
+                    ("P", "Sending"),
+                    ("IF", "Handed to a sender"),
+                    ("?", "Unknown"),
+                    ("RE", "Rejected by server"),
+                    ("OK", "Sent"),
+                    ("BC", "Bounced"),
+                    ("C", "Complained"),
+                    ("U", "Unsubscribed"),
+                    ("BL", "Blocked temporarily"),
+                    ("E", "Error"),
+                ],
+                max_length=2,
+                null=True,
+                verbose_name="Operation result",
+            ),
+        ),
+    ]
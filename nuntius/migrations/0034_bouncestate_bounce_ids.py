@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def add_sent_event_ids(apps, schema_editor):
+    BounceState = apps.get_model("nuntius", "BounceState")
+    CampaignSentEvent = apps.get_model("nuntius", "CampaignSentEvent")
+    for state in BounceState.objects.iterator():
+        bounces = (
+            CampaignSentEvent.objects.filter(email=state.email, result="BC")
+            .order_by("-datetime")
+            .values_list("id", "datetime")[: len(state.bounces)]
+        )
+        state.bounces = [
+            [sent_event_id, bounced_at.timestamp()]
+            for sent_event_id, bounced_at in reversed(bounces)
+        ]
+        state.save(update_fields=["bounces"])
+
+
+def remove_sent_event_ids(apps, schema_editor):
+    BounceState = apps.get_model("nuntius", "BounceState")
+    for state in BounceState.objects.iterator():
+        state.bounces = [bounced_at for _, bounced_at in state.bounces]
+        state.save(update_fields=["bounces"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("nuntius", "0033_campaignsentevent_in_flight"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_sent_event_ids, remove_sent_event_ids),
+    ]
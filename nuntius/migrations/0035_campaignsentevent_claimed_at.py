@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("nuntius", "0034_bouncestate_bounce_ids"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="campaignsentevent",
+            name="claimed_at",
+            field=models.DateTimeField(
+                editable=False, null=True, verbose_name="Handed to a sender at"
+            ),
+        ),
+    ]
@@ -1,3 +1,4 @@
 from .subscriber import *
 from .email_campaigns import *
 from .push_campaigns import *
+from .workers import *
@@ -1,15 +1,19 @@
 import re
+from collections import Counter
+from datetime import timedelta
 from secrets import token_urlsafe
 
-from django.db import models
-from django.db.models import fields, Sum, Value
-from django.db.models.functions import Coalesce
+from django.db import models, transaction
+from django.db.models import fields, Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Mod
 from django.template import Template
+from django.utils import timezone
 from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 from stdimage import StdImageField
 
 from nuntius import app_settings
+from nuntius.messages import RenderPlan
 from nuntius.models.mixins import AbstractCampaign
 from nuntius.utils.messages import generate_plain_text
 
@@ -37,64 +41,90 @@ class Campaign(AbstractCampaign):
             self.message_content_text = generate_plain_text(self.message_content_html)
         super().save(*args, **kwargs)
 
+    def get_campaign_stats(self):
+        """Return the statistics of the campaign, computing them if they do not exist yet
+
+        :rtype: class:`nuntius.models.CampaignStats`
+        """
+        try:
+            return CampaignStats.objects.get(campaign=self)
+        except CampaignStats.DoesNotExist:
+            return CampaignStats.rebuild(self)
+
+    def get_shards(self, count=None):
+        """Return the shards of the campaign, creating them if they do not exist yet
+
+        Subscribers may only be split between several shards when their primary key is
+        an integer. Shards are not created again for a campaign which has been sent in
+        the meantime, e.g. by another worker finishing its last shard, since its shards
+        have just been deleted.
+
+        :param count: the number of shards to create, defaults to
+            `nuntius.app_settings.CAMPAIGN_MANAGER_SHARDS`
+        :type count: class:`int`
+        :rtype: class:`list` of class:`nuntius.models.CampaignShard`
+        """
+        if count is None:
+            count = app_settings.CAMPAIGN_MANAGER_SHARDS
+
+        subscriber_model = CampaignSentEvent._meta.get_field("subscriber").related_model
+        if not isinstance(subscriber_model._meta.pk, fields.IntegerField):
+            count = 1
+
+        shards = list(self.shards.order_by("index"))
+        if shards:
+            return shards
+
+        with transaction.atomic():
+            # the lock taken by `CampaignShard.finish` to mark the campaign as sent
+            status = (
+                Campaign.objects.select_for_update()
+                .values_list("status", flat=True)
+                .get(id=self.id)
+            )
+            if status == Campaign.STATUS_SENT:
+                return []
+            CampaignShard.objects.bulk_create(
+                [
+                    CampaignShard(campaign=self, index=i, count=count)
+                    for i in range(count)
+                ],
+                ignore_conflicts=True,
+            )
+            return list(self.shards.order_by("index"))
+
+    def compute_stats(self):
+        stats = self.get_campaign_stats()
+        return {
+            name: getattr(stats, f"{name}_count") for name in CampaignStats.COUNTERS
+        }
+
     def get_sent_count(self):
-        return (
-            CampaignSentEvent.objects.filter(campaign=self)
-            .exclude(result=CampaignSentStatusType.PENDING)
-            .count()
-        )
+        return self.get_stats()["sent"]
 
     def get_ok_count(self):
-        return (
-            CampaignSentEvent.objects.filter(campaign=self)
-            .filter(result=CampaignSentStatusType.OK)
-            .count()
-        )
+        return self.get_stats()["ok"]
 
     def get_bounced_count(self):
-        return (
-            CampaignSentEvent.objects.filter(campaign=self)
-            .filter(result=CampaignSentStatusType.BOUNCED)
-            .count()
-        )
+        return self.get_stats()["bounced"]
 
     def get_complained_count(self):
-        return (
-            CampaignSentEvent.objects.filter(campaign=self)
-            .filter(result=CampaignSentStatusType.COMPLAINED)
-            .count()
-        )
+        return self.get_stats()["complained"]
 
     def get_blocked_count(self):
-        return (
-            CampaignSentEvent.objects.filter(campaign=self)
-            .filter(result=CampaignSentStatusType.BLOCKED)
-            .count()
-        )
+        return self.get_stats()["blocked"]
 
     def get_open_count(self):
-        return CampaignSentEvent.objects.filter(campaign=self).aggregate(
-            count=Coalesce(Sum("open_count"), Value(0))
-        )["count"]
+        return self.get_stats()["open"]
 
     def get_unique_open_count(self):
-        return (
-            CampaignSentEvent.objects.filter(campaign=self)
-            .filter(open_count__gt=0)
-            .count()
-        )
+        return self.get_stats()["unique_open"]
 
     def get_click_count(self):
-        return CampaignSentEvent.objects.filter(campaign=self).aggregate(
-            count=Coalesce(Sum("click_count"), Value(0))
-        )["count"]
+        return self.get_stats()["click"]
 
     def get_unique_click_count(self):
-        return (
-            CampaignSentEvent.objects.filter(campaign=self)
-            .filter(click_count__gt=0)
-            .count()
-        )
+        return self.get_stats()["unique_click"]
 
     def get_event_for_subscriber(self, subscriber):
         event, _ = CampaignSentEvent.objects.get_or_create(
@@ -104,6 +134,46 @@ class Campaign(AbstractCampaign):
         )
         return event
 
+    def get_events_for_subscribers(self, subscribers):
+        """Bulk version of `get_event_for_subscriber`
+
+        Missing sent events are all created with a single query, and the sent events for
+        all subscribers are then fetched back with another one.
+
+        :param subscribers: a list of subscribers
+        :return: the list of sent events, in the same order as the subscribers
+        """
+        CampaignSentEvent.objects.bulk_create(
+            [
+                CampaignSentEvent(
+                    campaign=self,
+                    subscriber=subscriber,
+                    email=subscriber.get_subscriber_email(),
+                )
+                for subscriber in subscribers
+            ],
+            ignore_conflicts=True,
+        )
+
+        subscribers_by_id = {subscriber.pk: subscriber for subscriber in subscribers}
+        events_by_subscriber_id = {}
+        for event in (
+            CampaignSentEvent.objects.filter(
+                campaign=self, subscriber_id__in=subscribers_by_id
+            )
+            .only("id", "tracking_id", "result", "email", "campaign", "subscriber")
+            .order_by()
+        ):
+            event.campaign = self
+            event.subscriber = subscribers_by_id[event.subscriber_id]
+            events_by_subscriber_id[event.subscriber_id] = event
+
+        return [
+            events_by_subscriber_id[subscriber.pk]
+            for subscriber in subscribers_by_id.values()
+            if subscriber.pk in events_by_subscriber_id
+        ]
+
     def __repr__(self):
         return f"Campaign(id={self.id!r}, name={self.name!r})"
 
@@ -111,6 +181,10 @@ class Campaign(AbstractCampaign):
     def html_template(self):
         return Template(self.message_content_html)
 
+    @cached_property
+    def html_render_plan(self):
+        return RenderPlan.for_campaign(self)
+
     @cached_property
     def text_template(self):
         return Template(self.message_content_text)
@@ -134,8 +208,148 @@ class Campaign(AbstractCampaign):
         verbose_name_plural = _("email campaigns")
 
 
+class CampaignShardQuerySet(models.QuerySet):
+    def claimable(self, owner):
+        """Select the unfinished shards that are not held by another worker"""
+        return self.filter(
+            Q(lease_owner__isnull=True)
+            | Q(lease_expires__lt=timezone.now())
+            | Q(lease_owner=owner),
+            finished=False,
+        )
+
+    def claim(self, owner, duration):
+        """Take the lease of the selected shards that are not held by another worker
+
+        Each lease is taken with a conditional UPDATE, so that two workers may never
+        hold the same shard, whatever the database. When an expired lease is taken over,
+        the sent events of the shard claimed by the senders of the previous holder
+        before it expired are marked as pending again, so that their messages are sent.
+
+        :param owner: the identifier of the worker
+        :type owner: class:`str`
+        :param duration: the duration of the leases, in seconds
+        :type duration: class:`float`
+        :return: the claimed shards
+        :rtype: class:`list` of class:`nuntius.models.CampaignShard`
+        """
+        claimed = []
+        for shard in self.claimable(owner).order_by("campaign_id", "index"):
+            expires = timezone.now() + timedelta(seconds=duration)
+            if (
+                CampaignShard.objects.filter(pk=shard.pk)
+                .claimable(owner)
+                .update(lease_owner=owner, lease_expires=expires)
+            ):
+                if shard.lease_owner not in (None, owner):
+                    shard.sent_events().filter(
+                        Q(claimed_at__isnull=True)
+                        | Q(claimed_at__lt=shard.lease_expires),
+                        result=CampaignSentStatusType.IN_FLIGHT,
+                    ).update(result=CampaignSentStatusType.PENDING)
+                shard.lease_owner, shard.lease_expires = owner, expires
+                claimed.append(shard)
+        return claimed
+
+    def renew(self, owner, duration):
+        """Extend the leases the worker holds on the selected shards
+
+        :return: the number of renewed leases
+        """
+        return self.filter(lease_owner=owner).update(
+            lease_expires=timezone.now() + timedelta(seconds=duration)
+        )
+
+    def release(self, owner):
+        """Give up the leases the worker holds on the selected shards"""
+        return self.filter(lease_owner=owner).update(
+            lease_owner=None, lease_expires=None
+        )
+
+
+class CampaignShard(models.Model):
+    """
+    Part of the subscribers of a campaign, scheduled by its own campaign manager
+
+    Subscribers belong to the shard whose index is their primary key modulo the number of
+    shards. Shards keep the checkpoint of their campaign manager, and are deleted once all
+    of them have been fully scheduled.
+
+    When several workers share the same database, each shard is only scheduled by the
+    worker holding its lease. Leases must be renewed before they expire, otherwise the
+    shard may be taken over by another worker.
+    """
+
+    objects = CampaignShardQuerySet.as_manager()
+
+    campaign = models.ForeignKey(
+        "Campaign", models.CASCADE, related_name="shards", verbose_name=_("Campaign")
+    )
+    index = models.PositiveIntegerField(_("Index"))
+    count = models.PositiveIntegerField(_("Number of shards"))
+    # pk of the last subscriber for whom the message has been scheduled, used to resume
+    # the sending of the shard where it stopped
+    last_scheduled_pk = fields.CharField(
+        _("Last scheduled subscriber"), max_length=255, null=True, blank=True
+    )
+    finished = models.BooleanField(_("Finished"), default=False)
+    lease_owner = fields.CharField(
+        _("Lease owner"), max_length=255, null=True, blank=True
+    )
+    lease_expires = models.DateTimeField(_("Lease expiration"), null=True, blank=True)
+
+    def sent_events(self):
+        """Select the sent events of the subscribers of the shard
+
+        :rtype: class:`django.db.models.QuerySet`
+        """
+        sent_events = CampaignSentEvent.objects.filter(campaign_id=self.campaign_id)
+        if self.count > 1:
+            sent_events = sent_events.annotate(
+                shard_index=Mod("subscriber_id", self.count)
+            ).filter(shard_index=self.index)
+        return sent_events
+
+    def finish(self):
+        """Mark the shard as fully scheduled, and the campaign as sent if all are
+
+        :return: whether the campaign has been marked as sent
+        :rtype: class:`bool`
+        """
+        with transaction.atomic():
+            # the campaign row serializes the shards finishing at the same time
+            campaign = Campaign.objects.select_for_update().get(id=self.campaign_id)
+            if not CampaignShard.objects.filter(
+                id=self.id, lease_owner=self.lease_owner
+            ).update(finished=True):
+                # the shard has been taken over by another worker
+                return False
+            self.finished = True
+
+            if campaign.shards.filter(finished=False).exists():
+                return False
+
+            campaign.status = Campaign.STATUS_SENT
+            campaign.save()
+            # sending the campaign again must go through all subscribers
+            campaign.shards.all().delete()
+            return True
+
+    def __repr__(self):
+        return (
+            f"CampaignShard(campaign_id={self.campaign_id!r}, "
+            f"index={self.index!r}, count={self.count!r})"
+        )
+
+    class Meta:
+        unique_together = ("campaign", "index")
+        verbose_name = _("campaign shard")
+        verbose_name_plural = _("campaign shards")
+
+
 class CampaignSentStatusType:
     PENDING = "P"
+    IN_FLIGHT = "IF"
     UNKNOWN = "?"
     REJECTED = "RE"
     OK = "OK"
@@ -147,6 +361,7 @@ class CampaignSentStatusType:
 
     CHOICES = (
         (PENDING, _("Sending")),
+        (IN_FLIGHT, _("Handed to a sender")),
         (UNKNOWN, _("Unknown")),
         (REJECTED, _("Rejected by server")),
         (OK, _("Sent")),
@@ -157,6 +372,10 @@ class CampaignSentStatusType:
         (ERROR, _("Error")),
     )
 
+    # results of the sent events whose message has not been sent yet: `IN_FLIGHT` sent
+    # events have been claimed by the sender process about to send their message
+    UNSENT = (PENDING, IN_FLIGHT)
+
 
 class CampaignSentEvent(models.Model):
     subscriber = models.ForeignKey(
@@ -177,6 +396,10 @@ class CampaignSentEvent(models.Model):
         default=CampaignSentStatusType.PENDING,
         choices=CampaignSentStatusType.CHOICES,
     )
+    # when the message was handed to a sender, while the result is `IN_FLIGHT`
+    claimed_at = models.DateTimeField(
+        _("Handed to a sender at"), null=True, editable=False
+    )
     esp_message_id = models.CharField(
         _("ID given by the sending server"),
         unique=True,
@@ -211,6 +434,301 @@ class CampaignSentEvent(models.Model):
         ordering = ["-datetime"]
 
 
+class BounceState(models.Model):
+    """
+    Bouncing state of an email address, incrementally kept up to date
+
+    It holds what the bouncing rules of `nuntius.app_settings.BOUNCE_PARAMS` need to
+    know about the history of the address: the sending time of its last successful
+    sent event, and those of its latest bounced sent events. States are only created
+    for addresses which have bounced, from their sent events, and successful sendings
+    then only update existing states. They can be computed again from the sent events
+    with the `nuntius_rebuild_bounce_states` management command.
+
+    See func:`nuntius.actions.update_subscriber`
+    """
+
+    SUCCESSFUL_RESULTS = (CampaignSentStatusType.UNKNOWN, CampaignSentStatusType.OK)
+
+    email = models.EmailField(_("Email address"), primary_key=True)
+    last_success = models.DateTimeField(_("Last successful sending"), null=True)
+    # ids and sending times, as timestamps, of the latest bounced sent events, as
+    # `[sent_event_id, timestamp]` pairs in ascending order of sending time
+    bounces = models.JSONField(_("Bounces"), default=list)
+
+    @staticmethod
+    def max_bounces():
+        """Number of bounces that must be kept to apply the bouncing rules"""
+        params = app_settings.BOUNCE_PARAMS
+        return max(params["limit"], params["consecutive"]) + 1
+
+    @classmethod
+    def from_history(cls, email):
+        """Compute the state of an email address from its sent events
+
+        :rtype: class:`nuntius.models.BounceState`
+        """
+        events = CampaignSentEvent.objects.filter(email=email).order_by("-datetime")
+        last_success = (
+            events.filter(result__in=cls.SUCCESSFUL_RESULTS)
+            .values_list("datetime", flat=True)
+            .first()
+        )
+        bounces = events.filter(result=CampaignSentStatusType.BOUNCED).values_list(
+            "id", "datetime"
+        )[: cls.max_bounces()]
+        return cls(
+            email=email,
+            last_success=last_success,
+            bounces=[
+                [sent_event_id, bounced_at.timestamp()]
+                for sent_event_id, bounced_at in reversed(bounces)
+            ],
+        )
+
+    @classmethod
+    def record_bounce(cls, email, bounced_at, sent_event_id=None):
+        """Take into account a bounce of an email address
+
+        :param bounced_at: the sending time of the bounced sent event, which must already
+            have been saved with the `BOUNCED` result
+        :type bounced_at: class:`datetime.datetime`
+        :param sent_event_id: the id of the bounced sent event, used to count each
+            bounce once, defaults to a bounce which has never been recorded
+        :type sent_event_id: class:`int`
+        :return: the updated state
+        :rtype: class:`nuntius.models.BounceState`
+        """
+        with transaction.atomic():
+            state = cls.objects.select_for_update().filter(email=email).first()
+            if state is None:
+                history = cls.from_history(email)
+                state, created = cls.objects.select_for_update().get_or_create(
+                    email=email,
+                    defaults={
+                        "last_success": history.last_success,
+                        "bounces": history.bounces,
+                    },
+                )
+                if created:
+                    return state
+
+            if state.last_success == bounced_at:
+                # the bounced sent event was the last successful one
+                state.last_success = (
+                    CampaignSentEvent.objects.filter(
+                        email=email, result__in=cls.SUCCESSFUL_RESULTS
+                    )
+                    .order_by("-datetime")
+                    .values_list("datetime", flat=True)
+                    .first()
+                )
+            # the same bounce may be notified several times
+            if sent_event_id is None or sent_event_id not in {
+                bounced_id for bounced_id, _ in state.bounces
+            }:
+                state.bounces = sorted(
+                    [*state.bounces, [sent_event_id, bounced_at.timestamp()]],
+                    key=lambda bounce: bounce[1],
+                )[-cls.max_bounces() :]
+                state.save()
+        return state
+
+    @classmethod
+    def record_successes(cls, successes):
+        """Take into account successful sendings to email addresses which have a state
+
+        The states are updated with a single conditional UPDATE, without locking them
+        beforehand.
+
+        :param successes: the sending time of the successful sent event, by email address
+        :type successes: class:`dict`
+        """
+        if not successes:
+            return
+        sent_at = Case(
+            *(When(email=email, then=Value(at)) for email, at in successes.items()),
+            output_field=models.DateTimeField(),
+        )
+        cls.objects.filter(
+            Q(last_success__isnull=True) | Q(last_success__lt=sent_at),
+            email__in=successes,
+        ).update(last_success=sent_at)
+
+    def should_bounce(self, now):
+        """Whether the address must be considered as permanently bounced
+
+        :param now: the current time
+        :type now: class:`datetime.datetime`
+        :rtype: class:`bool`
+        """
+        # if no sending to the address has ever succeeded, we bounce forever
+        if self.last_success is None:
+            return True
+
+        params = app_settings.BOUNCE_PARAMS
+        max_bounce_duration_ago = now - timedelta(days=params["duration"])
+        recent_bounces = sum(
+            bounced_at > max_bounce_duration_ago.timestamp()
+            for _, bounced_at in self.bounces
+        )
+        # if there is a successful sending in `duration`, it is allowed up to `limit`
+        if (
+            self.last_success > max_bounce_duration_ago
+            and recent_bounces <= params["limit"]
+        ):
+            return False
+
+        # it is also ok if there are at most `consecutive` bounces since the last
+        # successful sending
+        consecutive_bounces = sum(
+            bounced_at > self.last_success.timestamp() for _, bounced_at in self.bounces
+        )
+        return consecutive_bounces > params["consecutive"]
+
+    class Meta:
+        verbose_name = _("bounce state")
+        verbose_name_plural = _("bounce states")
+
+
+class StagedTrackingEvent(models.Model):
+    """
+    Tracking event received by a webhook, waiting to be applied to its sent event
+
+    When `NUNTIUS_STAGED_TRACKING_EVENTS` is set, webhooks only store the events they
+    receive, and the `nuntius_apply_tracking_events` management command applies them
+    in batches.
+
+    See func:`nuntius.utils.tracking.apply_staged_tracking_events`
+    """
+
+    esp_message_id = models.CharField(
+        _("ID given by the sending server"), max_length=255
+    )
+    email = models.EmailField(_("Email address"))
+    event_type = models.CharField(_("Event type"), max_length=20)
+    # the new result of the sent event, if the event changes it
+    result = models.CharField(
+        _("Operation result"),
+        max_length=2,
+        null=True,
+        choices=CampaignSentStatusType.CHOICES,
+    )
+
+    class Meta:
+        verbose_name = _("staged tracking event")
+        verbose_name_plural = _("staged tracking events")
+
+
+class CampaignStatsQuerySet(models.QuerySet):
+    def increment(self, **deltas):
+        """Add the given deltas to the counters of the selected statistics
+
+        :param deltas: the value to add to each counter field, by field name
+        """
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if deltas:
+            self.update(**{field: F(field) + delta for field, delta in deltas.items()})
+
+
+class CampaignStats(models.Model):
+    """
+    Statistics of a campaign, incrementally kept up to date
+
+    Statistics are updated by the worker when sending messages, by tracking views and by
+    webhooks. They can be computed again from the sent events with the
+    `nuntius_rebuild_campaign_stats` management command.
+    """
+
+    objects = CampaignStatsQuerySet.as_manager()
+
+    COUNTERS = (
+        "sent",
+        "ok",
+        "bounced",
+        "complained",
+        "blocked",
+        "open",
+        "unique_open",
+        "click",
+        "unique_click",
+    )
+    RESULT_FIELDS = {
+        CampaignSentStatusType.OK: "ok_count",
+        CampaignSentStatusType.BOUNCED: "bounced_count",
+        CampaignSentStatusType.COMPLAINED: "complained_count",
+        CampaignSentStatusType.BLOCKED: "blocked_count",
+    }
+
+    campaign = models.OneToOneField(
+        "Campaign",
+        models.CASCADE,
+        primary_key=True,
+        verbose_name=_("Campaign"),
+    )
+    sent_count = models.IntegerField(_("Sent count"), default=0)
+    ok_count = models.IntegerField(_("Ok count"), default=0)
+    bounced_count = models.IntegerField(_("Bounced count"), default=0)
+    complained_count = models.IntegerField(_("Complained count"), default=0)
+    blocked_count = models.IntegerField(_("Blocked count"), default=0)
+    open_count = models.IntegerField(_("Open count"), default=0)
+    unique_open_count = models.IntegerField(_("Unique open count"), default=0)
+    click_count = models.IntegerField(_("Click count"), default=0)
+    unique_click_count = models.IntegerField(_("Unique click count"), default=0)
+
+    @classmethod
+    def result_change_deltas(cls, old_result, new_result):
+        """Compute the changes to statistics when a sent event result changes
+
+        :return: the value to add to each counter field, by field name
+        :rtype: class:`collections.Counter`
+        """
+        deltas = Counter()
+
+        if old_result == new_result:
+            return deltas
+
+        unsent = CampaignSentStatusType.UNSENT
+        if old_result in unsent and new_result not in unsent:
+            deltas["sent_count"] += 1
+        elif new_result in unsent and old_result not in unsent:
+            deltas["sent_count"] -= 1
+
+        if old_result in cls.RESULT_FIELDS:
+            deltas[cls.RESULT_FIELDS[old_result]] -= 1
+        if new_result in cls.RESULT_FIELDS:
+            deltas[cls.RESULT_FIELDS[new_result]] += 1
+
+        return deltas
+
+    @classmethod
+    def rebuild(cls, campaign):
+        """Compute from scratch the statistics of a campaign from its sent events
+
+        :rtype: class:`nuntius.models.CampaignStats`
+        """
+        events = CampaignSentEvent.objects.filter(campaign=campaign).order_by()
+        # aggregates may not be named like the fields of the sent events
+        values = events.aggregate(
+            sent=Count("id", filter=~Q(result__in=CampaignSentStatusType.UNSENT)),
+            **{
+                field[: -len("_count")]: Count("id", filter=Q(result=result))
+                for result, field in cls.RESULT_FIELDS.items()
+            },
+            open=Coalesce(Sum("open_count"), Value(0)),
+            unique_open=Count("id", filter=Q(open_count__gt=0)),
+            click=Coalesce(Sum("click_count"), Value(0)),
+            unique_click=Count("id", filter=Q(click_count__gt=0)),
+        )
+        values = {f"{name}_count": value for name, value in values.items()}
+        stats, _ = cls.objects.update_or_create(campaign=campaign, defaults=values)
+        return stats
+
+    class Meta:
+        verbose_name = _("campaign statistics")
+        verbose_name_plural = _("campaign statistics")
+
+
 class MosaicoImage(models.Model):
     file = StdImageField(upload_to="mosaico", variations={"thumbnail": (90, 90)})
     created = fields.DateTimeField(auto_now_add=True)
@@ -1,6 +1,7 @@
 from secrets import token_bytes
 
 from django.contrib.contenttypes.models import ContentType
+from django.core.validators import MinValueValidator
 from django.db import models
 from django.db.models import fields
 from django.utils import timezone
@@ -31,6 +32,21 @@ class AbstractCampaignQuerySet(models.QuerySet):
             .exclude(end_date__isnull=False, end_date__lt=now)
         )
 
+    def next_start_date(self):
+        """Return the earliest start date of the campaigns being sent which have not
+        started yet, if any
+
+        :rtype: class:`datetime.datetime`
+        """
+        return (
+            self.filter(
+                status=CampaignStatusType.STATUS_SENDING, start_date__gt=timezone.now()
+            )
+            .order_by("start_date")
+            .values_list("start_date", flat=True)
+            .first()
+        )
+
 
 class AbstractCampaign(CampaignStatusType, models.Model):
     objects = AbstractCampaignQuerySet.as_manager()
@@ -58,6 +74,17 @@ class AbstractCampaign(CampaignStatusType, models.Model):
         default=CampaignStatusType.STATUS_WAITING,
     )
 
+    priority = fields.PositiveSmallIntegerField(
+        _("Priority"),
+        default=1,
+        validators=[MinValueValidator(1)],
+        help_text=_(
+            "Campaigns sent at the same time share the sending capacity in proportion "
+            "to their priority, unless the worker is configured to send campaigns "
+            "with a higher priority first."
+        ),
+    )
+
     utm_name = fields.CharField(
         _("UTM name (visible to subscribers)"),
         max_length=255,
@@ -72,6 +99,26 @@ class AbstractCampaign(CampaignStatusType, models.Model):
 
     signature_key = fields.BinaryField(max_length=20, default=generate_signature_key)
 
+    _stats = None
+
+    def get_stats(self):
+        """Return all the counters of the campaign, by name
+
+        Counters are computed once with the `compute_stats` method, which concrete
+        campaign models define to return the value of each of their counters, by name,
+        with a single query. They are then memoized on the instance until it is refreshed
+        from the database.
+
+        :rtype: class:`dict`
+        """
+        if self._stats is None:
+            self._stats = self.compute_stats()
+        return self._stats
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._stats = None
+
     def get_subscribers_queryset(self):
         if self.segment is None:
             model = app_settings.NUNTIUS_SUBSCRIBER_MODEL
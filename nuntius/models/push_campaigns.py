@@ -1,7 +1,7 @@
 from secrets import token_urlsafe
 
 from django.db import models, IntegrityError
-from django.db.models import fields
+from django.db.models import fields, Count, Q
 from django.utils.translation import gettext_lazy as _
 
 from nuntius import app_settings
@@ -25,33 +25,29 @@ class PushCampaign(AbstractCampaign):
         _("Notification icon"), null=True, blank=True, max_length=255
     )
 
-    def get_sent_count(self):
+    def compute_stats(self):
         return (
             PushCampaignSentEvent.objects.filter(campaign=self)
-            .exclude(result=PushCampaignSentStatusType.PENDING)
-            .count()
+            .order_by()
+            .aggregate(
+                sent=Count("id", filter=~Q(result=PushCampaignSentStatusType.PENDING)),
+                ok=Count("id", filter=Q(result=PushCampaignSentStatusType.OK)),
+                ko=Count("id", filter=Q(result=PushCampaignSentStatusType.ERROR)),
+                click=Count("id", filter=Q(click_count__gt=0)),
+            )
         )
 
+    def get_sent_count(self):
+        return self.get_stats()["sent"]
+
     def get_ok_count(self):
-        return (
-            PushCampaignSentEvent.objects.filter(campaign=self)
-            .filter(result=PushCampaignSentStatusType.OK)
-            .count()
-        )
+        return self.get_stats()["ok"]
 
     def get_ko_count(self):
-        return (
-            PushCampaignSentEvent.objects.filter(campaign=self)
-            .filter(result=PushCampaignSentStatusType.ERROR)
-            .count()
-        )
+        return self.get_stats()["ko"]
 
     def get_click_count(self):
-        return (
-            PushCampaignSentEvent.objects.filter(campaign=self)
-            .filter(click_count__gt=0)
-            .count()
-        )
+        return self.get_stats()["click"]
 
     def get_event_for_subscriber(self, subscriber):
         event, _ = PushCampaignSentEvent.objects.get_or_create(
@@ -29,6 +29,9 @@ class BaseSubscriberManager(models.Manager):
         subscriber.subscriber_status = status
         subscriber.save(update_fields=["subscriber_status"])
 
+    def set_subscribers_status(self, email_addresses, status):
+        self.filter(email__in=email_addresses).update(subscriber_status=status)
+
     def get_subscriber(self, email_address):
         return self.filter(email=email_address).last()
 
@@ -65,6 +68,15 @@ class AbstractSubscriber:
     def get_subscriber_data(self):
         return {"email": self.get_subscriber_email()}
 
+    @classmethod
+    def prepare_subscriber_queryset(cls, queryset):
+        """Prepare a queryset of subscribers for which messages will be rendered
+
+        Override it to add the `select_related` or `prefetch_related` lookups needed by
+        `get_subscriber_data`, so that it does not make queries for each subscriber.
+        """
+        return queryset
+
     class Meta:
         abstract = True
         verbose_name = _("Subscriber")
@@ -0,0 +1,47 @@
+import time
+
+from django.db import models, transaction
+from django.utils.translation import gettext_lazy as _
+
+
+class TokenBucketState(models.Model):
+    """
+    State of a token bucket shared by the workers of several hosts
+
+    The bucket is refilled lazily: its number of tokens is only updated when tokens are
+    taken, from the time elapsed since its last update.
+    """
+
+    name = models.CharField(_("Name"), max_length=255, primary_key=True)
+    tokens = models.FloatField(_("Tokens"))
+    # wall clock time of the last update, as the bucket is shared by several hosts
+    updated = models.FloatField(_("Last update"))
+
+    @classmethod
+    def take(cls, name, n, max_tokens, rate):
+        """Take `n` tokens from the bucket, which may go below zero
+
+        :param name: the name of the bucket
+        :param n: the number of tokens to take
+        :param max_tokens: the maximum number of tokens of the bucket
+        :param rate: the rate at which the bucket fills in, in number of tokens per second
+        :return: the time to wait, in seconds, before the tokens may be used
+        :rtype: class:`float`
+        """
+        with transaction.atomic():
+            bucket, _ = cls.objects.select_for_update().get_or_create(
+                name=name, defaults={"tokens": max_tokens, "updated": time.time()}
+            )
+            # clocks of several hosts may not be perfectly synchronized
+            now = max(time.time(), bucket.updated)
+            bucket.tokens = (
+                min(bucket.tokens + rate * (now - bucket.updated), max_tokens) - n
+            )
+            bucket.updated = now
+            bucket.save()
+
+        return -bucket.tokens / rate if bucket.tokens < 0 else 0
+
+    class Meta:
+        verbose_name = _("token bucket")
+        verbose_name_plural = _("token buckets")
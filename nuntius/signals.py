@@ -4,9 +4,16 @@ from typing import Any, MutableMapping
 from django.db import transaction
 from django.dispatch import receiver
 
+from nuntius import app_settings
 from nuntius.actions import update_subscriber
 from nuntius.admin import subscriber_class
-from nuntius.models import CampaignSentEvent, CampaignSentStatusType
+from nuntius.models import (
+    CampaignSentEvent,
+    CampaignSentStatusType,
+    CampaignStats,
+    StagedTrackingEvent,
+)
+from nuntius.utils.tracking import apply_tracking_event
 
 
 class AnymailLoggerAdapter(logging.LoggerAdapter):
@@ -42,7 +49,7 @@ else:
 
     @receiver(tracking, dispatch_uid="nuntius_anymail_tracking")
     def handle_anymail(sender, event, esp_name, **kwargs):
-        campaign_status = actions.get(event.event_type, (None, None))
+        campaign_status = actions.get(event.event_type)
 
         if event.event_type == EventType.BOUNCED:
             # in cases of soft bounces (grouped by Anymail with hard bounces in the BOUNCED event type)
@@ -61,22 +68,37 @@ else:
         else:
             logger.info(event)
 
-        with transaction.atomic():
-            defaults = dict()
-            if hasattr(subscriber_class().objects, "get_subscriber"):
-                defaults["subscriber"] = subscriber_class().objects.get_subscriber(
-                    event.recipient
-                )
-            c, is_create = CampaignSentEvent.objects.select_for_update().get_or_create(
+        if app_settings.STAGED_TRACKING_EVENTS:
+            StagedTrackingEvent.objects.create(
                 esp_message_id=event.message_id,
-                defaults={"email": event.recipient, **defaults},
+                email=event.recipient,
+                event_type=event.event_type,
+                result=campaign_status,
             )
-            if campaign_status is not None:
-                c.result = campaign_status
-            if event.event_type == EventType.OPENED:
-                c.open_count = c.open_count + 1
-            if event.event_type == EventType.CLICKED:
-                c.click_count = c.click_count + 1
+            return
+
+        with transaction.atomic():
+            try:
+                c = CampaignSentEvent.objects.select_for_update().get(
+                    esp_message_id=event.message_id
+                )
+            except CampaignSentEvent.DoesNotExist:
+                # the subscriber is only needed for messages unknown to Nuntius
+                defaults = dict()
+                subscribers = subscriber_class().objects
+                if hasattr(subscribers, "get_subscriber"):
+                    defaults["subscriber"] = subscribers.get_subscriber(event.recipient)
+                sent_events = CampaignSentEvent.objects.select_for_update()
+                c, is_create = sent_events.get_or_create(
+                    esp_message_id=event.message_id,
+                    defaults={"email": event.recipient, **defaults},
+                )
+            stats_deltas = apply_tracking_event(c, event.event_type, campaign_status)
             c.save()
 
-        update_subscriber(event.recipient, campaign_status)
+            if c.campaign_id is not None:
+                CampaignStats.objects.filter(campaign_id=c.campaign_id).increment(
+                    **stats_deltas
+                )
+
+        update_subscriber(event.recipient, campaign_status, c)
@@ -16,6 +16,17 @@ urlpatterns = [
     ),
     path("img/", mosaico_image_processor_view, name="nuntius_mosaico_image_processor"),
     path("open/<str:tracking_id>", track_open_view, name="nuntius_track_open"),
+    path(
+        "link/<int:campaign_id>/<str:tracking_id>/<str:link>/<str:signature>",
+        track_email_click_view,
+        name="nuntius_track_click",
+    ),
+    path(
+        "push/<int:campaign_id>/<str:tracking_id>/<str:link>/<str:signature>",
+        track_push_click_view,
+        name="nuntius_track_push_click",
+    ),
+    # links of messages sent before campaign ids were added to tracked links
     path(
         "link/<str:tracking_id>/<str:link>/<str:signature>",
         track_email_click_view,
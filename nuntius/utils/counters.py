@@ -0,0 +1,178 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from functools import lru_cache
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import F, Subquery
+from django.utils.module_loading import import_string
+
+from nuntius import app_settings
+from nuntius.models import CampaignSentEvent, CampaignStats
+
+logger = logging.getLogger(__name__)
+
+
+def write_increments(model, field, increments):
+    """Add increments to a counter field of sent events, and to campaign statistics
+
+    For email sent events, the total and unique counters of the campaign statistics
+    are updated in the same transaction.
+
+    :param model: the sent event model (`CampaignSentEvent` or `PushCampaignSentEvent`)
+    :param field: the name of the counter field (`open_count` or `click_count`)
+    :type field: class:`str`
+    :param increments: the value to add to the counter, by tracking id
+    :type increments: class:`dict`
+    """
+    tracking_ids_by_increment = defaultdict(list)
+    for tracking_id, increment in increments.items():
+        tracking_ids_by_increment[increment].append(tracking_id)
+
+    with transaction.atomic():
+        stats_deltas = defaultdict(Counter)
+        if model is CampaignSentEvent:
+            for tracking_id, campaign_id, value in (
+                model.objects.select_for_update()
+                .filter(tracking_id__in=increments, campaign_id__isnull=False)
+                .order_by()
+                .values_list("tracking_id", "campaign_id", field)
+            ):
+                stats_deltas[campaign_id][field] += increments[tracking_id]
+                if value == 0:
+                    stats_deltas[campaign_id][f"unique_{field}"] += 1
+
+        for increment, tracking_ids in tracking_ids_by_increment.items():
+            model.objects.filter(tracking_id__in=tracking_ids).update(
+                **{field: F(field) + increment}
+            )
+
+        for campaign_id, deltas in stats_deltas.items():
+            CampaignStats.objects.filter(campaign_id=campaign_id).increment(**deltas)
+
+
+class CounterBackend:
+    """
+    Interface of the backends used by tracking views to increment open and click
+    counters
+    """
+
+    def increment(self, model, tracking_id, field):
+        """Increment a counter of the sent event with this tracking id
+
+        :param model: the sent event model (`CampaignSentEvent` or
+            `PushCampaignSentEvent`)
+        :param tracking_id: the tracking id of the sent event
+        :type tracking_id: class:`str`
+        :param field: the name of the counter field (`open_count` or `click_count`)
+        :type field: class:`str`
+        """
+        raise NotImplementedError()
+
+    def flush(self):
+        return
+
+
+class DirectCounterBackend(CounterBackend):
+    """
+    Counter backend that updates the database right away, on each increment
+
+    The counter of the sent event is first set to 1 with a conditional UPDATE, which
+    only succeeds for its first hit, and otherwise incremented. The total and unique
+    counters of the campaign statistics are then incremented with a single UPDATE,
+    outside of any transaction, so that hits on the same campaign only wait on each
+    other for the duration of that query.
+    """
+
+    def increment(self, model, tracking_id, field):
+        sent_events = model.objects.filter(tracking_id=tracking_id)
+        first_hit = sent_events.filter(**{field: 0}).update(**{field: 1})
+        if not first_hit and not sent_events.update(**{field: F(field) + 1}):
+            return
+
+        if model is CampaignSentEvent:
+            CampaignStats.objects.filter(
+                campaign_id=Subquery(sent_events.values("campaign_id")[:1])
+            ).increment(**{field: 1, f"unique_{field}": first_hit})
+
+
+class BufferedCounterBackend(CounterBackend):
+    """
+    Counter backend that collects increments in memory and writes them periodically
+
+    Increments are summed by tracking id, and flushed every `flush_interval` seconds by
+    a background thread, with a single UPDATE query for all the sent events that got the
+    same increment, and a single one for the statistics of each campaign. Pending
+    increments are also flushed when the process exits.
+    """
+
+    UPDATE_BATCH_SIZE = 500
+
+    def __init__(self, flush_interval: float = None):
+        """Create a new BufferedCounterBackend
+
+        :param flush_interval: the interval between two flushes, in seconds, defaults to
+            `nuntius.app_settings.TRACKING_COUNTER_FLUSH_INTERVAL`
+        :type flush_interval: class:`float`
+        """
+        if flush_interval is None:
+            flush_interval = app_settings.TRACKING_COUNTER_FLUSH_INTERVAL
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._increments = defaultdict(Counter)
+        self._thread = None
+        atexit.register(self.flush)
+
+    def increment(self, model, tracking_id, field):
+        with self._lock:
+            self._increments[(model, field)][tracking_id] += 1
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="nuntius-counters-flush", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            finally:
+                connection.close()
+
+    def flush(self):
+        """
+        Write all pending increments to the database.
+
+        Increments that could not be written are kept to be retried on next flush.
+        """
+        with self._lock:
+            increments, self._increments = self._increments, defaultdict(Counter)
+
+        for (model, field), counter in increments.items():
+            tracking_ids = iter(list(counter))
+
+            try:
+                for batch in iter(
+                    lambda: list(islice(tracking_ids, self.UPDATE_BATCH_SIZE)), []
+                ):
+                    write_increments(
+                        model,
+                        field,
+                        {tracking_id: counter[tracking_id] for tracking_id in batch},
+                    )
+                    for tracking_id in batch:
+                        del counter[tracking_id]
+            except Exception:
+                logger.exception("Error while flushing tracking counters.")
+                with self._lock:
+                    self._increments[(model, field)].update(counter)
+
+
+@lru_cache(maxsize=None)
+def get_counter_backend() -> CounterBackend:
+    return import_string(app_settings.TRACKING_COUNTER_BACKEND)()
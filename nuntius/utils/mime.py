@@ -0,0 +1,308 @@
+import re
+from email import quoprimime
+from email.generator import Generator
+from email.policy import compat32
+from functools import cached_property
+from itertools import chain
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail.message import (
+    RFC5322_EMAIL_LINE_LENGTH_LIMIT,
+    SafeMIMEMultipart,
+    SafeMIMEText,
+    forbid_multi_line_headers,
+    formatdate,
+    make_msgid,
+)
+from django.core.mail.utils import DNS_NAME
+
+# line breaks, as recognized by the email package when encoding and generating messages
+NLCRE = re.compile(r"\r\n|\r|\n")
+
+LINESEP = "\r\n"
+
+POLICY = compat32.clone(linesep=LINESEP)
+
+
+def fold_header(name, value):
+    return POLICY.fold_binary(name, value)
+
+
+def is_long_line(line):
+    return any(
+        len(l.encode()) > RFC5322_EMAIL_LINE_LENGTH_LIMIT for l in line.splitlines()
+    )
+
+
+def quote_line(line):
+    return quoprimime.body_encode(line.encode().decode("latin1"), eol=LINESEP)
+
+
+class EncodedLines(NamedTuple):
+    """
+    Complete lines of a body, encoded once for all the messages of a campaign
+    """
+
+    raw: bytes
+    quoted: bytes
+    long: bool
+    ascii: bool
+
+    @classmethod
+    def encode(cls, lines):
+        return cls(
+            raw="".join(line + LINESEP for line in lines).encode(),
+            quoted="".join(quote_line(line) + LINESEP for line in lines).encode(),
+            long=any(is_long_line(line) for line in lines),
+            ascii=all(line.isascii() for line in lines),
+        )
+
+
+class Fragment(NamedTuple):
+    """
+    Static fragment of a body, split around its complete lines
+
+    :ivar first: the end of the line of the previous substitution
+    :ivar lines: the complete lines of the fragment, or None if the fragment is a part
+        of a single line
+    :ivar last: the start of the line of the next substitution
+    """
+
+    first: str
+    lines: EncodedLines
+    last: str
+
+    @classmethod
+    def split(cls, fragment):
+        lines = NLCRE.split(fragment)
+        if len(lines) == 1:
+            return cls(fragment, None, "")
+        return cls(lines[0], EncodedLines.encode(lines[1:-1]), lines[-1])
+
+
+def encode_body(pieces):
+    """Encode a body the way :class:`django.core.mail.message.SafeMIMEText` does
+
+    :param pieces: lines of the body, either as strings or as already encoded
+        :class:`EncodedLines`, the last of which must be a string
+    :return: a `(content_transfer_encoding, encoded_body)` tuple
+    """
+    lines = [piece for piece in pieces if isinstance(piece, str)]
+    blocks = [piece for piece in pieces if not isinstance(piece, str)]
+
+    if any(block.long for block in blocks) or any(is_long_line(l) for l in lines):
+        encoding = "quoted-printable"
+        encoded = [
+            piece.quoted if not isinstance(piece, str) else quote_line(piece).encode()
+            for piece in pieces
+        ]
+    else:
+        ascii = all(block.ascii for block in blocks) and all(l.isascii() for l in lines)
+        encoding = "7bit" if ascii else "8bit"
+        encoded = [
+            piece.raw if not isinstance(piece, str) else piece.encode()
+            for piece in pieces
+        ]
+
+    # each line but the last is followed by a line break
+    linesep = LINESEP.encode()
+    body = b"".join(
+        chunk + linesep if isinstance(piece, str) and i < len(pieces) - 1 else chunk
+        for i, (piece, chunk) in enumerate(zip(pieces, encoded))
+    )
+    return encoding, body
+
+
+class MessageSkeleton:
+    """
+    MIME encoding of the messages of a campaign, prepared once for all its subscribers
+
+    The headers which are the same for all messages, and the lines of the HTML body
+    which contain no template variable nor tracking id, are encoded once, the same way
+    :meth:`django.core.mail.EmailMessage.message` would. Encoding the message of a
+    subscriber then only requires encoding its own headers and lines, and splicing them
+    with the prepared bytes.
+    """
+
+    ENCODING = "utf-8"
+
+    def __init__(self, subject, from_email, reply_to, fragments):
+        """Prepare the MIME encoding of the messages of a campaign
+
+        :param fragments: the static fragments of the HTML body, as given by
+            :attr:`nuntius.messages.RenderPlan.fragments`
+        :type fragments: class:`list`
+        """
+        self.fragments = [Fragment.split(fragment) for fragment in fragments]
+        # a line break could otherwise be split between two fragments
+        self.splittable = not any(fragment.endswith("\r") for fragment in fragments)
+
+        self.boundary = Generator._make_boundary("".join(fragments))
+        multipart = SafeMIMEMultipart(_subtype="alternative", encoding=self.ENCODING)
+        multipart.set_boundary(self.boundary)
+        self.multipart_headers = self._headers(multipart)
+
+        self.part_headers = {
+            subtype: self._headers(SafeMIMEText("", subtype, self.ENCODING))
+            for subtype in ("plain", "html")
+        }
+
+        self.sender_headers = self._header("Subject", subject) + self._header(
+            "From", from_email
+        )
+        self.reply_to_headers = b""
+        if reply_to is not None:
+            self.reply_to_headers = self._header("Reply-To", reply_to)
+
+    @classmethod
+    def _header(cls, name, value):
+        return fold_header(*forbid_multi_line_headers(name, value, cls.ENCODING))
+
+    @staticmethod
+    def _headers(msg):
+        return b"".join(
+            fold_header(name, value)
+            for name, value in msg.raw_items()
+            if name != "Content-Transfer-Encoding"
+        )
+
+    def encode(self, email, text_body, substitutions):
+        """Encode the message of a subscriber
+
+        :param email: the email address of the subscriber
+        :type email: class:`str`
+        :param text_body: the rendered text body, if any
+        :type text_body: class:`str`
+        :param substitutions: the values to insert between the fragments of the HTML body
+        :type substitutions: class:`list`
+        :return: the message, with CRLF line breaks, or None if it cannot be encoded
+            from the skeleton
+        :rtype: class:`bytes`
+        """
+        if len(substitutions) != len(self.fragments) - 1 or not self.splittable:
+            return None
+        if any(NLCRE.search(substitution) for substitution in substitutions):
+            return None
+
+        html_pieces = []
+        line = ""
+        for substitution, fragment in zip(chain([""], substitutions), self.fragments):
+            line += substitution + fragment.first
+            if fragment.lines is not None:
+                html_pieces.extend([line, fragment.lines])
+                line = fragment.last
+        html_pieces.append(line)
+
+        text_pieces = NLCRE.split(text_body) if text_body else []
+        if any(
+            self.boundary in piece
+            for piece in chain(html_pieces, text_pieces)
+            if isinstance(piece, str)
+        ):
+            return None
+
+        html_encoding, html = encode_body(html_pieces)
+        if html == b"":
+            return None
+
+        linesep = LINESEP.encode()
+        recipient_headers = b"".join(
+            [
+                self._header("To", email),
+                self.reply_to_headers,
+                fold_header("Date", formatdate(localtime=settings.EMAIL_USE_LOCALTIME)),
+                fold_header("Message-ID", make_msgid(domain=DNS_NAME)),
+            ]
+        )
+
+        if not text_body:
+            return b"".join(
+                [
+                    self.part_headers["html"],
+                    fold_header("Content-Transfer-Encoding", html_encoding),
+                    self.sender_headers,
+                    recipient_headers,
+                    linesep,
+                    html,
+                ]
+            )
+
+        text_encoding, text = encode_body(text_pieces)
+        boundary = self.boundary.encode()
+        return b"".join(
+            [
+                self.multipart_headers,
+                self.sender_headers,
+                recipient_headers,
+                linesep,
+                b"--" + boundary + linesep,
+                self.part_headers["plain"],
+                fold_header("Content-Transfer-Encoding", text_encoding),
+                linesep,
+                text,
+                linesep + b"--" + boundary + linesep,
+                self.part_headers["html"],
+                fold_header("Content-Transfer-Encoding", html_encoding),
+                linesep,
+                html,
+                linesep + b"--" + boundary + b"--" + linesep,
+            ]
+        )
+
+
+class PreEncodedMIMEMessage:
+    """
+    MIME message encoded from a :class:`MessageSkeleton`
+
+    Only serializing the message to bytes is done from the prepared encoding: other
+    operations are delegated to the message Django would have generated.
+    """
+
+    def __init__(self, data, email_message):
+        self._data = data
+        self._email_message = email_message
+
+    @cached_property
+    def _message(self):
+        return EmailMultiAlternatives.message(self._email_message)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._message, name)
+
+    def as_bytes(self, unixfrom=False, linesep="\n"):
+        if unixfrom:
+            return self._message.as_bytes(unixfrom=unixfrom, linesep=linesep)
+        if linesep == LINESEP:
+            return self._data
+        return self._data.replace(LINESEP.encode(), linesep.encode())
+
+
+class PreEncodedMessage(EmailMultiAlternatives):
+    """
+    Email message of a campaign, whose MIME encoding is spliced in a
+    :class:`MessageSkeleton`
+
+    The message is otherwise a regular email message, which may be sent with any email
+    backend: the SMTP backend then passes the pre-encoded bytes to the SMTP connection.
+    """
+
+    def __init__(self, *args, skeleton, substitutions, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.skeleton = skeleton
+        self.substitutions = substitutions
+
+    def message(self):
+        if (
+            (self.encoding or settings.DEFAULT_CHARSET) == MessageSkeleton.ENCODING
+            and len(self.to) == 1
+            and not (self.cc or self.extra_headers or self.attachments)
+        ):
+            text_body = self.body if self.alternatives else ""
+            data = self.skeleton.encode(self.to[0], text_body, self.substitutions)
+            if data is not None:
+                return PreEncodedMIMEMessage(data, self)
+        return super().message()
@@ -27,6 +27,7 @@ def make_tracking_url(url, campaign, tracking_id):
     relative_url = reverse(
         "nuntius_track_push_click",
         kwargs={
+            "campaign_id": campaign.id,
             "tracking_id": tracking_id,
             "signature": sign_url(campaign, url),
             "link": url_quote(url, safe=""),
@@ -7,6 +7,17 @@ import traceback
 from ctypes import c_double, c_ulong
 from queue import Empty, Full
 
+from django.db import OperationalError
+from tenacity import (
+    retry,
+    stop_after_attempt,
+    retry_if_exception_type,
+    wait_random_exponential,
+)
+
+from nuntius import app_settings
+from nuntius.models import TokenBucketState
+
 logger = logging.getLogger(__name__)
 
 
@@ -72,9 +83,30 @@ def reset_sigmask(proc):
 
 
 class RateLimiter:
-    def take(self):
+    def take(self, n=1):
+        return
+
+    def try_take(self, n=1):
+        """Take `n` tokens if they are available right away, without blocking
+
+        :return: 0 if the tokens were taken, or else the time to wait, in seconds,
+            before trying again
+        :rtype: class:`float`
+        """
+        return 0
+
+    def report_success(self, n=1):
+        """Report that `n` messages were accepted by the mail service"""
+        return
+
+    def report_throttling(self):
+        """Report that the mail service asked to slow down"""
         return
 
+    def current_rate(self):
+        """Return the rate currently enforced, in number of tokens per second, if any"""
+        return None
+
 
 class TokenBucket(RateLimiter):
     """
@@ -84,8 +116,8 @@ class TokenBucket(RateLimiter):
     - They fill up at a fixed rate
     - They have a maximum capacity and will stop filling up when it is reached
     - Whenever a process calls `take`, if the bucket is full enough is is decreased ;
-      if it is not the case, the process (and others) are blocked until is has filled
-      in enough.
+      if it is not the case, the process reserves the tokens and is blocked until the
+      bucket has filled in enough.
     """
 
     def __init__(self, max: int, rate: float):
@@ -97,46 +129,202 @@ class TokenBucket(RateLimiter):
         :type rate: class:`float`
         """
         self.max = max
-        self.rate = rate
-        self._var_lock = mp.RLock()
-        self._wait_lock = mp.RLock()
+        self._lock = mp.Lock()
+        self._rate = mp.Value(c_double, rate, lock=False)
         self._timestamp = mp.Value(c_double, lock=False)
-        self._timestamp.value = time.monotonic()
+        self._timestamp.value = _current_time()
         self._capacity = mp.Value(c_double, lock=False)
         self._capacity.value = self.max
 
+    @property
+    def rate(self):
+        return self._rate.value
+
+    def current_rate(self):
+        return self.rate
+
     def _update(self):
-        with self._var_lock:
-            now = _current_time()
-            self._capacity.value = min(
-                self._capacity.value + self.rate * (now - self._timestamp.value),
-                self.max,
-            )
-            self._timestamp.value = now
+        # must be called with the lock held
+        now = _current_time()
+        self._capacity.value = min(
+            self._capacity.value + self.rate * (now - self._timestamp.value),
+            self.max,
+        )
+        self._timestamp.value = now
 
     def take(self, n=1):
         """
-        Try to take a token, or wait for the bucket to fill in enough.
+        Take `n` tokens, or reserve them and wait for the bucket to fill in enough.
 
-        If several processes take at the same time, the first one to call will takes
-        a lock and will be guaranteed to be unblocked first. No such guarantee exists
-        for the other processes.
+        The lock is only held to reserve the tokens, and not while waiting: processes
+        which reserved tokens before are guaranteed to be unblocked first, as the bucket
+        is left with fewer tokens for each new reservation.
         """
-        with self._wait_lock:
-            with self._var_lock:
-                self._update()
-                self._capacity.value -= n
-                capacity = self._capacity.value
+        with self._lock:
+            self._update()
+            self._capacity.value -= n
+            capacity = self._capacity.value
 
-            if capacity < 0:
-                time.sleep(-self._capacity.value / self.rate)
+        if capacity < 0:
+            time.sleep(-capacity / self.rate)
+
+    def try_take(self, n=1):
+        with self._lock:
+            self._update()
+            if self._capacity.value >= n:
+                self._capacity.value -= n
+                return 0
+            return (n - self._capacity.value) / self.rate
 
     def peek(self):
-        with self._var_lock:
+        with self._lock:
             self._update()
             return self._capacity.value
 
 
+class AdaptiveTokenBucket(TokenBucket):
+    """
+    Token bucket whose rate adapts to the back-pressure of the mail service
+
+    The rate follows an additive increase / multiplicative decrease (AIMD) rule: it is
+    divided by two each time the mail service asks to slow down, at most once every
+    `COOLDOWN` seconds so that the errors of all processes are not counted separately,
+    and increases by `INCREASE` tokens per second every second while messages are
+    accepted, up to the configured rate.
+    """
+
+    INCREASE = 1
+    DECREASE = 0.5
+    COOLDOWN = 1
+
+    def __init__(self, max: int, rate: float, min_rate: float = None):
+        """Create a new AdaptiveTokenBucket.
+
+        :param max: The maximum number of tokens that may be stored in the bucket
+        :type max: class:`int`
+        :param rate: The maximum rate at which the bucket fills in, in number of tokens
+            per second
+        :type rate: class:`float`
+        :param min_rate: The rate under which the bucket never goes, defaults to
+            `nuntius.app_settings.MIN_SENDING_RATE`
+        :type min_rate: class:`float`
+        """
+        super().__init__(max=max, rate=rate)
+        if min_rate is None:
+            min_rate = app_settings.MIN_SENDING_RATE
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self._last_decrease = mp.Value(c_double, float("-inf"), lock=False)
+
+    def report_success(self, n=1):
+        with self._lock:
+            if self._rate.value < self.max_rate:
+                # tokens taken until now were produced at the former rate
+                self._update()
+                self._rate.value = min(
+                    self._rate.value + self.INCREASE * n / self._rate.value,
+                    self.max_rate,
+                )
+
+    def report_throttling(self):
+        with self._lock:
+            now = _current_time()
+            if now - self._last_decrease.value < self.COOLDOWN:
+                return
+            self._update()
+            self._rate.value = max(self._rate.value * self.DECREASE, self.min_rate)
+            self._last_decrease.value = now
+            rate = self._rate.value
+
+        logger.warning(
+            "Sending throttled by the mail service, lowering the rate to %.1f/s", rate
+        )
+
+
+class DatabaseTokenBucket(RateLimiter):
+    """
+    Token bucket shared by the workers of several hosts through the database
+
+    The state of the bucket is kept in a :class:`nuntius.models.TokenBucketState` row,
+    so that the rate is enforced across all workers. To keep the database off the path
+    of each message, the processes of a worker take tokens from the shared bucket by
+    blocks of `block_size`, and then use them from a local reserve.
+    """
+
+    def __init__(self, max: int, rate: float, block_size: int = None, name="default"):
+        """Create a new DatabaseTokenBucket.
+
+        :param max: The maximum number of tokens that may be stored in the bucket
+        :type max: class:`int`
+        :param rate: The rate at which the bucket fills in, in number of tokens per second
+        :type rate: class:`float`
+        :param block_size: The number of tokens taken at once from the shared bucket,
+            defaults to `nuntius.app_settings.RATE_LIMITER_BLOCK_SIZE`
+        :type block_size: class:`int`
+        :param name: The name of the shared bucket
+        :type name: class:`str`
+        """
+        if block_size is None:
+            block_size = app_settings.RATE_LIMITER_BLOCK_SIZE
+        self.max = max
+        self.rate = rate
+        self.block_size = block_size
+        self.name = name
+        self._lock = mp.Lock()
+        self._reserve = mp.Value(c_double, 0, lock=False)
+        # monotonic time at which the tokens of the reserve may be used
+        self._ready_at = mp.Value(c_double, 0, lock=False)
+
+    @retry(
+        stop=stop_after_attempt(5),
+        wait=wait_random_exponential(max=5),
+        retry=retry_if_exception_type(OperationalError),
+        reraise=True,
+    )
+    def _take_block(self, n):
+        return TokenBucketState.take(self.name, n, self.max, self.rate)
+
+    def current_rate(self):
+        return self.rate
+
+    def take(self, n=1):
+        """
+        Take `n` tokens from the local reserve, refilling it from the shared bucket and
+        waiting for the shared bucket to fill in enough if needed.
+        """
+        wait = self.try_take(n)
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.try_take(n)
+
+    def try_take(self, n=1):
+        with self._lock:
+            if self._reserve.value < n:
+                block = max(self.block_size, n - self._reserve.value)
+                wait = self._take_block(block)
+                self._reserve.value += block
+                self._ready_at.value = _current_time() + wait
+
+            wait = self._ready_at.value - _current_time()
+            if wait > 0:
+                return wait
+            self._reserve.value -= n
+            return 0
+
+    def peek(self):
+        with self._lock:
+            reserve = self._reserve.value
+        state = TokenBucketState.objects.filter(name=self.name).first()
+        if state is None:
+            return self.max + reserve
+        return (
+            min(
+                state.tokens + self.rate * max(time.time() - state.updated, 0), self.max
+            )
+            + reserve
+        )
+
+
 class RateMeter:
     def __init__(self, alpha: float, window: float):
         self._alpha = alpha
@@ -168,17 +356,59 @@ class RateMeter:
 
     def current_rate(self):
         with self._lock:
+            self._update()
             return self._current_rate.value
 
 
-def get_from_queue_or_quit(queue: mp.Queue, event: mp.Event, polling_period: float):
+class LatencyMeter:
+    """
+    Exponentially weighted moving average of durations, shared between processes
+    """
+
+    def __init__(self, alpha: float):
+        """Create a new LatencyMeter
+
+        :param alpha: the weight of each new duration in the average
+        :type alpha: class:`float`
+        """
+        self._alpha = alpha
+        self._lock = mp.Lock()
+        self._average = mp.Value(c_double, 0, lock=False)
+        self._count = mp.Value(c_ulong, 0, lock=False)
+
+    def record(self, duration: float, n=1):
+        """Record the duration of an operation on `n` items
+
+        :param duration: the duration of the whole operation, in seconds
+        :type duration: class:`float`
+        :param n: the number of items, whose latency is the duration divided by `n`
+        :type n: class:`int`
+        """
+        latency = duration / n
+        with self._lock:
+            if self._count.value == 0:
+                self._average.value = latency
+            else:
+                self._average.value += self._alpha * (latency - self._average.value)
+            self._count.value += n
+
+    def current_latency(self):
+        """Return the average latency, in seconds"""
+        with self._lock:
+            return self._average.value
+
+
+def get_from_queue_or_quit(
+    queue: mp.Queue, event: mp.Event, polling_period: float, on_idle=None
+):
     while True:
         if event.is_set():
             raise GracefulExit()
         try:
             return queue.get(timeout=polling_period)
         except Empty:
-            pass
+            if on_idle is not None:
+                on_idle()
 
 
 def put_in_queue_or_quit(
@@ -0,0 +1,100 @@
+import re
+import smtplib
+
+from django.core.mail.backends import smtp
+
+
+class PipeliningMixin:
+    """
+    Mixin for :class:`smtplib.SMTP` classes that pipelines the commands of each message
+
+    When the server advertises the ESMTP PIPELINING extension (RFC 2920), the MAIL FROM,
+    RCPT TO and DATA commands of a message are written at once, and their replies read
+    afterwards, so that sending a message only takes two round trips instead of one per
+    command. As with :meth:`smtplib.SMTP.sendmail`, the size of the message is given
+    with MAIL FROM when the server advertises the SIZE extension.
+    """
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        self.ehlo_or_helo_if_needed()
+        if not self.has_extn("pipelining") or mail_options or rcpt_options:
+            return super().sendmail(
+                from_addr, to_addrs, msg, mail_options, rcpt_options
+            )
+
+        if isinstance(to_addrs, str):
+            to_addrs = [to_addrs]
+        if isinstance(msg, str):
+            msg = re.sub(r"\r\n|\r|\n", "\r\n", msg).encode("ascii")
+
+        size_option = f" size={len(msg)}" if self.has_extn("size") else ""
+        commands = [
+            f"mail FROM:{smtplib.quoteaddr(from_addr)}{size_option}",
+            *(f"rcpt TO:{smtplib.quoteaddr(to_addr)}" for to_addr in to_addrs),
+            "data",
+        ]
+        self.send("".join(f"{command}\r\n" for command in commands))
+
+        mail_code, mail_resp = self.getreply()
+        senderrs = {}
+        for to_addr in to_addrs:
+            code, resp = self.getreply()
+            if code not in (250, 251):
+                senderrs[to_addr] = (code, resp)
+        data_code, data_resp = self.getreply()
+
+        if mail_code != 250:
+            self._abort(data_code)
+            raise smtplib.SMTPSenderRefused(mail_code, mail_resp, from_addr)
+        if len(senderrs) == len(to_addrs):
+            self._abort(data_code)
+            raise smtplib.SMTPRecipientsRefused(senderrs)
+        if data_code != 354:
+            self._abort(data_code)
+            raise smtplib.SMTPDataError(data_code, data_resp)
+
+        data = re.sub(rb"(?m)^\.", b"..", msg)
+        if not data.endswith(b"\r\n"):
+            data += b"\r\n"
+        self.send(data + b".\r\n")
+
+        code, resp = self.getreply()
+        if code != 250:
+            self._abort(code)
+            raise smtplib.SMTPDataError(code, resp)
+        return senderrs
+
+    def _abort(self, code):
+        """Leave the current mail transaction after one of its commands failed
+
+        :param code: the last reply code of the server
+        :type code: class:`int`
+        """
+        if code == 421:
+            # the server is closing the connection
+            self.close()
+            return
+        if code == 354:
+            # the server accepted DATA even though the transaction failed
+            self.send(b".\r\n")
+            self.getreply()
+        self._rset()
+
+
+class PipeliningSMTP(PipeliningMixin, smtplib.SMTP):
+    pass
+
+
+class PipeliningSMTP_SSL(PipeliningMixin, smtplib.SMTP_SSL):
+    pass
+
+
+class EmailBackend(smtp.EmailBackend):
+    """
+    Django SMTP email backend that pipelines the commands of each message when the
+    server supports it
+    """
+
+    @property
+    def connection_class(self):
+        return PipeliningSMTP_SSL if self.use_ssl else PipeliningSMTP
@@ -0,0 +1,125 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from nuntius import app_settings
+from nuntius.actions import update_subscribers
+from nuntius.admin import subscriber_class
+from nuntius.models import (
+    CampaignSentEvent,
+    CampaignStats,
+    StagedTrackingEvent,
+)
+
+# event types of Anymail which increment a counter of the sent event
+COUNTER_EVENT_TYPES = {"opened": "open_count", "clicked": "click_count"}
+
+
+def new_sent_event(esp_message_id, email):
+    """Create, without saving it, the sent event of a message unknown to Nuntius
+
+    :rtype: class:`nuntius.models.CampaignSentEvent`
+    """
+    sent_event = CampaignSentEvent(esp_message_id=esp_message_id, email=email)
+    if hasattr(subscriber_class().objects, "get_subscriber"):
+        sent_event.subscriber = subscriber_class().objects.get_subscriber(email)
+    return sent_event
+
+
+def apply_tracking_event(sent_event, event_type, campaign_status):
+    """Change a sent event, without saving it, according to a tracking event
+
+    :param sent_event: the sent event of the tracked message
+    :type sent_event: class:`nuntius.models.CampaignSentEvent`
+    :param event_type: the Anymail event type
+    :type event_type: class:`str`
+    :param campaign_status: the new result of the sent event, if any
+    :type campaign_status: class:`str`
+    :return: the value to add to each counter field of the campaign statistics
+    :rtype: class:`collections.Counter`
+    """
+    stats_deltas = CampaignStats.result_change_deltas(
+        sent_event.result, campaign_status or sent_event.result
+    )
+    if campaign_status is not None:
+        sent_event.result = campaign_status
+    if event_type in COUNTER_EVENT_TYPES:
+        field = COUNTER_EVENT_TYPES[event_type]
+        stats_deltas[field] += 1
+        stats_deltas[f"unique_{field}"] += getattr(sent_event, field) == 0
+        setattr(sent_event, field, getattr(sent_event, field) + 1)
+    return stats_deltas
+
+
+def apply_staged_tracking_events(batch_size=None):
+    """Apply a batch of staged tracking events, in the order they were received
+
+    The sent events of the batch are fetched with a single query, and saved with one
+    bulk update, along with one update of the statistics of each campaign and one
+    update of subscribers by status. Staged events locked by another consumer are
+    skipped, when the database supports it.
+
+    :param batch_size: the maximum number of events to apply, defaults to
+        `nuntius.app_settings.TRACKING_EVENTS_BATCH_SIZE`
+    :type batch_size: class:`int`
+    :return: the number of applied events
+    :rtype: class:`int`
+    """
+    if batch_size is None:
+        batch_size = app_settings.TRACKING_EVENTS_BATCH_SIZE
+
+    with transaction.atomic():
+        staged_events = list(
+            StagedTrackingEvent.objects.select_for_update(skip_locked=True).order_by(
+                "id"
+            )[:batch_size]
+        )
+        if not staged_events:
+            return 0
+
+        sent_events = {
+            sent_event.esp_message_id: sent_event
+            for sent_event in CampaignSentEvent.objects.select_for_update().filter(
+                esp_message_id__in={event.esp_message_id for event in staged_events}
+            )
+        }
+        changed_events = set()
+        created_events = {}
+        stats_deltas = defaultdict(Counter)
+        results = []
+
+        for event in staged_events:
+            sent_event = sent_events.get(event.esp_message_id)
+            if sent_event is None:
+                sent_event = created_events.get(event.esp_message_id)
+            if sent_event is None:
+                sent_event = created_events[event.esp_message_id] = new_sent_event(
+                    event.esp_message_id, event.email
+                )
+            elif sent_event.pk is not None:
+                changed_events.add(sent_event.esp_message_id)
+
+            stats_deltas[sent_event.campaign_id].update(
+                apply_tracking_event(sent_event, event.event_type, event.result)
+            )
+            results.append((event.email, event.result, sent_event))
+
+        CampaignSentEvent.objects.bulk_update(
+            [sent_events[esp_message_id] for esp_message_id in changed_events],
+            ["result", "open_count", "click_count"],
+        )
+        CampaignSentEvent.objects.bulk_create(created_events.values())
+
+        for campaign_id, deltas in stats_deltas.items():
+            if campaign_id is not None:
+                CampaignStats.objects.filter(campaign_id=campaign_id).increment(
+                    **deltas
+                )
+
+        update_subscribers(results)
+
+        StagedTrackingEvent.objects.filter(
+            id__in=[event.id for event in staged_events]
+        ).delete()
+
+    return len(staged_events)
@@ -0,0 +1,138 @@
+import logging
+import os
+import socket
+
+from django.db import connection
+
+from nuntius import app_settings
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL channel on which workers are notified of campaign changes
+NOTIFICATION_CHANNEL = "nuntius_campaigns"
+
+
+def notify_workers(campaign_type=app_settings.CAMPAIGN_TYPE_EMAIL):
+    """Wake up workers so that they take a change of campaign into account right away
+
+    With PostgreSQL and `nuntius.app_settings.POSTGRES_NOTIFICATIONS`, workers are
+    notified with NOTIFY, when the current transaction is committed. Otherwise, a
+    datagram is sent to the worker listening on `nuntius.app_settings.WORKER_SOCKET`, if
+    any. Without either of them, workers only see the change when they next check
+    campaigns.
+
+    :param campaign_type: the type of the campaign which changed
+    :type campaign_type: class:`str`
+    """
+    if connection.vendor == "postgresql" and app_settings.POSTGRES_NOTIFICATIONS:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_notify(%s, %s)", [NOTIFICATION_CHANNEL, campaign_type]
+            )
+
+    if app_settings.WORKER_SOCKET:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            try:
+                sock.sendto(campaign_type.encode(), app_settings.WORKER_SOCKET)
+            except OSError:
+                # the worker is not running
+                logger.debug("Could not notify the worker.", exc_info=True)
+
+
+class WakeupListener:
+    """
+    Interface of the listeners with which workers are woken up on campaign changes
+
+    Listeners have a file descriptor which becomes ready to read when a notification is
+    received, so that they can be waited on with
+    :func:`multiprocessing.connection.wait`.
+    """
+
+    def fileno(self):
+        raise NotImplementedError()
+
+    def drain(self):
+        """Consume all received notifications"""
+        raise NotImplementedError()
+
+    def close(self):
+        raise NotImplementedError()
+
+
+class PostgresWakeupListener(WakeupListener):
+    """
+    Listener on the PostgreSQL notification channel, with its own database connection
+
+    The connection is opened outside of Django's connection handler, so that it is kept
+    when the worker closes its connections before starting subprocesses.
+    """
+
+    def __init__(self):
+        self._connection = connection.get_new_connection(
+            connection.get_connection_params()
+        )
+        self._connection.autocommit = True
+        with self._connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {NOTIFICATION_CHANNEL}")
+
+    def fileno(self):
+        return self._connection.fileno()
+
+    def drain(self):
+        if hasattr(self._connection, "pgconn"):
+            # psycopg 3
+            pgconn = self._connection.pgconn
+            pgconn.consume_input()
+            while pgconn.notifies() is not None:
+                pass
+        else:
+            # psycopg2
+            self._connection.poll()
+            self._connection.notifies.clear()
+
+    def close(self):
+        self._connection.close()
+
+
+class SocketWakeupListener(WakeupListener):
+    """
+    Listener on a local datagram socket, to which :func:`notify_workers` sends datagrams
+    """
+
+    def __init__(self, path):
+        self._path = path
+        # a socket left by a worker which did not exit cleanly
+        if os.path.exists(path):
+            os.unlink(path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(path)
+        self._socket.setblocking(False)
+
+    def fileno(self):
+        return self._socket.fileno()
+
+    def drain(self):
+        while True:
+            try:
+                self._socket.recv(1024)
+            except BlockingIOError:
+                return
+
+    def close(self):
+        self._socket.close()
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+
+def get_wakeup_listener():
+    """Return the listener with which the worker may be woken up, if any
+
+    :rtype: class:`WakeupListener`
+    """
+    if connection.vendor == "postgresql" and app_settings.POSTGRES_NOTIFICATIONS:
+        return PostgresWakeupListener()
+    if app_settings.WORKER_SOCKET:
+        return SocketWakeupListener(app_settings.WORKER_SOCKET)
+    return None
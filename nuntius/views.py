@@ -1,3 +1,4 @@
+import time
 from base64 import b64decode
 from urllib.parse import urlparse, unquote
 from urllib.request import urlopen
@@ -5,13 +6,13 @@ from urllib.request import urlopen
 from PIL import Image
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
-from django.db.models import F
 from django.http import HttpResponse, HttpResponseBadRequest
 from django.shortcuts import redirect, get_object_or_404
 from django.views.decorators.cache import cache_control
 from django.shortcuts import get_object_or_404, render
 
 from nuntius.models import MosaicoImage, CampaignSentEvent, PushCampaignSentEvent, Campaign
+from nuntius.utils.counters import get_counter_backend
 from nuntius.utils.messages import (
     generate_placeholder,
     url_signature_is_valid,
@@ -22,6 +23,12 @@ TRACKING_IMAGE_CONTENT = b64decode(
     "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
 )
 
+# number of seconds during which tracked link views reuse the campaigns they fetched
+TRACKED_CAMPAIGN_CACHE_DURATION = 60
+
+# (expiration time, campaign), by campaign model and id
+_tracked_campaigns = {}
+
 
 @cache_control(public=True, max_age=3600)
 def mosaico_image_processor_view(request):
@@ -74,29 +81,60 @@ def mosaico_image_processor_view(request):
 
 
 def track_open_view(request, tracking_id):
-    CampaignSentEvent.objects.filter(tracking_id=tracking_id).update(
-        open_count=F("open_count") + 1
-    )
+    get_counter_backend().increment(CampaignSentEvent, tracking_id, "open_count")
     return HttpResponse(TRACKING_IMAGE_CONTENT, content_type="image/png")
 
 
+def get_tracked_campaign(campaign_model, campaign_id):
+    """Return the campaign of a tracked link, fetching it at most once a minute
+
+    :raises Http404: if the campaign does not exist
+    """
+    key = (campaign_model, campaign_id)
+    expires, campaign = _tracked_campaigns.get(key, (0, None))
+    if expires < time.monotonic():
+        campaign = get_object_or_404(
+            campaign_model.objects.only("signature_key", "utm_name"), id=campaign_id
+        )
+        _tracked_campaigns[key] = (
+            time.monotonic() + TRACKED_CAMPAIGN_CACHE_DURATION,
+            campaign,
+        )
+    return campaign
+
+
 def track_click_view(
-    request, tracking_id, link, signature, campaign_sent_event_model, medium
+    request,
+    tracking_id,
+    link,
+    signature,
+    campaign_sent_event_model,
+    medium,
+    campaign_id=None,
 ):
-    campaign_sent_event = get_object_or_404(
-        campaign_sent_event_model, tracking_id=tracking_id
-    )
-
-    campaign_sent_event_model.objects.filter(tracking_id=tracking_id).update(
-        click_count=F("click_count") + 1
-    )
+    if campaign_id is None:
+        # links of messages sent before campaign ids were added to tracked links
+        campaign = get_object_or_404(
+            campaign_sent_event_model.objects.select_related("campaign"),
+            tracking_id=tracking_id,
+        ).campaign
+    else:
+        # the sent event is only looked up by the counter backend
+        campaign = get_tracked_campaign(
+            campaign_sent_event_model._meta.get_field("campaign").related_model,
+            campaign_id,
+        )
 
     url = unquote(link)
 
-    if not url_signature_is_valid(campaign_sent_event.campaign, url, signature):
+    if not url_signature_is_valid(campaign, url, signature):
         raise PermissionDenied()
 
-    utm_campaign = campaign_sent_event.campaign.utm_name
+    get_counter_backend().increment(
+        campaign_sent_event_model, tracking_id, "click_count"
+    )
+
+    utm_campaign = campaign.utm_name
 
     url = extend_query(
         url,
@@ -106,15 +144,27 @@ def track_click_view(
     return redirect(url)
 
 
-def track_email_click_view(request, tracking_id, link, signature):
+def track_email_click_view(request, tracking_id, link, signature, campaign_id=None):
     return track_click_view(
-        request, tracking_id, link, signature, CampaignSentEvent, "email"
+        request,
+        tracking_id,
+        link,
+        signature,
+        CampaignSentEvent,
+        "email",
+        campaign_id=campaign_id,
     )
 
 
-def track_push_click_view(request, tracking_id, link, signature):
+def track_push_click_view(request, tracking_id, link, signature, campaign_id=None):
     return track_click_view(
-        request, tracking_id, link, signature, PushCampaignSentEvent, "push"
+        request,
+        tracking_id,
+        link,
+        signature,
+        PushCampaignSentEvent,
+        "push",
+        campaign_id=campaign_id,
     )
 
 
@@ -122,7 +172,3 @@ def subscriber_count_view(request, pk):
     from nuntius.admin import subscriber_class
     campaign = get_object_or_404(Campaign, id=pk)
     return render(request, "admin/nuntius/subscriber_count.html", {"campaign": campaign, "subscriber_class": subscriber_class()})
-
-def count_view(request, pk, name):
-    campaign = get_object_or_404(Campaign, id=pk)
-    return render(request, "admin/nuntius/count.html", {"campaign": campaign, "name": name, "count": getattr(campaign, f"get_{name}_count")()})
@@ -0,0 +1,72 @@
+import multiprocessing as mp
+import time
+
+from django.core.management import BaseCommand
+
+from nuntius.utils.processes import TokenBucket
+
+
+def take_tokens(bucket, start_event, tokens, batch_size):
+    start_event.wait()
+    for _ in range(tokens // batch_size):
+        bucket.take(batch_size)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the contention of sender processes on the token bucket, when they take "
+        "tokens one by one or by batches"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-p",
+            "--processes",
+            dest="processes",
+            default=32,
+            type=int,
+            help="The number of processes taking tokens concurrently",
+        )
+        parser.add_argument(
+            "-t",
+            "--tokens",
+            dest="tokens",
+            default=10000,
+            type=int,
+            help="The number of tokens taken by each process",
+        )
+        parser.add_argument(
+            "-b",
+            "--batch_sizes",
+            dest="batch_sizes",
+            default="1,10,100",
+            type=lambda value: [int(size) for size in value.split(",")],
+            help="The comma-separated list of numbers of tokens taken at once",
+        )
+
+    def handle(self, *args, processes=None, tokens=None, batch_sizes=None, **options):
+        for batch_size in batch_sizes:
+            # the rate is high enough for the bucket to never be empty: only the
+            # synchronization between processes is measured
+            bucket = TokenBucket(max=processes * tokens, rate=1e12)
+            start_event = mp.Event()
+            workers = [
+                mp.Process(
+                    target=take_tokens, args=(bucket, start_event, tokens, batch_size)
+                )
+                for _ in range(processes)
+            ]
+            for worker in workers:
+                worker.start()
+
+            start = time.perf_counter()
+            start_event.set()
+            for worker in workers:
+                worker.join()
+            duration = time.perf_counter() - start
+
+            total = processes * (tokens // batch_size) * batch_size
+            self.stdout.write(
+                f"Batch size {batch_size}: {processes} processes took {total} tokens "
+                f"in {duration:.2f}s ({total / duration:.0f} tokens/s)"
+            )
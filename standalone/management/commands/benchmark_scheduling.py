@@ -0,0 +1,76 @@
+import multiprocessing as mp
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from nuntius.management.commands.nuntius_worker import email_campaign_manager_process
+from nuntius.models import Campaign, CampaignSentEvent
+from standalone.models import Segment
+
+
+class DiscardingQueue:
+    """Stand-in for the work queue that simply counts and drops messages"""
+
+    def __init__(self):
+        self.count = 0
+
+    def put(self, value, timeout=None):
+        self.count += 1
+
+    def close(self):
+        pass
+
+    def join_thread(self):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure how fast campaign managers schedule messages for the segment created by "
+        "fill_database, with and without batched sent event creation"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-b",
+            "--batch_sizes",
+            dest="batch_sizes",
+            default="0,1000",
+            type=lambda value: [int(size) for size in value.split(",")],
+            help="The comma-separated list of scheduling batch sizes to benchmark (0 means "
+            "one sent event creation per subscriber)",
+        )
+
+    def handle(self, *args, batch_sizes=None, **options):
+        try:
+            segment = Segment.objects.get(id="fake_emails")
+        except Segment.DoesNotExist:
+            raise CommandError(
+                "The benchmark segment does not exist, run fill_database first."
+            )
+
+        for batch_size in batch_sizes:
+            campaign = Campaign.objects.create(
+                name=f"Scheduling benchmark (batch size {batch_size})",
+                segment=segment,
+                message_subject="Benchmark",
+                message_content_text="Hello {{ email }}!",
+            )
+            queue = DiscardingQueue()
+
+            start = time.perf_counter()
+            email_campaign_manager_process(
+                campaign=campaign,
+                queue=queue,
+                quit_event=mp.Event(),
+                batch_size=batch_size,
+            )
+            duration = time.perf_counter() - start
+
+            rows = CampaignSentEvent.objects.filter(campaign=campaign).count()
+            self.stdout.write(
+                f"Batch size {batch_size}: {rows} sent events created and {queue.count} "
+                f"messages scheduled in {duration:.2f}s ({rows / duration:.0f} rows/s)"
+            )
+
+            campaign.delete()
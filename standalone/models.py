@@ -50,5 +50,9 @@ class Subscriber(BaseSubscriber):
             **super().get_subscriber_data(),
         }
 
+    @classmethod
+    def prepare_subscriber_queryset(cls, queryset):
+        return queryset.prefetch_related("segments")
+
     def __str__(self):
         return self.get_subscriber_email()
@@ -2,11 +2,19 @@ import logging
 from datetime import timedelta
 from unittest import mock
 
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
 from django.urls import reverse
 from django.utils.timezone import now
 
-from nuntius.models import AbstractSubscriber, CampaignSentEvent, CampaignSentStatusType
+from nuntius.management.commands.nuntius_worker import save_sent_event_results
+from nuntius.models import (
+    AbstractSubscriber,
+    BounceState,
+    CampaignSentEvent,
+    CampaignSentStatusType,
+)
 from standalone.models import Subscriber
 from standalone.tests.test_tracking import TrackingMixin
 
@@ -133,3 +141,112 @@ class BouncingTestCase(TrackingMixin, TestCase):
                 "INFO:nuntius.signals:event_type=bounced recipient=a@example.com",
             ],
         )
+
+    def test_successful_sendings_update_bounce_state(self):
+        first = CampaignSentEvent.objects.create(
+            email="a@example.com", result=CampaignSentStatusType.OK
+        )
+        self.post_webhook(
+            reverse("anymail:sendgrid_tracking_webhook"), self.sendgrid_payload()
+        )
+        state = BounceState.objects.get(email="a@example.com")
+        self.assertEqual(state.last_success, first.datetime)
+        self.assertEqual(len(state.bounces), 1)
+
+        # notifying the same bounce again does not count it twice
+        self.post_webhook(
+            reverse("anymail:sendgrid_tracking_webhook"), self.sendgrid_payload()
+        )
+        state.refresh_from_db()
+        self.assertEqual(len(state.bounces), 1)
+
+        second = CampaignSentEvent.objects.create(email="a@example.com")
+        save_sent_event_results(
+            [(second.id, CampaignSentStatusType.UNKNOWN, {"esp_message_id": "second"})]
+        )
+        state.refresh_from_db()
+        self.assertEqual(state.last_success, second.datetime)
+
+        # the last successful sending bounces in its turn
+        self.post_webhook(
+            reverse("anymail:sendgrid_tracking_webhook"),
+            self.sendgrid_payload(esp_message_id="second"),
+        )
+        state.refresh_from_db()
+        self.assertEqual(state.last_success, first.datetime)
+        self.assertEqual(len(state.bounces), 2)
+
+    def test_bounces_are_counted_by_sent_event(self):
+        bounced_at = now()
+        CampaignSentEvent.objects.create(
+            email="a@example.com", result=CampaignSentStatusType.OK
+        )
+        for esp_message_id in ("first", "second"):
+            CampaignSentEvent.objects.create(
+                email="a@example.com", esp_message_id=esp_message_id
+            )
+        # both messages were sent at the same time
+        CampaignSentEvent.objects.filter(email="a@example.com").update(
+            datetime=bounced_at
+        )
+
+        for esp_message_id in ("first", "second", "first"):
+            self.post_webhook(
+                reverse("anymail:sendgrid_tracking_webhook"),
+                self.sendgrid_payload(esp_message_id=esp_message_id),
+            )
+
+        state = BounceState.objects.get(email="a@example.com")
+        self.assertCountEqual(
+            [sent_event_id for sent_event_id, _ in state.bounces],
+            CampaignSentEvent.objects.filter(
+                result=CampaignSentStatusType.BOUNCED
+            ).values_list("id", flat=True),
+        )
+
+    def test_rebuild_bounce_states(self):
+        CampaignSentEvent.objects.create(
+            email="a@example.com", result=CampaignSentStatusType.OK
+        )
+        for _ in range(5):
+            CampaignSentEvent.objects.create(
+                email="a@example.com", result=CampaignSentStatusType.BOUNCED
+            )
+        CampaignSentEvent.objects.create(
+            email="b@example.com", result=CampaignSentStatusType.BOUNCED
+        )
+        CampaignSentEvent.objects.create(
+            email="c@example.com", result=CampaignSentStatusType.OK
+        )
+
+        call_command("nuntius_rebuild_bounce_states", verbosity=0)
+
+        self.assertCountEqual(
+            BounceState.objects.values_list("email", flat=True),
+            ["a@example.com", "b@example.com"],
+        )
+        a = BounceState.objects.get(email="a@example.com")
+        self.assertEqual(len(a.bounces), BounceState.max_bounces())
+        self.assertTrue(a.should_bounce(now()))
+        b = BounceState.objects.get(email="b@example.com")
+        self.assertIsNone(b.last_success)
+        self.assertTrue(b.should_bounce(now()))
+
+    def test_rebuild_bounce_states_without_upserts(self):
+        sent_event = CampaignSentEvent.objects.create(
+            email="a@example.com", result=CampaignSentStatusType.BOUNCED
+        )
+        BounceState.objects.create(email="a@example.com", last_success=now())
+
+        with mock.patch.multiple(
+            connection.features,
+            supports_update_conflicts=False,
+            supports_update_conflicts_with_target=False,
+        ):
+            call_command("nuntius_rebuild_bounce_states", verbosity=0)
+
+        state = BounceState.objects.get(email="a@example.com")
+        self.assertIsNone(state.last_success)
+        self.assertEqual(
+            state.bounces, [[sent_event.id, sent_event.datetime.timestamp()]]
+        )
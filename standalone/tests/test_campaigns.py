@@ -1,10 +1,26 @@
+import multiprocessing.connection as mpc
+import os
+import tempfile
 from datetime import timedelta
+from unittest.mock import Mock, patch
 
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
 from django.utils import timezone
 
-from nuntius.models import Campaign, PushCampaign
-from standalone.models import Segment
+from nuntius.management.commands.nuntius_worker import Command
+from nuntius.models import (
+    Campaign,
+    CampaignSentEvent,
+    CampaignSentStatusType,
+    CampaignShard,
+    PushCampaign,
+    PushCampaignSentEvent,
+    PushCampaignSentStatusType,
+)
+from nuntius.utils.wakeup import SocketWakeupListener
+from standalone.models import Segment, Subscriber
 
 
 class CampaignTestCase(TestCase):
@@ -50,6 +66,167 @@ class CampaignTestCase(TestCase):
         self.assertNotIn(past_campaign, outbox)
         self.assertNotIn(future_campaign, outbox)
 
+    def test_campaign_stats(self):
+        campaign = Campaign.objects.create(name="Test campaign")
+        for result, open_count in [
+            (CampaignSentStatusType.PENDING, 0),
+            (CampaignSentStatusType.OK, 3),
+            (CampaignSentStatusType.OK, 0),
+            (CampaignSentStatusType.BOUNCED, 0),
+        ]:
+            CampaignSentEvent.objects.create(
+                campaign=campaign,
+                email="a@example.com",
+                result=result,
+                open_count=open_count,
+            )
+        # compute statistics once so that they are then read from a single row
+        campaign.get_campaign_stats()
+
+        with self.assertNumQueries(1):
+            stats = campaign.get_stats()
+            self.assertEqual(stats, campaign.get_stats())
+
+        self.assertEqual(
+            stats,
+            {
+                "sent": 3,
+                "ok": 2,
+                "bounced": 1,
+                "complained": 0,
+                "blocked": 0,
+                "open": 3,
+                "unique_open": 1,
+                "click": 0,
+                "unique_click": 0,
+            },
+        )
+        # the getters of the admin columns read the memoized statistics
+        with self.assertNumQueries(0):
+            for name, value in stats.items():
+                self.assertEqual(getattr(campaign, f"get_{name}_count")(), value)
+
+    def test_shard_leases(self):
+        campaign = Campaign.objects.create(status=Campaign.STATUS_SENDING)
+        first, second = campaign.get_shards(count=2)
+        shards = CampaignShard.objects.filter(campaign=campaign)
+
+        self.assertEqual(len(shards.claim("worker-a", 60)), 2)
+        # shards held by another worker cannot be claimed
+        self.assertEqual(shards.claim("worker-b", 60), [])
+        # but the worker holding them can claim them again
+        self.assertEqual(len(shards.claim("worker-a", 60)), 2)
+
+        shards.filter(index=0).release("worker-a")
+        self.assertEqual([s.index for s in shards.claim("worker-b", 60)], [0])
+
+        # a lease which was not renewed in time may be taken over
+        shards.filter(index=1).update(
+            lease_expires=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(shards.renew("worker-b", 60), 1)
+        (taken_over,) = shards.filter(index=1).claim("worker-b", 60)
+        self.assertEqual(taken_over.index, 1)
+
+        # the former owner may not finish the shard anymore
+        second.lease_owner = "worker-a"
+        self.assertFalse(second.finish())
+        self.assertFalse(shards.get(index=1).finished)
+
+        self.assertFalse(shards.get(index=0).finish())
+        self.assertTrue(taken_over.finish())
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, Campaign.STATUS_SENT)
+
+    def test_shards_are_not_recreated_for_sent_campaigns(self):
+        campaign = Campaign.objects.create(status=Campaign.STATUS_SENDING)
+        (shard,) = campaign.get_shards(count=1)
+        shard.lease_owner = "worker-a"
+        CampaignShard.objects.filter(id=shard.id).update(lease_owner="worker-a")
+        self.assertTrue(shard.finish())
+
+        # another worker read the campaign before its last shard finished
+        self.assertEqual(campaign.status, Campaign.STATUS_SENDING)
+        self.assertEqual(campaign.get_shards(count=2), [])
+        self.assertFalse(CampaignShard.objects.filter(campaign=campaign).exists())
+
+    def test_claims_are_released_when_expired_leases_are_taken_over(self):
+        campaign = Campaign.objects.create(status=Campaign.STATUS_SENDING)
+        campaign.get_shards(count=2)
+        shards = CampaignShard.objects.filter(campaign=campaign)
+        shards.claim("worker-a", 60)
+        events = [
+            campaign.get_event_for_subscriber(
+                Subscriber.objects.create(
+                    email=f"{i}@example.com",
+                    subscriber_status=Subscriber.STATUS_SUBSCRIBED,
+                )
+            )
+            for i in range(4)
+        ]
+        # the senders of worker-a claimed all messages before it crashed
+        CampaignSentEvent.objects.filter(campaign=campaign).update(
+            result=CampaignSentStatusType.IN_FLIGHT,
+            claimed_at=timezone.now() - timedelta(seconds=10),
+        )
+        shards.filter(index=0).update(
+            lease_expires=timezone.now() - timedelta(seconds=1)
+        )
+
+        (taken_over,) = shards.claim("worker-b", 60)
+
+        self.assertCountEqual(
+            CampaignSentEvent.objects.filter(
+                result=CampaignSentStatusType.PENDING
+            ).values_list("id", flat=True),
+            [e.id for e in events if e.subscriber_id % 2 == taken_over.index],
+        )
+
+    def test_worker_is_woken_up_when_campaign_is_sent(self):
+        campaign = Campaign.objects.create()
+        self.client.force_login(
+            User.objects.create_superuser("admin", "admin@example.com", "password")
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "worker.sock")
+            listener = SocketWakeupListener(path)
+            self.assertEqual(mpc.wait([listener], timeout=0), [])
+
+            with patch("nuntius.app_settings.WORKER_SOCKET", path):
+                self.client.get(
+                    reverse("admin:nuntius_campaign_send", args=[campaign.pk])
+                )
+
+            self.assertEqual(mpc.wait([listener], timeout=1), [listener])
+            listener.drain()
+            self.assertEqual(mpc.wait([listener], timeout=0), [])
+            listener.close()
+
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, Campaign.STATUS_SENDING)
+
+    def test_notified_worker_wakes_up_at_start_date(self):
+        now = timezone.now()
+        Campaign.objects.create(
+            start_date=now + timedelta(days=1), status=Campaign.STATUS_WAITING
+        )
+        Campaign.objects.create(
+            start_date=now - timedelta(days=1), status=Campaign.STATUS_SENDING
+        )
+        scheduled = Campaign.objects.create(
+            start_date=now + timedelta(seconds=5), status=Campaign.STATUS_SENDING
+        )
+        self.assertEqual(Campaign.objects.next_start_date(), scheduled.start_date)
+
+        command = Command()
+        command.wakeup_listener = Mock()
+        command.next_start_dates = {"email": None}
+        self.assertGreater(command.polling_interval, 5)
+
+        command.next_start_dates["email"] = Campaign.objects.next_start_date()
+        self.assertLessEqual(command.polling_interval, 5)
+
 
 class PushCampaignTestCase(TestCase):
     def test_can_attach_segment(self):
@@ -95,3 +272,28 @@ class PushCampaignTestCase(TestCase):
         self.assertNotIn(sent_campaign, outbox)
         self.assertNotIn(past_campaign, outbox)
         self.assertNotIn(future_campaign, outbox)
+
+    def test_campaign_stats(self):
+        campaign = PushCampaign.objects.create(name="Test push campaign")
+        for result, click_count in [
+            (PushCampaignSentStatusType.PENDING, 0),
+            (PushCampaignSentStatusType.OK, 2),
+            (PushCampaignSentStatusType.ERROR, 0),
+        ]:
+            PushCampaignSentEvent.objects.create(
+                campaign=campaign, result=result, click_count=click_count
+            )
+
+        with self.assertNumQueries(1):
+            stats = campaign.get_stats()
+            self.assertEqual(stats, campaign.get_stats())
+
+        self.assertEqual(stats, {"sent": 2, "ok": 1, "ko": 1, "click": 1})
+        for name, value in stats.items():
+            self.assertEqual(getattr(campaign, f"get_{name}_count")(), value)
+
+        PushCampaignSentEvent.objects.filter(campaign=campaign).update(
+            result=PushCampaignSentStatusType.OK
+        )
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.get_stats()["ok"], 3)
@@ -0,0 +1,140 @@
+import smtplib
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase
+
+from django.core.mail import EmailMessage
+
+from nuntius.management.commands.nuntius_worker import (
+    ConnectionManager,
+    is_throttling_error,
+    send_email_message,
+)
+from nuntius.models import CampaignSentStatusType, TokenBucketState
+from nuntius.utils.processes import (
+    AdaptiveTokenBucket,
+    DatabaseTokenBucket,
+    RateLimiter,
+    TokenBucket,
+)
+
+
+class DatabaseTokenBucketTestCase(TestCase):
+    def test_tokens_are_taken_by_blocks(self):
+        bucket = DatabaseTokenBucket(max=100, rate=10, block_size=5)
+
+        with self.assertNumQueries(0):
+            bucket.take(0)
+
+        with patch("time.time", return_value=1000.0):
+            bucket.take()
+            state = TokenBucketState.objects.get(name="default")
+            self.assertEqual(state.tokens, 95)
+
+            # the next tokens are taken from the local reserve
+            with self.assertNumQueries(0):
+                for _ in range(4):
+                    bucket.take()
+
+            bucket.take(8)
+            state.refresh_from_db()
+            self.assertEqual(state.tokens, 87)
+
+    def test_wait_for_the_shared_bucket(self):
+        first_worker = DatabaseTokenBucket(max=10, rate=10, block_size=10)
+        second_worker = DatabaseTokenBucket(max=10, rate=10, block_size=10)
+
+        with patch("time.time", return_value=1000.0), patch(
+            "nuntius.utils.processes._current_time", return_value=50.0
+        ) as current_time:
+            self.assertEqual(first_worker.try_take(), 0)
+
+            # the first worker emptied the shared bucket
+            self.assertEqual(second_worker.try_take(), 1.0)
+            self.assertEqual(second_worker.try_take(), 1.0)
+            current_time.return_value = 51.0
+            self.assertEqual(second_worker.try_take(), 0)
+            self.assertEqual(TokenBucketState.objects.get().tokens, -10)
+
+        with patch("time.time", return_value=1002.0):
+            self.assertEqual(first_worker.peek(), 19)
+
+
+class TokenBucketTestCase(TestCase):
+    @patch("nuntius.utils.processes._current_time", return_value=0)
+    def test_reserve_tokens(self, current_time):
+        bucket = TokenBucket(max=10, rate=10)
+
+        self.assertEqual(bucket.try_take(6), 0)
+        self.assertEqual(bucket.try_take(6), 0.2)
+
+        with patch("time.sleep") as sleep:
+            bucket.take(6)
+            sleep.assert_called_once_with(0.2)
+            # later reservations wait for the earlier ones
+            bucket.take(2)
+            sleep.assert_called_with(0.4)
+
+        current_time.return_value = 1
+        self.assertEqual(bucket.peek(), 6)
+
+
+class AdaptiveRateTestCase(TestCase):
+    @patch("nuntius.utils.processes._current_time", return_value=0)
+    def test_aimd(self, current_time):
+        bucket = AdaptiveTokenBucket(max=10, rate=40, min_rate=8)
+
+        bucket.report_throttling()
+        self.assertEqual(bucket.current_rate(), 20)
+        # errors reported by all processes at once only count once
+        bucket.report_throttling()
+        self.assertEqual(bucket.current_rate(), 20)
+
+        for t in [1, 2, 3]:
+            current_time.return_value = t
+            bucket.report_throttling()
+        self.assertEqual(bucket.current_rate(), 8)
+
+        # one token per second more after as many successes as the current rate
+        bucket.report_success(8)
+        self.assertEqual(bucket.current_rate(), 9)
+        for _ in range(100):
+            bucket.report_success(40)
+        self.assertEqual(bucket.current_rate(), 40)
+
+    def test_throttling_errors(self):
+        self.assertTrue(is_throttling_error(smtplib.SMTPDataError(421, b"slow down")))
+        self.assertTrue(
+            is_throttling_error(smtplib.SMTPSenderRefused(454, b"later", "a@b.fr"))
+        )
+        self.assertTrue(
+            is_throttling_error(
+                smtplib.SMTPRecipientsRefused({"a@gmail.com": (421, b"rate limited")})
+            )
+        )
+        self.assertFalse(is_throttling_error(smtplib.SMTPDataError(550, b"no")))
+        self.assertFalse(is_throttling_error(ValueError()))
+
+    @patch("nuntius.management.commands.nuntius_worker.mail.get_connection")
+    def test_report_back_pressure_by_domain(self, get_connection):
+        rate_limiter = MagicMock(spec=RateLimiter)
+        gmail_rate_limiter = MagicMock(spec=RateLimiter)
+        connection_manager = ConnectionManager(
+            MagicMock(is_set=lambda: False),
+            rate_limiter,
+            {"gmail.com": gmail_rate_limiter},
+        )
+        backend = get_connection.return_value
+
+        send_email_message(connection_manager, EmailMessage(to=["a@example.com"]))
+        rate_limiter.report_success.assert_called_once_with()
+
+        backend.send_messages.side_effect = smtplib.SMTPRecipientsRefused(
+            {"b@gmail.com": (421, b"rate limited")}
+        )
+        result, _ = send_email_message(
+            connection_manager, EmailMessage(to=["b@gmail.com"])
+        )
+        self.assertEqual(result, CampaignSentStatusType.BLOCKED)
+        gmail_rate_limiter.report_throttling.assert_called_once_with()
+        rate_limiter.report_throttling.assert_not_called()
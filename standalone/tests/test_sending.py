@@ -1,24 +1,54 @@
 import multiprocessing
+import smtplib
+from io import BytesIO
 from queue import Queue, Empty
+from email.generator import Generator
+from unittest.mock import MagicMock, patch
+
+from anymail.backends.test import EmailBackend as AnymailTestBackend
+from anymail.exceptions import AnymailAPIError
 
 from django.core import mail
-from django.core.mail import EmailMessage
-from django.test import TestCase
+from django.core.mail import EmailMessage, EmailMultiAlternatives
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 
 from nuntius.management.commands import nuntius_worker
-from nuntius.management.commands.nuntius_worker import mailer_process
-from nuntius.messages import message_for_event
-from nuntius.models import Campaign, BaseSubscriber
+from nuntius.management.commands.nuntius_worker import (
+    async_mailer_process,
+    CampaignDispatcher,
+    ConnectionPool,
+    DomainScheduler,
+    mailer_process,
+    MessageRenderer,
+    PackedWorkItem,
+    RenderJob,
+    ResultAccumulator,
+    SharedMessage,
+    unpack_work_item,
+)
+from nuntius.messages import RenderCache, message_for_event
+from nuntius.models import (
+    Campaign,
+    BaseSubscriber,
+    CampaignSentEvent,
+    CampaignSentStatusType,
+    CampaignStats,
+)
+from nuntius.utils.processes import GracefulExit, RateLimiter
+from nuntius.utils.mime import MessageSkeleton, PreEncodedMessage
+from nuntius.utils.smtp import PipeliningSMTP
 from standalone.models import Segment, Subscriber
 
 
-def run_campaign_manager_process_sync(campaign):
+def run_campaign_manager_process_sync(campaign, **kwargs):
     queue = Queue()
     queue.close = lambda: None
     queue.join_thread = lambda: None
 
     nuntius_worker.email_campaign_manager_process(
-        campaign=campaign, queue=queue, quit_event=multiprocessing.Event()
+        campaign=campaign, queue=queue, quit_event=multiprocessing.Event(), **kwargs
     )
     message_event_tuples = []
     while not queue.empty():
@@ -36,11 +66,13 @@ def run_sender_process_sync(message_event_tuples, error_channel=None):
 
     original_get = queue.get
 
-    def get(timeout):
+    def get(block=True, timeout=None):
         try:
             return original_get(block=False)
         except Empty:
-            quit_event.set()
+            # only quit once the sender waits for new messages
+            if block:
+                quit_event.set()
             raise
 
     queue.get = get
@@ -116,6 +148,211 @@ class MessageTestCase(TestCase):
             len(messages),
         )
 
+    def test_batched_scheduling(self):
+        segment = Segment.objects.get(id="all_status")
+        campaign = Campaign.objects.create(segment=segment, message_content_text="test")
+
+        subscriber = Subscriber.objects.get(email="a@example.com")
+        existing_event = campaign.get_event_for_subscriber(subscriber)
+        sent_event = campaign.get_event_for_subscriber(
+            Subscriber.objects.get(email="b@example.com")
+        )
+        sent_event.result = CampaignSentStatusType.OK
+        sent_event.save()
+
+        message_event_tuples = run_campaign_manager_process_sync(campaign, batch_size=2)
+
+        self.assertCountEqual(
+            [m.to[0] for m, _ in message_event_tuples],
+            segment.get_subscribers_queryset()
+            .filter(subscriber_status=BaseSubscriber.STATUS_SUBSCRIBED)
+            .exclude(email="b@example.com")
+            .values_list("email", flat=True),
+        )
+        self.assertIn(
+            existing_event.id, [event_id for _, event_id in message_event_tuples]
+        )
+        self.assertEqual(
+            CampaignSentEvent.objects.filter(
+                campaign=campaign, result=CampaignSentStatusType.PENDING
+            ).count(),
+            len(message_event_tuples),
+        )
+
+    def test_subscriber_data_is_prefetched(self):
+        segment = Segment.objects.get(id="all_status")
+        campaign = Campaign.objects.create(
+            segment=segment, message_content_text="{{ email }} {{ segments }}"
+        )
+
+        with CaptureQueriesContext(connection) as context:
+            message_event_tuples = run_campaign_manager_process_sync(campaign)
+
+        self.assertEqual(
+            sorted(m.body for m, _ in message_event_tuples),
+            [
+                "a@example.com all_status, subscribed",
+                "b@example.com all_status, subscribed",
+            ],
+        )
+        # segments of all subscribers are fetched with a single query
+        self.assertEqual(
+            len(
+                [
+                    query
+                    for query in context.captured_queries
+                    if 'FROM "standalone_segment"' in query["sql"]
+                ]
+            ),
+            1,
+        )
+
+    def test_batched_and_unbatched_scheduling_are_equivalent(self):
+        segment = Segment.objects.get(id="all_status")
+        results = []
+
+        for batch_size in [0, 1, 1000]:
+            campaign = Campaign.objects.create(
+                segment=segment, message_content_text="Hello {{ email }}"
+            )
+            results.append(
+                sorted(
+                    (m.to[0], m.body)
+                    for m, _ in run_campaign_manager_process_sync(
+                        campaign, batch_size=batch_size
+                    )
+                )
+            )
+
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0], results[2])
+
+    def test_checkpoint_is_saved_after_each_page(self):
+        segment = Segment.objects.get(id="subscribed")
+        campaign = Campaign.objects.create(segment=segment, message_content_text="test")
+        first, second = segment.get_subscribers_queryset().order_by("pk")[:2]
+
+        queue = Queue()
+        queue.close = lambda: None
+        queue.join_thread = lambda: None
+        quit_event = multiprocessing.Event()
+        original_put = queue.put
+
+        def put(item, block=True, timeout=None):
+            original_put(item)
+            # stop the manager after the first message
+            quit_event.set()
+
+        queue.put = put
+
+        nuntius_worker.email_campaign_manager_process(
+            campaign=campaign, queue=queue, quit_event=quit_event, batch_size=1
+        )
+
+        self.assertEqual(queue.qsize(), 1)
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, Campaign.STATUS_WAITING)
+        self.assertEqual(campaign.shards.get().last_scheduled_pk, str(first.pk))
+
+        # the manager resumes after the checkpoint, sending again the in flight message
+        message_event_tuples = run_campaign_manager_process_sync(campaign, batch_size=1)
+        self.assertEqual(
+            [m.to[0] for m, _ in message_event_tuples], [first.email, second.email]
+        )
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, Campaign.STATUS_SENT)
+        self.assertFalse(campaign.shards.exists())
+
+    def test_resume_from_checkpoint(self):
+        subscribers = [
+            Subscriber.objects.create(
+                email=f"resume-{i}@example.com",
+                subscriber_status=BaseSubscriber.STATUS_SUBSCRIBED,
+            )
+            for i in range(4)
+        ]
+        segment = Segment.objects.create(id="resume")
+        for subscriber in subscribers:
+            subscriber.segments.add(segment)
+        campaign = Campaign.objects.create(segment=segment, message_content_text="test")
+
+        sent_event = campaign.get_event_for_subscriber(subscribers[0])
+        sent_event.result = CampaignSentStatusType.OK
+        sent_event.save()
+        in_flight_event = campaign.get_event_for_subscriber(subscribers[1])
+        # subscribers before the checkpoint without sent event are not scanned again
+        (shard,) = campaign.get_shards(count=1)
+        shard.last_scheduled_pk = str(subscribers[2].pk)
+        shard.save()
+
+        message_event_tuples = run_campaign_manager_process_sync(campaign, batch_size=2)
+
+        self.assertEqual(
+            [m.to[0] for m, _ in message_event_tuples],
+            [subscribers[1].email, subscribers[3].email],
+        )
+        self.assertEqual(message_event_tuples[0][1], in_flight_event.id)
+
+    def test_sharded_scheduling(self):
+        segment = Segment.objects.get(id="subscribed")
+        campaign = Campaign.objects.create(segment=segment, message_content_text="test")
+        shards = campaign.get_shards(count=2)
+        self.assertEqual([shard.index for shard in shards], [0, 1])
+
+        emails = []
+        statuses = []
+        for shard in shards:
+            messages = run_campaign_manager_process_sync(campaign, shard=shard)
+            emails.append({m.to[0] for m, _ in messages})
+            campaign.refresh_from_db()
+            statuses.append(campaign.status)
+
+        # the campaign is only sent once every shard has finished
+        self.assertNotEqual(statuses[0], Campaign.STATUS_SENT)
+        self.assertEqual(statuses[1], Campaign.STATUS_SENT)
+        self.assertFalse(emails[0] & emails[1])
+        self.assertCountEqual(
+            emails[0] | emails[1],
+            segment.get_subscribers_queryset()
+            .filter(subscriber_status=BaseSubscriber.STATUS_SUBSCRIBED)
+            .values_list("email", flat=True),
+        )
+
+    def test_unsharded_scheduling_of_split_campaign(self):
+        segment = Segment.objects.get(id="subscribed")
+        campaign = Campaign.objects.create(segment=segment, message_content_text="test")
+        first, second = campaign.get_shards(count=2)
+        first_emails = {
+            m.to[0] for m, _ in run_campaign_manager_process_sync(campaign, shard=first)
+        }
+
+        # without shard, the remaining shards are scheduled one after the other
+        other_emails = {m.to[0] for m, _ in run_campaign_manager_process_sync(campaign)}
+
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, Campaign.STATUS_SENT)
+        self.assertFalse(first_emails & other_emails)
+        self.assertCountEqual(
+            first_emails | other_emails,
+            segment.get_subscribers_queryset()
+            .filter(subscriber_status=BaseSubscriber.STATUS_SUBSCRIBED)
+            .values_list("email", flat=True),
+        )
+
+    def test_campaign_is_sent_when_all_shards_are_finished(self):
+        campaign = Campaign.objects.create(message_content_text="test")
+        first, second = campaign.get_shards(count=2)
+
+        self.assertFalse(first.finish())
+        campaign.refresh_from_db()
+        self.assertNotEqual(campaign.status, Campaign.STATUS_SENT)
+        self.assertTrue(campaign.shards.get(index=0).finished)
+
+        self.assertTrue(second.finish())
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, Campaign.STATUS_SENT)
+        self.assertFalse(campaign.shards.exists())
+
 
 class SendingTestCase(TestCase):
     fixtures = ["subscribers.json"]
@@ -143,6 +380,221 @@ class SendingTestCase(TestCase):
         self.assertEqual(len(events), len(mail.outbox))
         self.assertEqual(len(events), campaign.get_sent_count())
 
+    def test_messages_queued_twice_are_sent_once(self):
+        segment = Segment.objects.get(id="subscribed")
+        campaign = Campaign.objects.create(
+            segment=segment,
+            message_from_email="test@example.com",
+            message_subject="Subject",
+            message_content_text="test {{email}} test",
+        )
+        events = [
+            campaign.get_event_for_subscriber(s)
+            for s in segment.get_subscribers_queryset()
+        ]
+        items = [(message_for_event(e), e.id) for e in events]
+
+        # e.g. by the previous holder of the lease of a shard and by the new one
+        run_sender_process_sync(items + items)
+
+        self.assertEqual(len(events), len(mail.outbox))
+        self.assertEqual(len(events), campaign.get_sent_count())
+
+    def test_claimed_messages_are_released_on_graceful_exit(self):
+        segment = Segment.objects.get(id="subscribed")
+        campaign = Campaign.objects.create(
+            segment=segment,
+            message_from_email="test@example.com",
+            message_subject="Subject",
+            message_content_text="test {{email}} test",
+        )
+        events = [
+            campaign.get_event_for_subscriber(s)
+            for s in segment.get_subscribers_queryset()
+        ]
+
+        # asked to quit while sending the first message
+        with patch.object(
+            nuntius_worker, "send_email_message", side_effect=GracefulExit
+        ):
+            run_sender_process_sync([(message_for_event(e), e.id) for e in events])
+
+        self.assertEqual(
+            CampaignSentEvent.objects.filter(
+                campaign=campaign, result=CampaignSentStatusType.PENDING
+            ).count(),
+            len(events),
+        )
+
+    def test_send_emails_by_batches(self):
+        campaign = Campaign.objects.create(
+            message_from_email="test@example.com",
+            message_subject="Subject",
+            message_content_text="test {{email}} test",
+        )
+        events = [
+            campaign.get_event_for_subscriber(s)
+            for s in Subscriber.objects.order_by("pk")
+        ]
+        original_post_to_esp = AnymailTestBackend.post_to_esp
+        original_send_messages = AnymailTestBackend.send_messages
+        failures = []
+        batches = []
+
+        def post_to_esp(backend, payload, message):
+            # the message for b@example.com fails the first time it is sent
+            if message.to[0] == "b@example.com" and not failures:
+                failures.append(message)
+                raise AnymailAPIError("Temporary failure")
+            return original_post_to_esp(backend, payload, message)
+
+        def send_messages(backend, messages):
+            batches.append(len(messages))
+            return original_send_messages(backend, messages)
+
+        with patch(
+            "nuntius.app_settings.EMAIL_BACKEND", "anymail.backends.test.EmailBackend"
+        ), patch("nuntius.app_settings.SENDING_BATCH_SIZE", 10), patch.object(
+            AnymailTestBackend, "post_to_esp", post_to_esp
+        ), patch.object(
+            AnymailTestBackend, "send_messages", send_messages
+        ):
+            run_sender_process_sync([(message_for_event(e), e.id) for e in events])
+
+        # all messages are sent with a single call, except the one failing which is sent
+        # again on its own
+        self.assertEqual(batches, [len(events), 1])
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(
+            [m.to[0] for m in mail.outbox],
+            [e.email for e in events if e.email != "b@example.com"] + ["b@example.com"],
+        )
+        for event in events:
+            event.refresh_from_db()
+            self.assertEqual(event.result, CampaignSentStatusType.UNKNOWN)
+            self.assertIsNotNone(event.esp_message_id)
+
+    def test_render_messages_in_senders(self):
+        segment = Segment.objects.get(id="subscribed")
+        campaign = Campaign.objects.create(
+            segment=segment,
+            message_from_email="test@example.com",
+            message_subject="Subject",
+            message_content_text="test {{email}} test",
+        )
+
+        jobs = run_campaign_manager_process_sync(campaign, render_job_size=1)
+        self.assertEqual(len(jobs), segment.get_subscribers_queryset().count())
+        self.assertTrue(all(isinstance(job, RenderJob) for job in jobs))
+
+        run_sender_process_sync(jobs)
+
+        self.assertCountEqual(
+            [(m.to[0], m.body) for m in mail.outbox],
+            [
+                (s.email, f"test {s.email} test")
+                for s in segment.get_subscribers_queryset()
+            ],
+        )
+        self.assertEqual(campaign.get_sent_count(), len(jobs))
+
+    def test_render_messages_from_shared_render_cache(self):
+        segment = Segment.objects.get(id="subscribed")
+        campaign = Campaign.objects.create(
+            segment=segment,
+            message_from_email="test@example.com",
+            message_reply_to_email="reply@example.com",
+            message_subject="Subject",
+            message_content_html='<html><body><p>Hello {{ email }}</p><a href="https://example.com">Link</a></body></html>',
+            message_content_text="test {{email}} test",
+        )
+
+        segments = []
+        publish = RenderCache.publish
+
+        def publish_and_keep(render_cache):
+            segments.append(publish(render_cache))
+            return segments[-1]
+
+        with patch.object(RenderCache, "publish", publish_and_keep), patch(
+            "multiprocessing.shared_memory.SharedMemory.unlink"
+        ):
+            items = run_campaign_manager_process_sync(
+                campaign, shared_render_cache=True
+            )
+        self.assertEqual(len(items), segment.get_subscribers_queryset().count())
+        self.assertTrue(all(isinstance(item, SharedMessage) for item in items))
+        # the static HTML is not copied in the items
+        self.assertFalse(any("<" in "".join(item.substitutions) for item in items))
+
+        def expected(sent_event_id):
+            message = message_for_event(CampaignSentEvent.objects.get(id=sent_event_id))
+            return message.subject, message.body, message.alternatives, message.reply_to
+
+        def rendered(message):
+            return message.subject, message.body, message.alternatives, message.reply_to
+
+        # the segment is registered only once with the resource tracker of this
+        # process, which acts as both the campaign manager and the sender
+        patcher = patch.object(nuntius_worker, "resource_tracker")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        renderer = MessageRenderer()
+        for item in items:
+            ((message, sent_event_id),) = renderer.messages_for(item, None)
+            self.assertEqual(rendered(message), expected(sent_event_id))
+            # only the messages assembled from the render cache are pre-encoded
+            self.assertIsInstance(message, PreEncodedMessage)
+            self.assertNotIsInstance(
+                message_for_event(CampaignSentEvent.objects.get(id=sent_event_id)),
+                PreEncodedMessage,
+            )
+
+        # messages whose sent event has already been claimed are not sent again
+        self.assertEqual(renderer.messages_for(items[0], None), [])
+        CampaignSentEvent.objects.filter(id=items[0].sent_event_id).update(
+            result=CampaignSentStatusType.PENDING
+        )
+
+        # senders which did not attach the segment before it was unlinked load the campaign
+        segments[0].unlink()
+        renderer = MessageRenderer()
+        ((message, sent_event_id),) = renderer.messages_for(items[0], None)
+        self.assertEqual(rendered(message), expected(sent_event_id))
+
+    def test_results_are_saved_by_batches(self):
+        campaign = Campaign.objects.create(message_content_text="test")
+        events = [
+            campaign.get_event_for_subscriber(s)
+            for s in Subscriber.objects.order_by("pk")[:3]
+        ]
+        campaign.get_campaign_stats()
+        results = ResultAccumulator(max_size=2, max_delay=3600)
+
+        def pending_count():
+            return CampaignSentEvent.objects.filter(
+                campaign=campaign, result=CampaignSentStatusType.PENDING
+            ).count()
+
+        results.add(events[0].id, CampaignSentStatusType.UNKNOWN, esp_message_id="a")
+        self.assertEqual(pending_count(), 3)
+
+        # a transaction with a SELECT, one UPDATE by result or for the events with an
+        # esp_message_id, one for the statistics and an UPDATE of the bounce states
+        with self.assertNumQueries(7):
+            results.add(events[1].id, CampaignSentStatusType.BLOCKED)
+        self.assertEqual(pending_count(), 1)
+
+        results.add(events[2].id, CampaignSentStatusType.UNKNOWN)
+        results.flush()
+        self.assertEqual(pending_count(), 0)
+
+        events[0].refresh_from_db()
+        self.assertEqual(events[0].esp_message_id, "a")
+        self.assertEqual(campaign.get_stats()["sent"], 3)
+        self.assertEqual(campaign.get_stats()["blocked"], 1)
+
     def test_send_only_once(self):
         segment = Segment.objects.get(id="subscribed")
         campaign = Campaign.objects.create(segment=segment, message_content_text="test")
@@ -157,3 +609,413 @@ class SendingTestCase(TestCase):
 
         new_messages_tuple = run_campaign_manager_process_sync(campaign)
         self.assertEqual(len(new_messages_tuple), 0)
+
+    def test_campaign_stats_are_updated_by_the_worker(self):
+        segment = Segment.objects.get(id="subscribed")
+        campaign = Campaign.objects.create(segment=segment, message_content_text="test")
+        message_events_tuple = run_campaign_manager_process_sync(campaign)
+
+        stats = CampaignStats.objects.get(campaign=campaign)
+        self.assertEqual(stats.sent_count, 0)
+
+        run_sender_process_sync(message_events_tuple)
+        # sending the same messages again should not count them twice
+        run_sender_process_sync(message_events_tuple)
+
+        stats.refresh_from_db()
+        self.assertEqual(stats.sent_count, len(message_events_tuple))
+        self.assertEqual(
+            stats.sent_count,
+            CampaignSentEvent.objects.filter(campaign=campaign)
+            .exclude(result=CampaignSentStatusType.PENDING)
+            .count(),
+        )
+
+
+class AsyncSendingTestCase(TransactionTestCase):
+    # database queries of the async sender are made from another thread, which cannot
+    # see the data of the transaction of a TestCase
+    fixtures = ["subscribers.json"]
+
+    def test_send_emails_concurrently(self):
+        campaign = Campaign.objects.create(
+            message_from_email="test@example.com",
+            message_subject="Subject",
+            message_content_text="test {{email}} test",
+        )
+        events = [
+            campaign.get_event_for_subscriber(s)
+            for s in Subscriber.objects.filter(
+                subscriber_status=BaseSubscriber.STATUS_SUBSCRIBED
+            )
+        ]
+        campaign.get_campaign_stats()
+
+        queue = Queue()
+        for e in events:
+            queue.put((message_for_event(e), e.id))
+        quit_event = multiprocessing.Event()
+        original_get = queue.get
+
+        def get(timeout):
+            try:
+                return original_get(timeout=0.01)
+            except Empty:
+                # sessions quit before sending the messages they hold, so only quit
+                # once all messages have been sent
+                if len(mail.outbox) == len(events):
+                    quit_event.set()
+                raise
+
+        queue.get = get
+
+        async_mailer_process(
+            queue=queue,
+            error_channel="SHOULD NOT BE USED",
+            quit_event=quit_event,
+            concurrency=3,
+        )
+
+        self.assertCountEqual([m.to[0] for m in mail.outbox], [e.email for e in events])
+        self.assertEqual(
+            CampaignSentEvent.objects.filter(
+                campaign=campaign, result=CampaignSentStatusType.UNKNOWN
+            ).count(),
+            len(events),
+        )
+        self.assertEqual(campaign.get_sent_count(), len(events))
+
+    def test_claimed_messages_are_released_when_sessions_quit(self):
+        campaign = Campaign.objects.create(
+            message_from_email="test@example.com",
+            message_subject="Subject",
+            message_content_text="test {{email}} test",
+        )
+        events = [
+            campaign.get_event_for_subscriber(s)
+            for s in Subscriber.objects.filter(
+                subscriber_status=BaseSubscriber.STATUS_SUBSCRIBED
+            )
+        ]
+        queue = Queue()
+        for e in events:
+            queue.put((message_for_event(e), e.id))
+
+        # each session is asked to quit while sending its first message
+        with patch.object(
+            nuntius_worker, "send_email_message", side_effect=GracefulExit
+        ):
+            async_mailer_process(
+                queue=queue,
+                error_channel="SHOULD NOT BE USED",
+                quit_event=multiprocessing.Event(),
+                concurrency=2,
+            )
+
+        self.assertFalse(
+            CampaignSentEvent.objects.filter(
+                campaign=campaign, result=CampaignSentStatusType.IN_FLIGHT
+            ).exists()
+        )
+
+
+class ThrottledRateLimiter(RateLimiter):
+    def __init__(self, wait):
+        self.wait = wait
+
+    def try_take(self, n=1):
+        return self.wait
+
+
+class DomainSchedulerTestCase(TestCase):
+    def message_to(self, email):
+        return EmailMessage(to=[email]), email
+
+    def test_throttled_domain_does_not_hold_back_others(self):
+        gmail = ThrottledRateLimiter(0.5)
+        scheduler = DomainScheduler({"gmail.com": gmail, "orange.fr": RateLimiter()})
+        scheduler.extend(
+            self.message_to(email)
+            for email in [
+                "a@gmail.com",
+                "b@orange.fr",
+                "c@Gmail.com",
+                "d@example.com",
+                "e@orange.fr",
+                "f@example.com",
+            ]
+        )
+        self.assertEqual(len(scheduler), 6)
+
+        sent = []
+        item, wait = scheduler.pop()
+        while item is not None:
+            sent.append(item[1])
+            item, wait = scheduler.pop()
+
+        # domains take turns, in the order of their first message
+        self.assertEqual(
+            sent, ["b@orange.fr", "d@example.com", "e@orange.fr", "f@example.com"]
+        )
+        self.assertEqual(wait, 0.5)
+        self.assertEqual(len(scheduler), 2)
+
+        gmail.wait = 0
+        self.assertEqual(scheduler.pop()[0][1], "a@gmail.com")
+        self.assertEqual(scheduler.pop()[0][1], "c@Gmail.com")
+        self.assertEqual(scheduler.pop(), (None, None))
+
+
+class ConnectionPoolTestCase(TestCase):
+    def smtp_backend(self, noop_code=250):
+        backend = MagicMock()
+        backend.connection = MagicMock(spec=smtplib.SMTP)
+        backend.connection.noop.return_value = (noop_code, b"OK")
+        return backend
+
+    @patch("nuntius.app_settings.MAX_MESSAGES_PER_CONNECTION", 100)
+    def test_connections_are_reset_at_staggered_counts(self):
+        with patch.object(
+            nuntius_worker.mail,
+            "get_connection",
+            side_effect=lambda backend: self.smtp_backend(),
+        ):
+            connections = [ConnectionPool().acquire() for _ in range(50)]
+
+        limits = {connection.messages_left for connection in connections}
+        self.assertTrue(all(80 <= limit <= 100 for limit in limits))
+        self.assertGreater(len(limits), 1)
+
+        pool = ConnectionPool()
+        connection = connections[0]
+        pool.release(connection)
+        self.assertIs(pool.acquire(), connection)
+
+        connection.messages_left = 0
+        pool.release(connection)
+        connection.backend.close.assert_called_once_with()
+
+    def test_idle_connections_are_checked(self):
+        backends = [self.smtp_backend(noop_code=421), self.smtp_backend()]
+        pool = ConnectionPool()
+
+        with patch.object(
+            nuntius_worker.mail, "get_connection", side_effect=backends
+        ), patch("nuntius.app_settings.SMTP_HEALTH_CHECK_INTERVAL", 0):
+            pool.release(pool.acquire())
+            # the server closed the first connection while it was idle
+            connection = pool.acquire()
+
+        self.assertIs(connection.backend, backends[1])
+        backends[0].connection.noop.assert_called_once_with()
+        backends[0].close.assert_called_once_with()
+
+
+class PipeliningTestCase(TestCase):
+    def smtp_connection(self, replies, **features):
+        connection = PipeliningSMTP()
+        connection.ehlo_resp = b"localhost"
+        connection.esmtp_features = {"pipelining": "", **features}
+        connection.sock = MagicMock()
+        connection.file = BytesIO(replies)
+        return connection
+
+    def test_commands_are_pipelined(self):
+        connection = self.smtp_connection(
+            b"250 OK\r\n250 OK\r\n550 Unknown user\r\n354 Go on\r\n250 Queued\r\n"
+        )
+
+        refused = connection.sendmail(
+            "from@example.com",
+            ["a@example.com", "b@example.com"],
+            b"Subject: test\r\n\r\n.leading dot",
+        )
+
+        self.assertEqual(refused, {"b@example.com": (550, b"Unknown user")})
+        self.assertEqual(
+            [call.args[0] for call in connection.sock.sendall.call_args_list],
+            [
+                b"mail FROM:<from@example.com>\r\n"
+                b"rcpt TO:<a@example.com>\r\n"
+                b"rcpt TO:<b@example.com>\r\n"
+                b"data\r\n",
+                b"Subject: test\r\n\r\n..leading dot\r\n.\r\n",
+            ],
+        )
+
+    def test_message_size_is_declared(self):
+        connection = self.smtp_connection(
+            b"250 OK\r\n250 OK\r\n354 Go on\r\n250 Queued\r\n", size="10240000"
+        )
+
+        connection.sendmail("from@example.com", ["a@example.com"], b"test")
+
+        self.assertEqual(
+            connection.sock.sendall.call_args_list[0].args[0],
+            b"mail FROM:<from@example.com> size=4\r\n"
+            b"rcpt TO:<a@example.com>\r\n"
+            b"data\r\n",
+        )
+
+    def test_all_recipients_refused(self):
+        connection = self.smtp_connection(
+            b"250 OK\r\n550 Unknown user\r\n554 No valid recipients\r\n250 Reset\r\n"
+        )
+
+        with self.assertRaises(smtplib.SMTPRecipientsRefused):
+            connection.sendmail("from@example.com", ["a@example.com"], b"test")
+
+        self.assertEqual(
+            connection.sock.sendall.call_args_list[-1].args[0], b"rset\r\n"
+        )
+
+
+class CampaignDispatcherTestCase(TestCase):
+    def dispatcher(self, **kwargs):
+        dispatcher = CampaignDispatcher(Queue(), queue_size=0, **kwargs)
+
+        def create_queue():
+            queue = Queue()
+            queue.close = lambda: None
+            return queue
+
+        dispatcher.create_queue = create_queue
+        return dispatcher
+
+    def dispatch(self, dispatcher, count):
+        return [dispatcher.select()[0] for _ in range(count)]
+
+    def test_campaigns_are_served_in_proportion_to_priorities(self):
+        dispatcher = self.dispatcher()
+        newsletter = dispatcher.add_campaign(1, priority=1)
+        for i in range(100):
+            newsletter.put(("newsletter", i))
+        self.assertEqual(self.dispatch(dispatcher, 10), ["newsletter"] * 10)
+
+        urgent = dispatcher.add_campaign(2, priority=3)
+        for i in range(6):
+            urgent.put(("urgent", i))
+        # the campaign added later is not held back by the work items already queued
+        self.assertEqual(
+            self.dispatch(dispatcher, 8),
+            ["urgent"] * 3 + ["newsletter"] + ["urgent"] * 3 + ["newsletter"],
+        )
+
+        # render jobs weigh as many messages as they have sent events
+        urgent.put(RenderJob(2, None, list(range(6))))
+        urgent.put(RenderJob(2, None, list(range(6))))
+        self.assertEqual(self.dispatch(dispatcher, 4), [2] + ["newsletter"] * 2 + [2])
+
+    def test_strict_priority(self):
+        dispatcher = self.dispatcher(strict_priority=True)
+        newsletter = dispatcher.add_campaign(1, priority=1)
+        urgent = dispatcher.add_campaign(2, priority=2)
+        for i in range(3):
+            newsletter.put(("newsletter", i))
+            urgent.put(("urgent", i))
+
+        self.assertEqual(
+            self.dispatch(dispatcher, 6), ["urgent"] * 3 + ["newsletter"] * 3
+        )
+
+    def test_removed_campaigns_are_drained(self):
+        dispatcher = self.dispatcher()
+        queue = dispatcher.add_campaign(1, priority=1)
+        queue.put(("message", 1))
+        dispatcher.remove_campaign(1)
+
+        self.assertEqual(dispatcher.queue_sizes(), {1: 1})
+        self.assertEqual(dispatcher.select(), ("message", 1))
+        self.assertIsNone(dispatcher.select())
+        self.assertEqual(dispatcher.queue_sizes(), {})
+
+    def test_work_items_are_relayed_packed(self):
+        dispatcher = CampaignDispatcher(Queue(), queue_size=0)
+        queue = dispatcher.add_campaign(1, priority=1)
+        job = RenderJob(1, None, [1, 2, 3])
+        queue.put(job)
+
+        # the item is only available once the feeder thread of the queue has sent it
+        item = None
+        while item is None:
+            item = dispatcher.select()
+
+        self.assertIsInstance(item, PackedWorkItem)
+        self.assertEqual(item.cost, 3)
+        self.assertEqual(unpack_work_item(item), job)
+
+        dispatcher.remove_campaign(1)
+        self.assertIsNone(dispatcher.select())
+
+
+class MessageSkeletonTestCase(TestCase):
+    def setUp(self):
+        patchers = [
+            patch.object(
+                Generator,
+                "_make_boundary",
+                classmethod(lambda cls, text=None: "===============42=="),
+            )
+        ]
+        for module in ["django.core.mail.message", "nuntius.utils.mime"]:
+            patchers += [
+                patch(f"{module}.formatdate", return_value="Mon, 1 Jan 2024 00:00:00"),
+                patch(f"{module}.make_msgid", return_value="<1@test>"),
+            ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def assertSameBytes(self, fragments, substitutions, text_body, **headers):
+        html_body = "".join(
+            fragment + substitution
+            for fragment, substitution in zip(fragments, substitutions + [""])
+        )
+        skeleton = MessageSkeleton(
+            headers["subject"], headers["from_email"], headers["reply_to"], fragments
+        )
+        kwargs = {
+            **headers,
+            "body": text_body or html_body,
+            "to": ["dé@example.com"],
+            "reply_to": [headers["reply_to"]],
+        }
+        expected = EmailMultiAlternatives(**kwargs)
+        message = PreEncodedMessage(
+            **kwargs, skeleton=skeleton, substitutions=substitutions
+        )
+        for m in (expected, message):
+            if text_body:
+                m.attach_alternative(html_body, "text/html")
+            else:
+                m.content_subtype = "html"
+
+        self.assertIsNotNone(
+            skeleton.encode("dé@example.com", text_body, substitutions)
+        )
+        for linesep in ("\r\n", "\n"):
+            self.assertEqual(
+                message.message().as_bytes(linesep=linesep),
+                expected.message().as_bytes(linesep=linesep),
+            )
+
+    def test_pre_encoded_messages_are_identical_to_django_messages(self):
+        headers = {
+            "subject": "Sujet de la lettre d'information " * 3,
+            "from_email": "Expéditeur <from@example.com>",
+            "reply_to": "reply@example.com",
+        }
+        short = ["<html><body>\n<p>Bonjour ", " !</p>\n<a href='/", "'>Lien</a>\n"]
+        long = [
+            "<html><body><p>" + "Lorem ipsum é " * 100 + "</p>\r\n<p>",
+            "=</p>" + "x" * 2000 + "\n<img src='/",
+            "'>\n</body></html>",
+        ]
+
+        for fragments in (short, long):
+            for substitutions in (["Jean", "abc"], ["Jérôme \t", "a=b"]):
+                for text_body in ("", "Bonjour\r\n\r\n" + "texte " * 300):
+                    with self.subTest(fragments=fragments[0][:20]):
+                        self.assertSameBytes(
+                            fragments, substitutions, text_body, **headers
+                        )
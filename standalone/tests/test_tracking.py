@@ -6,6 +6,8 @@ from html import unescape
 from unittest.mock import patch
 from urllib.parse import quote as url_quote
 
+from django.core.management import call_command
+from django.template import Context
 from django.test import TestCase
 from django.urls import reverse
 from django.utils.html import format_html
@@ -22,9 +24,13 @@ from nuntius.models import (
     BaseSubscriber,
     PushCampaign,
     PushCampaignSentEvent,
+    CampaignStats,
+    StagedTrackingEvent,
 )
+from nuntius.utils.counters import BufferedCounterBackend
 from nuntius.utils.messages import sign_url
 from nuntius.utils.notifications import notification_for_event
+from nuntius.views import _tracked_campaigns
 from standalone.models import Subscriber
 
 EXTERNAL_LINK = "http://otherexample.com"
@@ -137,7 +143,7 @@ class TrackingMixin:
             content_type="application/json",
             HTTP_AUTHORIZATION="Basic "
             + (base64.b64encode(b"test:test").decode("utf-8")),
-            **headers
+            **headers,
         )
 
 
@@ -243,12 +249,171 @@ class BounceTestCase(TrackingMixin, TestCase):
         c.refresh_from_db()
         self.assertEqual(c.result, CampaignSentStatusType.BOUNCED)
 
+    def test_campaign_stats_are_updated_by_webhooks(self):
+        campaign = Campaign.objects.create()
+        subscriber = Subscriber.objects.get(email="a@example.com")
+
+        c = campaign.get_event_for_subscriber(subscriber)
+        c.result = CampaignSentStatusType.UNKNOWN
+        c.esp_message_id = ESP_MESSAGE_ID
+        c.save()
+        stats = CampaignStats.rebuild(campaign)
+        self.assertEqual((stats.sent_count, stats.bounced_count), (1, 0))
+
+        with self.assertLogs("nuntius", logging.INFO):
+            self.post_webhook(
+                reverse("anymail:sendgrid_tracking_webhook"), self.sendgrid_payload()
+            )
+
+        stats.refresh_from_db()
+        self.assertEqual((stats.sent_count, stats.bounced_count), (1, 1))
+
+        CampaignStats.objects.filter(campaign=campaign).update(bounced_count=12)
+        call_command("nuntius_rebuild_campaign_stats", campaign.id)
+        stats.refresh_from_db()
+        self.assertEqual((stats.sent_count, stats.bounced_count), (1, 1))
+
+    def test_webhook_queries_for_known_message(self):
+        campaign = Campaign.objects.create()
+        c = campaign.get_event_for_subscriber(
+            Subscriber.objects.get(email="a@example.com")
+        )
+        c.result = CampaignSentStatusType.UNKNOWN
+        c.esp_message_id = ESP_MESSAGE_ID
+        c.save()
+        payload = json.dumps(
+            [{"email": "a@example.com", "event": "open", "anymail_id": ESP_MESSAGE_ID}]
+        )
+
+        # a savepoint, a SELECT of the sent event, its UPDATE, the UPDATE of the
+        # campaign statistics and the release of the savepoint, but no lookup of the
+        # subscriber
+        with self.assertNumQueries(5):
+            self.post_webhook(reverse("anymail:sendgrid_tracking_webhook"), payload)
+
+        c.refresh_from_db()
+        self.assertEqual(c.open_count, 1)
+
+        payload = {
+            "Type": "Notification",
+            "MessageId": ESP_MESSAGE_ID,
+            "Message": json.dumps(
+                {
+                    "notificationType": "Send",
+                    "mail": {
+                        "messageId": ESP_MESSAGE_ID,
+                        "destination": ["a@example.com"],
+                    },
+                }
+            ),
+        }
+
+        # the same queries, and a single conditional UPDATE of the bounce state for a
+        # successful sending
+        with self.assertNumQueries(6):
+            self.post_webhook(
+                reverse("anymail:amazon_ses_tracking_webhook"),
+                payload,
+                HTTP_X_AMZ_SNS_MESSAGE_ID=ESP_MESSAGE_ID,
+                HTTP_X_AMZ_SNS_MESSAGE_TYPE="Notification",
+            )
+
+        c.refresh_from_db()
+        self.assertEqual(c.result, CampaignSentStatusType.OK)
+
+    def test_staged_tracking_events(self):
+        campaign = Campaign.objects.create()
+        sent_events = []
+        for email in ("a@example.com", "b@example.com"):
+            c = campaign.get_event_for_subscriber(Subscriber.objects.get(email=email))
+            c.result = CampaignSentStatusType.UNKNOWN
+            c.esp_message_id = f"id-{email}"
+            c.save()
+            sent_events.append(c)
+        stats = CampaignStats.rebuild(campaign)
+        payload = json.dumps(
+            [
+                {
+                    "email": "a@example.com",
+                    "event": "open",
+                    "anymail_id": "id-a@example.com",
+                },
+                {
+                    "email": "b@example.com",
+                    "event": "open",
+                    "anymail_id": "id-b@example.com",
+                },
+                {
+                    "email": "a@example.com",
+                    "event": "open",
+                    "anymail_id": "id-a@example.com",
+                },
+                {
+                    "email": "b@example.com",
+                    "event": "bounce",
+                    "anymail_id": "id-b@example.com",
+                },
+                {"email": "a@example.com", "event": "bounce", "anymail_id": "other-id"},
+            ]
+        )
+
+        with patch("nuntius.app_settings.STAGED_TRACKING_EVENTS", new=True):
+            with self.assertLogs("nuntius", logging.INFO):
+                self.post_webhook(reverse("anymail:sendgrid_tracking_webhook"), payload)
+
+        self.assertEqual(StagedTrackingEvent.objects.count(), 5)
+        stats.refresh_from_db()
+        self.assertEqual((stats.open_count, stats.bounced_count), (0, 0))
+
+        call_command("nuntius_apply_tracking_events", "--once")
+
+        self.assertFalse(StagedTrackingEvent.objects.exists())
+        for c in sent_events:
+            c.refresh_from_db()
+        self.assertEqual(
+            [(c.result, c.open_count) for c in sent_events],
+            [
+                (CampaignSentStatusType.UNKNOWN, 2),
+                (CampaignSentStatusType.BOUNCED, 1),
+            ],
+        )
+        other_event = CampaignSentEvent.objects.get(esp_message_id="other-id")
+        self.assertEqual(
+            (other_event.result, other_event.campaign, other_event.subscriber),
+            (
+                CampaignSentStatusType.BOUNCED,
+                None,
+                Subscriber.objects.get(email="a@example.com"),
+            ),
+        )
+
+        stats.refresh_from_db()
+        self.assertEqual(
+            (stats.open_count, stats.unique_open_count, stats.bounced_count), (3, 2, 1)
+        )
+        # b@example.com never received any message successfully
+        self.assertEqual(
+            list(
+                Subscriber.objects.filter(
+                    email__in=["a@example.com", "b@example.com"]
+                ).values_list("subscriber_status", flat=True)
+            ),
+            [
+                BaseSubscriber.STATUS_SUBSCRIBED,
+                BaseSubscriber.STATUS_BOUNCED,
+            ],
+        )
+
 
 @settings_patcher
 class TrackingTestCase(TestCase):
     fixtures = ["subscribers.json"]
     maxDiff = None
 
+    def setUp(self):
+        # campaign ids are reused from one test to the other
+        _tracked_campaigns.clear()
+
     def test_open_tracking(self):
         campaign = Campaign.objects.create(
             message_content_html=HTML_MESSAGE, message_content_text="Test"
@@ -269,14 +434,24 @@ class TrackingTestCase(TestCase):
             str(message.message()),
         )
 
-        for i in range(2):
-            self.client.get(tracking_url)
+        stats = campaign.get_campaign_stats()
+
+        # the first hit sets the counter of the sent event with a conditional UPDATE,
+        # the next one increments it after that UPDATE failed, and each of them
+        # increments the campaign statistics
+        with self.assertNumQueries(5):
+            for i in range(2):
+                self.client.get(tracking_url)
+
+        stats.refresh_from_db()
+        self.assertEqual((stats.open_count, stats.unique_open_count), (2, 1))
 
         self.assertEqual(
             2,
             CampaignSentEvent.objects.get(email="a@example.com").open_count,
             campaign.get_open_count(),
         )
+        self.assertEqual(2, campaign.get_open_count())
         self.assertEqual(1, campaign.get_unique_open_count())
 
     def test_link_tracking(self):
@@ -294,6 +469,7 @@ class TrackingTestCase(TestCase):
         tracking_url = reverse(
             "nuntius_track_click",
             kwargs={
+                "campaign_id": campaign.id,
                 "tracking_id": tracking_id,
                 "signature": sign_url(campaign, EXTERNAL_LINK + encoded_tracking_query),
                 "link": url_quote(EXTERNAL_LINK + encoded_tracking_query, safe=""),
@@ -320,6 +496,109 @@ class TrackingTestCase(TestCase):
             campaign.get_click_count(),
         )
 
+    def test_links_without_campaign_id(self):
+        campaign = Campaign.objects.create(utm_name="tracked_campaign")
+        event = campaign.get_event_for_subscriber(
+            Subscriber.objects.get(email="a@example.com")
+        )
+        url = EXTERNAL_LINK + "?utm_content=link-0&utm_term="
+        kwargs = {
+            "tracking_id": event.tracking_id,
+            "signature": sign_url(campaign, url),
+            "link": url_quote(url, safe=""),
+        }
+
+        # links of messages sent before campaign ids were added to tracked links
+        res = self.client.get(reverse("nuntius_track_click", kwargs=kwargs))
+        self.assertRedirects(
+            res,
+            EXTERNAL_LINK
+            + "?utm_content=link-0&utm_campaign=tracked_campaign&utm_source=nuntius"
+            "&utm_medium=email",
+            fetch_redirect_response=False,
+        )
+
+        other_campaign = Campaign.objects.create()
+        res = self.client.get(
+            reverse(
+                "nuntius_track_click",
+                kwargs={**kwargs, "campaign_id": other_campaign.id},
+            )
+        )
+        self.assertEqual(res.status_code, 403)
+
+        event.refresh_from_db()
+        self.assertEqual(event.click_count, 1)
+
+    def test_buffered_tracking_counters(self):
+        campaign = Campaign.objects.create(
+            message_content_html=HTML_MESSAGE, message_content_text="Test"
+        )
+        subscriber = Subscriber.objects.get(email="a@example.com")
+        event = campaign.get_event_for_subscriber(subscriber)
+        other_event = campaign.get_event_for_subscriber(
+            Subscriber.objects.get(email="b@example.com")
+        )
+        url = EXTERNAL_LINK + "?utm_content=link-0&utm_term="
+        backend = BufferedCounterBackend(flush_interval=3600)
+        stats = campaign.get_campaign_stats()
+
+        with patch("nuntius.views.get_counter_backend", return_value=backend):
+            with self.assertNumQueries(0):
+                for i in range(3):
+                    self.client.get(
+                        reverse(
+                            "nuntius_track_open",
+                            kwargs={"tracking_id": event.tracking_id},
+                        )
+                    )
+                self.client.get(
+                    reverse(
+                        "nuntius_track_open",
+                        kwargs={"tracking_id": other_event.tracking_id},
+                    )
+                )
+
+            click_url = reverse(
+                "nuntius_track_click",
+                kwargs={
+                    "campaign_id": campaign.id,
+                    "tracking_id": event.tracking_id,
+                    "signature": sign_url(campaign, url),
+                    "link": url_quote(url, safe=""),
+                },
+            )
+            # the campaign is fetched to check the signature of the link, and then
+            # reused for the next clicks
+            with self.assertNumQueries(1):
+                self.client.get(click_url)
+            with self.assertNumQueries(0):
+                self.client.get(click_url)
+
+        event.refresh_from_db()
+        self.assertEqual((event.open_count, event.click_count), (0, 0))
+
+        # for each counter field: a transaction with a SELECT of the sent events, one
+        # UPDATE by distinct increment and one UPDATE of the campaign statistics
+        with self.assertNumQueries(11):
+            backend.flush()
+
+        event.refresh_from_db()
+        other_event.refresh_from_db()
+        self.assertEqual((event.open_count, event.click_count), (3, 2))
+        self.assertEqual(other_event.open_count, 1)
+
+        stats.refresh_from_db()
+        self.assertEqual(
+            (
+                stats.open_count,
+                stats.unique_open_count,
+                stats.click_count,
+                stats.unique_click_count,
+            ),
+            (4, 2, 2, 1),
+        )
+
     def test_push_click_tracking(self):
         campaign = PushCampaign.objects.create(
             notification_title="Notification",
@@ -336,6 +615,7 @@ class TrackingTestCase(TestCase):
         tracking_url = LINKS_URL + reverse(
             "nuntius_track_push_click",
             kwargs={
+                "campaign_id": campaign.id,
                 "tracking_id": tracking_id,
                 "signature": sign_url(campaign, EXTERNAL_LINK + encoded_tracking_query),
                 "link": url_quote(EXTERNAL_LINK + encoded_tracking_query, safe=""),
@@ -396,3 +676,47 @@ class TrackingTestCase(TestCase):
             + "&utm_campaign=tracked_campaign&utm_content=link-0&utm_source=nuntius&utm_medium=email",
             fetch_redirect_response=False,
         )
+
+    def test_render_plan_is_equivalent_to_full_rendering(self):
+        html = (
+            "<html><body><p>Hello {{ email }}!</p>"
+            '<a href="http://example.com/?a=1&amp;b=2">First link</a>'
+            '<a class="{{ email|upper }}" href="https://example.com/page">{{ segments }}</a>'
+            "<p>{{ unknown_variable }}</p></body></html>"
+        )
+        campaign = Campaign.objects.create(
+            message_content_html=html, message_content_text="Test"
+        )
+        subscriber = Subscriber.objects.get(email="a@example.com")
+        event = campaign.get_event_for_subscriber(subscriber)
+
+        self.assertIsNotNone(campaign.html_render_plan)
+        self.assertEqual(
+            campaign.html_render_plan.render(
+                Context(subscriber.get_subscriber_data()), event.tracking_id
+            ),
+            add_tracking_information(
+                campaign.html_template.render(
+                    Context(subscriber.get_subscriber_data())
+                ),
+                campaign,
+                event.tracking_id,
+            ),
+        )
+
+    def test_no_render_plan_for_dynamic_templates(self):
+        for html in [
+            '{% if email %}<a href="http://example.com">Link</a>{% endif %}',
+            '<a href="http://example.com/?email={{ email }}">Link</a>',
+            '<a href="{{ email }}">Link</a>',
+            "{# comment #}",
+            "{{ email|safe }}",
+        ]:
+            campaign = Campaign.objects.create(message_content_html=html)
+            self.assertIsNone(campaign.html_render_plan)
+
+        subscriber = Subscriber.objects.get(email="a@example.com")
+        event = campaign.get_event_for_subscriber(subscriber)
+        message = message_for_event(event)
+
+        self.assertIn("a@example.com", message.body)